@@ -1,10 +1,10 @@
 import streamlit as st
+import io
 import os
 import time
-import tempfile
-from audio_processor import AudioProcessor
-from speech_recognizer import SpeechRecognizer
-from groq_integration import GroqPostProcessor
+from jobs import JobManager
+from main import SpeechToTextPipeline
+from model_registry import registry
 from config import config
 
 # Set page configuration
@@ -14,87 +14,92 @@ st.set_page_config(
     layout="wide"
 )
 
-class SpeechToTextPipeline:
-    def __init__(self):
-        st.session_state.setdefault("initialized", False)
-        
-        if not st.session_state.initialized:
-            with st.spinner("Initializing audio processor..."):
-                self.audio_processor = AudioProcessor()
-            
-            with st.spinner("Initializing speech recognizer..."):
-                self.speech_recognizer = SpeechRecognizer()
-            
-            with st.spinner("Initializing Groq processor..."):
-                self.groq_processor = GroqPostProcessor()
-            
-            st.session_state.initialized = True
-            st.session_state.pipeline = self
-        else:
-            self.audio_processor = st.session_state.pipeline.audio_processor
-            self.speech_recognizer = st.session_state.pipeline.speech_recognizer
-            self.groq_processor = st.session_state.pipeline.groq_processor
-        
-    def process_audio_file(self, audio_path, use_groq_correction=True):
-        """Process audio file through the entire pipeline"""
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        
-        try:
-            # Load and preprocess audio
-            status_text.text("Loading audio...")
-            audio_array = self.audio_processor.load_audio(audio_path)
-            progress_bar.progress(20)
-            
-            status_text.text(f"Audio length: {len(audio_array)/config.SAMPLE_RATE:.2f} seconds")
-            
-            status_text.text("Preprocessing audio...")
-            audio_array = self.audio_processor.preprocess_audio(audio_array)
-            progress_bar.progress(40)
-            
-            # Chunk audio if too long
-            if len(audio_array) > config.MAX_AUDIO_LENGTH * config.SAMPLE_RATE:
-                status_text.text("Audio is too long, chunking...")
-                chunks = self.audio_processor.chunk_audio(audio_array)
-                status_text.text(f"Split into {len(chunks)} chunks")
-                status_text.text("Transcribing chunks...")
-                transcription = self.speech_recognizer.transcribe_chunks(chunks)
-            else:
-                status_text.text("Transcribing audio...")
-                transcription = self.speech_recognizer.transcribe_audio(audio_array)
-            
-            progress_bar.progress(80)
-            
-            # Post-process with Groq
-            if use_groq_correction and transcription.strip():
-                status_text.text("Post-processing with Groq...")
-                corrected_transcription = self.groq_processor.correct_transcription(transcription)
-                result = corrected_transcription
-            else:
-                result = transcription
-                
-            progress_bar.progress(100)
-            status_text.text("Processing complete!")
-            time.sleep(0.5)
-            progress_bar.empty()
-            status_text.empty()
-            
-            return result
-                
-        except Exception as e:
-            progress_bar.empty()
-            status_text.empty()
-            st.error(f"Error in processing pipeline: {str(e)}")
-            import traceback
-            st.code(traceback.format_exc())
-            return f"Error: {str(e)}"
+@st.cache_resource
+def get_job_manager():
+    """One job pool per server process, so running jobs and results survive reruns"""
+    return JobManager(max_workers=config.APP_JOB_WORKERS)
+
+def process_audio_file(job, audio_source, model_name, use_groq_correction=True, use_vad=config.VAD_ENABLED,
+                       summarize=False, pipelined=False):
+    """Run the CLI's pipeline (cache, journal, chunk plan) on an upload as a background job
+
+    The job is the pipeline's progress callback, so its progress follows the
+    run and cancelling it stops the run at the next update.
+    """
+    pipeline = SpeechToTextPipeline(use_cache=config.CACHE_ENABLED, model_name=model_name, progress=job.update)
+    try:
+        process = pipeline.process_audio_file_pipelined if pipelined else pipeline.process_audio_file
+        result = process(audio_source, use_groq_correction, use_vad, raise_errors=True)
+    finally:
+        if pipeline.stage_report:
+            job.details["stage_report"] = pipeline.stage_report
+    
+    if summarize and result.strip():
+        job.update(90, "Summarizing...")
+        job.details["summary"] = pipeline.groq_processor.summarize_text(result)
+    
+    job.update(100, "Processing complete!")
+    return result
+
+def show_job(job):
+    """Render a job's progress, or its result once finished; reruns the script while it is running"""
+    if not job.done:
+        st.progress(job.progress, text=job.message)
+        if st.button("Cancel", key=f"cancel-{job.id}"):
+            job.cancel()
+        # Poll: redraw with fresh progress shortly
+        time.sleep(0.5)
+        st.rerun()
+    
+    if job.status == "cancelled":
+        st.warning(f"Transcription of {job.name} was cancelled")
+        return
+    
+    if job.status == "error":
+        st.error(f"Error processing audio: {job.error}")
+        st.code(job.traceback)
+        return
+    
+    report = job.details.get("stage_report")
+    if report:
+        st.caption("Stage utilization: " + ", ".join(
+            f"{stage['stage']} {100 * stage['utilization']:.0f}%" for stage in report["stages"]))
+    
+    # Display results
+    st.subheader("Transcription Result")
+    st.text_area("", job.result, height=200)
+    
+    st.info(f"Processing time: {job.elapsed:.2f} seconds")
+    
+    # Download button
+    st.download_button(
+        label="Download Transcription",
+        data=job.result,
+        file_name=f"{os.path.splitext(job.name)[0]}_transcription.txt",
+        mime="text/plain"
+    )
+    
+    summary = job.details.get("summary")
+    if summary:
+        st.subheader("Summary")
+        st.write(summary)
+        st.download_button(
+            label="Download Summary",
+            data=summary,
+            file_name=f"{os.path.splitext(job.name)[0]}_summary.txt",
+            mime="text/plain"
+        )
 
 def main():
     st.title("🎤 Speech-to-Text Pipeline")
     st.markdown("Upload an audio file to transcribe it using transformer models with optional Groq post-processing.")
     
-    # Initialize pipeline
-    pipeline = SpeechToTextPipeline()
+    model_name = st.selectbox("Speech model", config.AVAILABLE_MODELS,
+                              index=config.AVAILABLE_MODELS.index(config.SPEECH_MODEL_NAME))
+    
+    # Models live in the process-wide registry, so sessions and jobs share one copy of each
+    with st.spinner(f"Loading speech model {model_name}..."):
+        registry.get(model_name)
     
     # File uploader
     uploaded_file = st.file_uploader(
@@ -106,10 +111,14 @@ def main():
     col1, col2 = st.columns(2)
     with col1:
         use_groq = st.checkbox("Use Groq post-processing", value=True)
+        use_vad = st.checkbox("Skip silence (voice activity detection)", value=config.VAD_ENABLED)
+        pipelined = st.checkbox("Overlap decoding, inference and correction", value=False)
+        summarize = st.checkbox("Summarize transcript", value=False)
     with col2:
         if st.button("Clear Cache", help="Clear all cached data and reinitialize models"):
             st.cache_data.clear()
             st.session_state.clear()
+            registry.clear()
             st.rerun()
     
     if uploaded_file is not None:
@@ -124,39 +133,18 @@ def main():
         st.write(file_details)
         
         if st.button("Transcribe Audio"):
-            # Save uploaded file to temporary location
-            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(uploaded_file.name)[1]) as tmp_file:
-                tmp_file.write(uploaded_file.getvalue())
-                audio_path = tmp_file.name
-            
-            try:
-                # Process audio
-                start_time = time.time()
-                result = pipeline.process_audio_file(audio_path, use_groq)
-                processing_time = time.time() - start_time
-                
-                # Display results
-                st.subheader("Transcription Result")
-                st.text_area("", result, height=200)
-                
-                st.info(f"Processing time: {processing_time:.2f} seconds")
-                
-                # Download button
-                st.download_button(
-                    label="Download Transcription",
-                    data=result,
-                    file_name=f"{os.path.splitext(uploaded_file.name)[0]}_transcription.txt",
-                    mime="text/plain"
-                )
-                
-            except Exception as e:
-                st.error(f"Error processing audio: {str(e)}")
-                import traceback
-                st.code(traceback.format_exc())
+            # Decoded straight from memory; the name tells the decoders the container
+            audio_source = io.BytesIO(uploaded_file.getvalue())
+            audio_source.name = uploaded_file.name
             
-            finally:
-                # Clean up temporary file
-                os.unlink(audio_path)
+            # Runs in the background; the script only keeps the job id across reruns
+            job = get_job_manager().submit(uploaded_file.name, process_audio_file, audio_source, model_name, use_groq,
+                                           use_vad, summarize, pipelined)
+            st.session_state.job_id = job.id
+    
+    job = get_job_manager().get(st.session_state.get("job_id"))
+    if job is not None:
+        show_job(job)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
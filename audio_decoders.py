@@ -0,0 +1,285 @@
+import io
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import numpy as np
+import soundfile as sf
+from config import config
+from instrumentation import instrumentation
+
+# Containers soundfile decodes cheaply; everything else goes through ffmpeg
+SOUNDFILE_CONTAINERS = ("WAV", "WAVEX", "FLAC", "AIFF")
+PCM_SUBTYPES = ("PCM_16", "PCM_24", "PCM_32", "FLOAT", "DOUBLE")
+# ffmpeg cannot demux these from a pipe when the index (moov atom) sits at the end of the file
+SEEK_REQUIRED_CONTAINERS = ("MP4", "M4A", "MOV", "3GP")
+
+def is_path(source):
+    return isinstance(source, (str, os.PathLike))
+
+def source_name(source):
+    """The file path, or the `name` of an in-memory upload"""
+    if is_path(source):
+        return os.fspath(source)
+    return getattr(source, "name", "<memory>")
+
+def source_extension(source):
+    return os.path.splitext(source_name(source))[1].lstrip(".").upper()
+
+def rewind(source):
+    """A path, or a file-like positioned at the start, that soundfile can open
+
+    Sources may be paths, bytes, or seekable file-like objects such as
+    BytesIO or Streamlit uploads, so uploads never need a temporary file.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    if not is_path(source):
+        source.seek(0)
+    return source
+
+def source_buffer(source):
+    """The raw bytes of an in-memory source, without copying a BytesIO"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return source
+    if hasattr(source, "getbuffer"):
+        return source.getbuffer()
+    return rewind(source).read()
+
+def source_size(source):
+    if is_path(source):
+        return os.path.getsize(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source)
+    source.seek(0, io.SEEK_END)
+    return source.tell()
+
+def spool_to_file(source):
+    """Write an in-memory source to a temporary file for tools that need to seek by path"""
+    os.makedirs(config.TEMP_AUDIO_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=config.TEMP_AUDIO_DIR, suffix=os.path.splitext(source_name(source))[1])
+    with os.fdopen(fd, "wb") as f:
+        f.write(source_buffer(source))
+    return path
+
+class AudioInfo:
+    """Container, sample rate and channel count probed once per file"""
+
+    def __init__(self, container, sample_rate, channels, subtype="", duration=0.0, source="soundfile"):
+        self.container = container
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.subtype = subtype
+        self.duration = duration
+        self.source = source
+
+    def __repr__(self):
+        return (f"AudioInfo({self.container}, {self.sample_rate} Hz, {self.channels} ch, "
+                f"{self.subtype or 'unknown'}, {self.duration:.2f}s)")
+
+def ffprobe_path(ffmpeg_path):
+    """Locate ffprobe next to the ffmpeg binary pydub uses"""
+    directory, name = os.path.split(ffmpeg_path)
+    candidate = os.path.join(directory, name.replace("ffmpeg", "ffprobe"))
+    if directory:
+        return candidate if os.path.exists(candidate) else None
+    return shutil.which(candidate)
+
+def probe_audio(audio_path, ffmpeg_path="ffmpeg"):
+    """Read container, sample rate and channels from the header without decoding"""
+    try:
+        info = sf.info(rewind(audio_path))
+        return AudioInfo(info.format.upper(), info.samplerate, info.channels,
+                         info.subtype.upper(), info.duration)
+    except Exception:
+        pass
+
+    extension = source_extension(audio_path)
+    ffprobe = ffprobe_path(ffmpeg_path)
+    if ffprobe:
+        try:
+            in_memory = not is_path(audio_path)
+            result = subprocess.run(
+                [ffprobe, "-v", "error", "-select_streams", "a:0", "-show_entries",
+                 "stream=sample_rate,channels,codec_name:format=format_name,duration",
+                 "-of", "json", "pipe:0" if in_memory else audio_path],
+                input=source_buffer(audio_path) if in_memory else None,
+                capture_output=True, check=True
+            )
+            data = json.loads(result.stdout)
+            stream = data.get("streams", [{}])[0]
+            fmt = data.get("format", {})
+            return AudioInfo(extension or fmt.get("format_name", "").upper(),
+                             int(stream.get("sample_rate", 0)), int(stream.get("channels", 0)),
+                             stream.get("codec_name", "").upper(), float(fmt.get("duration", 0.0)),
+                             source="ffprobe")
+        except Exception:
+            pass
+
+    return AudioInfo(extension, 0, 0, source="extension")
+
+def stream_ffmpeg(audio_path, sample_rate, block_size, ffmpeg_path="ffmpeg"):
+    """Yield mono float32 blocks from an ffmpeg f32le pipe that also resamples
+
+    In-memory sources are fed to ffmpeg's stdin from a helper thread, except
+    containers that need seeking, which are spooled to a temporary file.
+    """
+    data = None
+    spooled = None
+    if not is_path(audio_path):
+        if source_extension(audio_path) in SEEK_REQUIRED_CONTAINERS:
+            spooled = audio_path = spool_to_file(audio_path)
+        else:
+            data = source_buffer(audio_path)
+
+    command = [
+        ffmpeg_path, "-v", "error", "-i", audio_path if data is None else "pipe:0",
+        "-f", "f32le", "-ac", "1", "-ar", str(sample_rate), "-"
+    ]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE if data is not None else subprocess.DEVNULL,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    feeder = None
+    if data is not None:
+        def feed(payload):
+            try:
+                process.stdin.write(payload)
+            except OSError:
+                pass  # ffmpeg exited early; its exit code reports why
+            finally:
+                try:
+                    process.stdin.close()
+                except OSError:
+                    pass
+        feeder = threading.Thread(target=feed, args=(data,), daemon=True)
+        feeder.start()
+
+    try:
+        while True:
+            block = process.stdout.read(block_size * 4)
+            if not block:
+                break
+            yield np.frombuffer(block[:len(block) // 4 * 4], dtype=np.float32)
+        process.wait()
+        if process.returncode != 0:
+            raise Exception(f"ffmpeg failed: {process.stderr.read().decode(errors='ignore').strip()}")
+    finally:
+        # The consumer may stop early; never leave ffmpeg running
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+        if feeder is not None:
+            feeder.join()
+        if spooled is not None:
+            os.remove(spooled)
+
+def decode_passthrough(audio_path, info, sample_rate, ffmpeg_path):
+    """Native 16 kHz mono PCM: read as float32, no resampling"""
+    audio_array, _ = sf.read(rewind(audio_path), dtype="float32")
+    return audio_array
+
+def decode_soundfile(audio_path, info, sample_rate, ffmpeg_path):
+    """WAV/FLAC through soundfile, downmix, then a fast soxr resample"""
+    audio_array, sr = sf.read(rewind(audio_path), dtype="float32", always_2d=True)
+    audio_array = audio_array.mean(axis=1)
+    if sr != sample_rate:
+        import soxr
+        with instrumentation.stage("resample", audio_seconds=len(audio_array) / sr, source_rate=sr):
+            audio_array = soxr.resample(audio_array, sr, sample_rate, quality=config.RESAMPLE_QUALITY)
+    return audio_array
+
+def decode_ffmpeg(audio_path, info, sample_rate, ffmpeg_path):
+    """Compressed formats through a single ffmpeg pipe"""
+    blocks = list(stream_ffmpeg(audio_path, sample_rate, 1 << 20, ffmpeg_path))
+    if not blocks:
+        raise Exception(f"ffmpeg produced no audio for {source_name(audio_path)}")
+    return np.concatenate(blocks)
+
+def decode_librosa(audio_path, info, sample_rate, ffmpeg_path):
+    """Last resort when ffmpeg is unavailable"""
+    import librosa
+    if is_path(audio_path):
+        audio_array, _ = librosa.load(audio_path, sr=sample_rate, mono=True, res_type="soxr_mq")
+        return audio_array
+    # audioread only opens paths
+    path = spool_to_file(audio_path)
+    try:
+        audio_array, _ = librosa.load(path, sr=sample_rate, mono=True, res_type="soxr_mq")
+    finally:
+        os.remove(path)
+    return audio_array
+
+class DecoderRegistry:
+    """Picks the cheapest decoder for a file from a single header probe"""
+
+    def __init__(self, sample_rate=config.SAMPLE_RATE, ffmpeg_path="ffmpeg"):
+        self.sample_rate = sample_rate
+        self.ffmpeg_path = ffmpeg_path
+        self.ffmpeg_available = bool(shutil.which(ffmpeg_path) or os.path.exists(ffmpeg_path))
+        self.decoders = []
+        self.stats = {}
+
+        self.register("passthrough", decode_passthrough, lambda info: (
+            info.container in SOUNDFILE_CONTAINERS and info.subtype in PCM_SUBTYPES
+            and info.sample_rate == self.sample_rate and info.channels == 1))
+        self.register("soundfile", decode_soundfile,
+                      lambda info: info.container in SOUNDFILE_CONTAINERS)
+        self.register("ffmpeg", decode_ffmpeg, lambda info: self.ffmpeg_available)
+        self.register("librosa", decode_librosa, lambda info: True)
+
+    def register(self, name, decode, matches, index=None):
+        """Add a decoder; the first one whose `matches(info)` is true wins"""
+        entry = (name, decode, matches)
+        if index is None:
+            self.decoders.append(entry)
+        else:
+            self.decoders.insert(index, entry)
+
+    def select(self, info):
+        """Return (name, decode) for the probed file"""
+        for name, decode, matches in self.decoders:
+            if matches(info):
+                return name, decode
+        raise Exception(f"No decoder available for {info}")
+
+    def decode(self, audio_path):
+        """Probe once, decode once with the selected backend and record timing
+
+        `audio_path` may also be bytes or a seekable file-like object.
+        """
+        info = probe_audio(audio_path, self.ffmpeg_path)
+        name, decode = self.select(info)
+
+        start_time = time.perf_counter()
+        with instrumentation.stage("decode", decoder=name, format=info.container) as span:
+            try:
+                audio_array = decode(audio_path, info, self.sample_rate, self.ffmpeg_path)
+            except Exception as e:
+                raise Exception(f"{name} decoder failed for {info}: {str(e)}")
+            audio_seconds = len(audio_array) / self.sample_rate
+            span.audio_seconds = audio_seconds
+            span.bytes = source_size(audio_path)
+        elapsed = time.perf_counter() - start_time
+
+        self._record(name, info.container, elapsed, audio_seconds)
+        print(f"Decoded {info} with {name} in {elapsed:.3f}s")
+        return audio_array
+
+    def _record(self, name, container, elapsed, audio_seconds):
+        entry = self.stats.setdefault((name, container), {"files": 0, "seconds": 0.0, "audio_seconds": 0.0})
+        entry["files"] += 1
+        entry["seconds"] += elapsed
+        entry["audio_seconds"] += audio_seconds
+
+    def report(self):
+        """Per backend/format decode time and speed (x real time)"""
+        rows = []
+        for (name, container), entry in sorted(self.stats.items()):
+            speed = entry["audio_seconds"] / entry["seconds"] if entry["seconds"] > 0 else 0.0
+            rows.append({"decoder": name, "format": container, **entry, "x_realtime": speed})
+        return rows
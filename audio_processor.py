@@ -1,88 +1,169 @@
-import librosa
+import functools
+import shutil
 import numpy as np
-from pydub import AudioSegment
 import os
 import soundfile as sf
 from config import config
-import warnings
+from instrumentation import instrumentation
+from audio_decoders import (DecoderRegistry, SOUNDFILE_CONTAINERS, is_path, probe_audio, rewind, source_name,
+                            stream_ffmpeg)
+
+@functools.lru_cache(maxsize=None)
+def find_ffmpeg():
+    """Locate ffmpeg once per process; returns the command/path to use"""
+    # Common FFmpeg installation paths
+    possible_ffmpeg_paths = [
+        r"C:\ffmpeg\bin\ffmpeg.exe",
+        r"C:\Program Files\ffmpeg\bin\ffmpeg.exe",
+        r"C:\tools\ffmpeg\bin\ffmpeg.exe",
+        os.path.join(os.getcwd(), "ffmpeg", "bin", "ffmpeg.exe")
+    ]
+    
+    # Check if ffmpeg is in PATH (a lookup, not a subprocess)
+    if shutil.which("ffmpeg"):
+        print("FFmpeg found in PATH")
+        return "ffmpeg"
+    
+    # Try to find ffmpeg in common locations
+    for ffmpeg_path in possible_ffmpeg_paths:
+        if os.path.exists(ffmpeg_path):
+            print(f"FFmpeg found at: {ffmpeg_path}")
+            return ffmpeg_path
+    
+    print("Warning: FFmpeg not found. Some audio formats may not work properly.")
+    return "ffmpeg"
 
 class AudioProcessor:
     def __init__(self):
         self.sample_rate = config.SAMPLE_RATE
         self._setup_ffmpeg()
+        self.decoders = DecoderRegistry(self.sample_rate, self.ffmpeg_path)
         
     def _setup_ffmpeg(self):
-        """Setup FFmpeg path for pydub"""
-        # Common FFmpeg installation paths
-        possible_ffmpeg_paths = [
-            r"C:\ffmpeg\bin\ffmpeg.exe",
-            r"C:\Program Files\ffmpeg\bin\ffmpeg.exe",
-            r"C:\tools\ffmpeg\bin\ffmpeg.exe",
-            os.path.join(os.getcwd(), "ffmpeg", "bin", "ffmpeg.exe")
-        ]
-        
-        # Check if ffmpeg is in PATH
-        try:
-            import subprocess
-            subprocess.run(["ffmpeg", "-version"], capture_output=True, check=True)
-            print("FFmpeg found in PATH")
-            return
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            pass
-        
-        # Try to find ffmpeg in common locations
-        for ffmpeg_path in possible_ffmpeg_paths:
-            if os.path.exists(ffmpeg_path):
-                AudioSegment.converter = ffmpeg_path
-                print(f"FFmpeg found at: {ffmpeg_path}")
-                return
-        
-        print("Warning: FFmpeg not found. Some audio formats may not work properly.")
+        """Setup FFmpeg path for the decoders (memoized across instances)"""
+        self.ffmpeg_path = find_ffmpeg()
         
     def load_audio(self, audio_path):
-        """Load audio file and convert to required format"""
-        try:
-            # Use librosa for all formats to avoid ffmpeg dependency
-            print(f"Loading audio with librosa: {audio_path}")
-            audio_array, _ = librosa.load(audio_path, sr=self.sample_rate, mono=True)
-            return audio_array
-            
-        except Exception as e:
-            print(f"Librosa failed: {e}. Trying alternative methods...")
-            return self._load_audio_alternative(audio_path)
-    
-    def _load_audio_alternative(self, audio_path):
-        """Alternative audio loading method"""
-        try:
-            # Try soundfile first
-            audio_array, sr = sf.read(audio_path)
-            if sr != self.sample_rate:
-                import librosa
-                audio_array = librosa.resample(audio_array, orig_sr=sr, target_sr=self.sample_rate)
-            if len(audio_array.shape) > 1:
-                audio_array = np.mean(audio_array, axis=0)
-            return audio_array
-        except Exception as e:
-            print(f"Soundfile failed: {e}. Trying pydub with warning suppression...")
-            return self._load_audio_with_pydub(audio_path)
-    
-    def _load_audio_with_pydub(self, audio_path):
-        """Load audio with pydub (with suppressed warnings)"""
-        try:
-            # Suppress warnings temporarily
-            import warnings
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore")
-                audio = AudioSegment.from_file(audio_path)
-                audio = audio.set_frame_rate(self.sample_rate).set_channels(1)
-                audio_array = np.array(audio.get_array_of_samples(), dtype=np.float32)
-                audio_array /= 2**15  # Normalize to [-1, 1] for 16-bit audio
-                return audio_array
-        except Exception as e:
-            raise Exception(f"All audio loading methods failed: {str(e)}")
+        """Load audio file (a path, bytes or file-like upload) and convert to required format"""
+        print(f"Loading audio: {source_name(audio_path)}")
+        return self.decoders.decode(audio_path)
     
-    def preprocess_audio(self, audio_array):
+    def get_duration(self, audio_path):
+        """Read the duration in seconds from the file header without decoding"""
+        info = probe_audio(audio_path, self.ffmpeg_path)
+        if info.duration > 0 or not is_path(audio_path):
+            return info.duration
+        import librosa
+        return librosa.get_duration(path=audio_path)
+
+    def _decode_blocks(self, audio_path, block_duration=config.LOADER_BLOCK_DURATION):
+        """Yield mono float32 blocks at the target sample rate"""
+        info = probe_audio(audio_path, self.ffmpeg_path)
+        if info.container not in SOUNDFILE_CONTAINERS:
+            yield from stream_ffmpeg(audio_path, self.sample_rate, int(block_duration * self.sample_rate), self.ffmpeg_path)
+            return
+
+        resampler = None
+        if info.sample_rate != self.sample_rate:
+            import soxr
+            resampler = soxr.ResampleStream(info.sample_rate, self.sample_rate, 1, dtype="float32",
+                                            quality=config.RESAMPLE_QUALITY)
+
+        blocksize = int(block_duration * info.sample_rate)
+        for block in sf.blocks(rewind(audio_path), blocksize=blocksize, dtype="float32", always_2d=True):
+            block = block.mean(axis=1)
+            if resampler is not None:
+                with instrumentation.stage("resample", audio_seconds=len(block) / info.sample_rate,
+                                           source_rate=info.sample_rate):
+                    block = resampler.resample_chunk(block)
+            if len(block):
+                yield block
+
+        if resampler is not None:
+            tail = resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+            if len(tail):
+                yield tail
+
+    def stream_audio(self, audio_path, chunk_duration=config.CHUNK_DURATION):
+        """Decode, resample, normalize and chunk block by block, yielding (offset_sample, chunk)"""
+        chunk_size = int(chunk_duration * self.sample_rate)
+        buffer = []
+        buffered = 0
+        offset = 0
+        peak = 0.0
+
+        def normalize(chunk, peak):
+            # Running peak instead of the global max, which needs the whole file
+            peak = max(peak, float(np.max(np.abs(chunk))) if len(chunk) else 0.0)
+            return (chunk / peak if peak > 0 else chunk), peak
+
+        blocks = self._decode_blocks(audio_path)
+        while True:
+            # Decoding happens lazily inside next(), so that is what gets timed
+            with instrumentation.stage("decode", streamed=True) as span:
+                block = next(blocks, None)
+                if block is not None:
+                    span.audio_seconds = len(block) / self.sample_rate
+                    span.bytes = block.nbytes
+            if block is None:
+                break
+            buffer.append(block)
+            buffered += len(block)
+            while buffered >= chunk_size:
+                data = np.concatenate(buffer)
+                chunk, peak = normalize(data[:chunk_size], peak)
+                buffer = [data[chunk_size:]]
+                buffered -= chunk_size
+                yield offset, chunk
+                offset += chunk_size
+
+        if buffered:
+            chunk, peak = normalize(np.concatenate(buffer), peak)
+            yield offset, chunk
+
+    def stream_audio_overlapping(self, audio_path, chunk_duration=config.CHUNK_DURATION,
+                                 overlap_duration=config.CHUNK_OVERLAP_DURATION):
+        """Like stream_audio, but each window starts with the last overlap_duration of the one before it"""
+        chunk_size = int(chunk_duration * self.sample_rate)
+        # Capped as in chunk_audio_overlapping
+        overlap = min(int(overlap_duration * self.sample_rate), chunk_size // 2)
+        tail = np.zeros(0, dtype=np.float32)
+
+        for offset, chunk in self.stream_audio(audio_path, chunk_duration=(chunk_size - overlap) / self.sample_rate):
+            window = np.concatenate([tail, chunk])
+            yield offset - len(tail), window
+            if overlap:
+                tail = window[-overlap:]
+
+    def stream_speech_segments(self, audio_path, window_duration=config.LOADER_WINDOW_DURATION,
+                               chunk_duration=config.CHUNK_DURATION):
+        """Run VAD window by window over a streamed file, yielding (offset_sample, chunk)"""
+        chunk_size = int(chunk_duration * self.sample_rate)
+        carry = np.zeros(0, dtype=np.float32)
+
+        for offset, window in self.stream_audio(audio_path, chunk_duration=window_duration):
+            audio = np.concatenate([carry, window])
+            base = offset - len(carry)
+            regions = self.detect_speech(audio)
+
+            # A region touching the end of the window may continue in the next one
+            carry = np.zeros(0, dtype=np.float32)
+            if regions and regions[-1][1] >= len(audio) and len(audio) - regions[-1][0] < chunk_size:
+                carry = audio[regions[-1][0]:]
+                regions = regions[:-1]
+
+            for start, chunk in self.chunk_speech(audio, regions, chunk_duration=chunk_duration):
+                yield base + start, chunk
+
+        if len(carry):
+            yield base + len(audio) - len(carry), carry
+
+    def preprocess_audio(self, audio_array, trim_silence=True):
         """Preprocess audio for model input - THIS WAS MISSING"""
+        with instrumentation.stage("preprocess", audio_seconds=len(audio_array) / self.sample_rate):
+            return self._preprocess_audio(audio_array, trim_silence)
+
+    def _preprocess_audio(self, audio_array, trim_silence):
         # Ensure mono
         if len(audio_array.shape) > 1:
             audio_array = np.mean(audio_array, axis=0)
@@ -92,35 +173,170 @@ class AudioProcessor:
         if max_val > 0:
             audio_array = audio_array / max_val
         
-        # Remove silence (optional)
-        audio_array = self.remove_silence(audio_array)
+        # Remove silence (optional, VAD keeps sample offsets intact instead)
+        if trim_silence:
+            audio_array = self.remove_silence(audio_array)
         
         return audio_array
     
     def remove_silence(self, audio_array, threshold=0.01):
         """Remove leading and trailing silence"""
+        start, end = self.silence_bounds(audio_array, threshold)
+        return audio_array[start:end]
+
+    def silence_bounds(self, audio_array, threshold=0.01):
+        """(start, end) samples of the audio between leading and trailing silence"""
         # Find non-silent parts
         non_silent = np.where(np.abs(audio_array) > threshold)[0]
         
         if len(non_silent) > 0:
-            start = non_silent[0]
-            end = non_silent[-1]
-            return audio_array[start:end]
+            return int(non_silent[0]), int(non_silent[-1])
         
-        return audio_array
+        return 0, len(audio_array)
     
+    def _frame_features(self, audio_array, frame_size, block_frames=4096):
+        """Per-frame energy (dB) and spectral flatness"""
+        n_frames = len(audio_array) // frame_size
+        frames = audio_array[:n_frames * frame_size].reshape(n_frames, frame_size)
+        window = np.hanning(frame_size).astype(np.float32)
+        energy_db = np.empty(n_frames, dtype=np.float32)
+        flatness = np.empty(n_frames, dtype=np.float32)
+
+        # Work in blocks so the spectra never cover the whole file at once
+        for i in range(0, n_frames, block_frames):
+            block = frames[i:i + block_frames].astype(np.float32)
+            energy_db[i:i + block_frames] = 10 * np.log10(np.mean(block ** 2, axis=1) + 1e-10)
+            power = np.abs(np.fft.rfft(block * window, axis=1)) ** 2 + 1e-10
+            flatness[i:i + block_frames] = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+
+        return energy_db, flatness
+
+    def _fill_runs(self, mask, value, max_length):
+        """Flip runs of `value` no longer than max_length frames"""
+        mask = mask.copy()
+        n = len(mask)
+        i = 0
+        while i < n:
+            if mask[i] != value:
+                i += 1
+                continue
+            j = i
+            while j < n and mask[j] == value:
+                j += 1
+            # Leading/trailing silence is kept, only interior gaps get filled
+            interior = value or (i > 0 and j < n)
+            if j - i <= max_length and interior:
+                mask[i:j] = not value
+            i = j
+        return mask
+
+    def detect_speech(self, audio_array, **options):
+        """Find speech regions as (start_sample, end_sample) pairs"""
+        with instrumentation.stage("vad", audio_seconds=len(audio_array) / self.sample_rate):
+            return self._detect_speech(audio_array, **options)
+
+    def _detect_speech(self, audio_array,
+                       frame_duration=config.VAD_FRAME_DURATION,
+                       energy_margin_db=config.VAD_ENERGY_MARGIN_DB,
+                       flatness_threshold=config.VAD_FLATNESS_THRESHOLD,
+                       min_silence=config.VAD_MIN_SILENCE,
+                       min_speech=config.VAD_MIN_SPEECH,
+                       padding=config.VAD_PADDING):
+        """Energy and spectral-flatness VAD over fixed-size frames"""
+        frame_size = int(frame_duration * self.sample_rate)
+        if len(audio_array) < frame_size:
+            return [(0, len(audio_array))] if len(audio_array) else []
+
+        energy_db, flatness = self._frame_features(audio_array, frame_size)
+
+        # Adaptive threshold above the estimated noise floor
+        noise_floor = np.percentile(energy_db, 10)
+        speech = (energy_db > noise_floor + energy_margin_db) & (flatness < flatness_threshold)
+
+        # Bridge short pauses, then drop blips too short to be speech
+        speech = self._fill_runs(speech, False, int(min_silence / frame_duration))
+        speech = self._fill_runs(speech, True, int(min_speech / frame_duration))
+
+        edges = np.diff(np.concatenate([[0], speech.astype(np.int8), [0]]))
+        starts = np.where(edges == 1)[0]
+        ends = np.where(edges == -1)[0]
+
+        pad = int(padding * self.sample_rate)
+        regions = []
+        for start, end in zip(starts, ends):
+            start = max(0, start * frame_size - pad)
+            end = min(len(audio_array), end * frame_size + pad)
+            if regions and start <= regions[-1][1]:
+                regions[-1] = (regions[-1][0], end)
+            else:
+                regions.append((start, end))
+
+        return regions
+
+    def chunk_speech(self, audio_array, regions, **options):
+        """Split speech regions into chunks cut at pauses, as (offset_sample, chunk) pairs"""
+        with instrumentation.stage("chunk", audio_seconds=len(audio_array) / self.sample_rate) as span:
+            segments = self._chunk_speech(audio_array, regions, **options)
+            span.fields["chunks"] = len(segments)
+            return segments
+
+    def _chunk_speech(self, audio_array, regions, chunk_duration=config.CHUNK_DURATION,
+                      frame_duration=config.VAD_FRAME_DURATION):
+        chunk_size = int(chunk_duration * self.sample_rate)
+        frame_size = int(frame_duration * self.sample_rate)
+        segments = []
+
+        for start, end in regions:
+            while end - start > chunk_size:
+                # Cut at the quietest frame in the second half of the window
+                search_start = start + chunk_size // 2
+                window = audio_array[search_start:start + chunk_size]
+                n_frames = len(window) // frame_size
+                frame_energy = np.mean(window[:n_frames * frame_size].reshape(n_frames, frame_size) ** 2, axis=1)
+                cut = search_start + int(np.argmin(frame_energy)) * frame_size + frame_size // 2
+                segments.append((start, audio_array[start:cut]))
+                start = cut
+            if end - start > 0:
+                segments.append((start, audio_array[start:end]))
+
+        return segments
+
     def chunk_audio(self, audio_array, chunk_duration=config.CHUNK_DURATION):
         """Split audio into chunks for processing"""
         chunk_size = int(chunk_duration * self.sample_rate)
         chunks = []
         
-        for i in range(0, len(audio_array), chunk_size):
-            chunk = audio_array[i:i + chunk_size]
-            if len(chunk) > self.sample_rate:  # At least 1 second
-                chunks.append(chunk)
+        with instrumentation.stage("chunk", audio_seconds=len(audio_array) / self.sample_rate) as span:
+            for i in range(0, len(audio_array), chunk_size):
+                chunk = audio_array[i:i + chunk_size]
+                if len(chunk) > self.sample_rate:  # At least 1 second
+                    chunks.append(chunk)
+            span.fields["chunks"] = len(chunks)
                 
         return chunks
     
+    def chunk_audio_overlapping(self, audio_array, chunk_duration=config.CHUNK_DURATION,
+                                overlap_duration=config.CHUNK_OVERLAP_DURATION):
+        """Split audio into windows that share overlap_duration with each neighbour, as (offset_sample, window)
+
+        Nothing is dropped: the last window is moved back to end with the audio,
+        so it may share more than overlap_duration with the one before it.
+        """
+        chunk_size = int(chunk_duration * self.sample_rate)
+        # Beyond half a window, a frame could be covered by three windows on every step
+        overlap = min(int(overlap_duration * self.sample_rate), chunk_size // 2)
+        step = chunk_size - overlap
+
+        with instrumentation.stage("chunk", audio_seconds=len(audio_array) / self.sample_rate) as span:
+            if len(audio_array) <= chunk_size:
+                windows = [(0, audio_array)]
+            else:
+                starts = list(range(0, len(audio_array) - chunk_size, step)) + [len(audio_array) - chunk_size]
+                windows = [(start, audio_array[start:start + chunk_size]) for start in starts]
+            span.fields["chunks"] = len(windows)
+
+        return windows
+
     def convert_to_tensor(self, audio_array):
         """Convert numpy array to torch tensor"""
         import torch
@@ -0,0 +1,184 @@
+import glob
+import json
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from config import config
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".flac", ".ogg")
+MANIFEST_EXTENSIONS = (".txt", ".lst", ".jsonl")
+
+def _read_manifest(manifest_path):
+    """One path per line, or JSONL objects with an "audio" field; relative paths resolve next to the manifest"""
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    paths = []
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                line = json.loads(line)["audio"]
+            paths.append(line if os.path.isabs(line) else os.path.join(base_dir, line))
+    return paths
+
+def collect_inputs(specs):
+    """Expand directories, glob patterns and manifest files into a list of audio paths"""
+    paths = []
+    for spec in specs:
+        if os.path.isdir(spec):
+            for root, _, files in os.walk(spec):
+                paths.extend(os.path.join(root, name) for name in sorted(files)
+                             if name.lower().endswith(AUDIO_EXTENSIONS))
+        elif glob.has_magic(spec):
+            paths.extend(sorted(glob.glob(spec, recursive=True)))
+        elif spec.lower().endswith(MANIFEST_EXTENSIONS):
+            paths.extend(_read_manifest(spec))
+        else:
+            paths.append(spec)
+
+    # Keep the first occurrence of each file
+    seen = set()
+    unique = []
+    for path in paths:
+        key = os.path.abspath(path)
+        if key not in seen:
+            seen.add(key)
+            unique.append(path)
+    return unique
+
+def available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def split_cores(workers):
+    """Contiguous, equally sized core sets, one per worker"""
+    cores = available_cores()
+    workers = max(1, min(workers, len(cores)))
+    size = len(cores) // workers
+    return [cores[i * size:(i + 1) * size] for i in range(workers)]
+
+# Per-process state, set up once by _init_worker
+_pipeline = None
+
+def _init_worker(core_queue, use_cache, model_name, overlap_duration):
+    """Pin this worker to its share of the cores and load the model once"""
+    global _pipeline
+    cores = core_queue.get()
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+
+    import torch
+    torch.set_num_threads(len(cores))
+    torch.set_num_interop_threads(1)
+
+    from main import SpeechToTextPipeline
+    _pipeline = SpeechToTextPipeline(use_cache=use_cache, model_name=model_name, overlap_duration=overlap_duration)
+    # The pipeline builds components lazily; load the model here rather than inside the first job
+    _pipeline.speech_recognizer
+
+def _process_file(audio_path, use_groq, use_vad):
+    start_time = time.perf_counter()
+    record = {"audio": audio_path, "worker": os.getpid()}
+    try:
+        record["audio_seconds"] = _pipeline.audio_processor.get_duration(audio_path)
+        record["text"] = _pipeline.process_audio_file(audio_path, use_groq, use_vad=use_vad, raise_errors=True)
+        record["status"] = "ok"
+        if _pipeline.journal_report:
+            record["journal"] = _pipeline.journal_report
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = str(e)
+    record["seconds"] = time.perf_counter() - start_time
+    return record
+
+class BatchRunner:
+    """Transcribe many files on a pool of worker processes that each load the model once"""
+
+    def __init__(self, workers=config.BATCH_WORKERS, use_groq=True, use_vad=config.VAD_ENABLED,
+                 use_cache=config.CACHE_ENABLED, model_name=None, max_crash_retries=1,
+                 overlap_duration=config.CHUNK_OVERLAP_DURATION):
+        self.core_sets = split_cores(workers)
+        self.workers = len(self.core_sets)
+        self.use_groq = use_groq
+        self.use_vad = use_vad
+        self.use_cache = use_cache
+        self.model_name = model_name
+        self.max_crash_retries = max_crash_retries
+        self.overlap_duration = overlap_duration
+
+    def _start_pool(self):
+        context = multiprocessing.get_context("spawn")
+        core_queue = context.Queue()
+        for cores in self.core_sets:
+            core_queue.put(cores)
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                   initializer=_init_worker, initargs=(core_queue, self.use_cache, self.model_name,
+                                                                             self.overlap_duration))
+
+    def run(self, audio_paths, output_path):
+        """Process files largest first and append one JSON line per file to output_path"""
+        sizes = {}
+        for path in audio_paths:
+            try:
+                sizes[path] = os.path.getsize(path)
+            except OSError:
+                sizes[path] = -1
+        # Largest first, so a long file never ends up last on an otherwise idle pool
+        pending = sorted(audio_paths, key=lambda path: sizes[path], reverse=True)
+        pending.reverse()  # pop() from the end
+
+        crashes = {}
+        summary = {"ok": 0, "error": 0, "files": len(audio_paths)}
+        start_time = time.perf_counter()
+        print(f"Batch: {len(audio_paths)} files on {self.workers} workers "
+              f"({len(self.core_sets[0])} cores each)")
+
+        with open(output_path, "a", encoding="utf-8") as output:
+            def write(record):
+                summary[record["status"]] += 1
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+                done = summary["ok"] + summary["error"]
+                print(f"[{done}/{summary['files']}] {record['status']} {record['audio']} ({record['seconds']:.2f}s)")
+
+            while pending:
+                executor = self._start_pool()
+                in_flight = {}
+                try:
+                    while pending or in_flight:
+                        # At most one queued job per worker keeps distribution dynamic
+                        while pending and len(in_flight) < self.workers:
+                            path = pending.pop()
+                            if sizes[path] < 0:
+                                write({"audio": path, "status": "error", "error": "file not found", "seconds": 0.0})
+                                continue
+                            future = executor.submit(_process_file, path, self.use_groq, self.use_vad)
+                            in_flight[future] = path
+
+                        if not in_flight:
+                            break
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            record = future.result()
+                            del in_flight[future]
+                            write(record)
+                except BrokenProcessPool:
+                    # A worker died; we cannot tell which file did it, so every in-flight file is suspect
+                    print(f"Worker crashed with {len(in_flight)} files in flight, restarting pool...")
+                    for path in in_flight.values():
+                        crashes[path] = crashes.get(path, 0) + 1
+                        if crashes[path] > self.max_crash_retries:
+                            write({"audio": path, "status": "error", "error": "worker process crashed",
+                                   "seconds": 0.0})
+                        else:
+                            pending.append(path)
+                finally:
+                    executor.shutdown(wait=False, cancel_futures=True)
+
+        summary["seconds"] = time.perf_counter() - start_time
+        summary["files_per_second"] = summary["files"] / summary["seconds"] if summary["seconds"] > 0 else 0.0
+        return summary
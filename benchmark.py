@@ -0,0 +1,256 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import soundfile as sf
+from config import config
+from inference_backends import BACKENDS
+from instrumentation import peak_rss_bytes
+
+BENCHMARK_DIR = os.path.join(config.CACHE_DIR, "benchmark")
+DEFAULT_BASELINE = "benchmark_baseline.json"
+VOCAB = ["<pad>", "<s>", "</s>", "<unk>", "|"] + list("ETAONIHSRDLUMWCFGYPBVKXJQZ'")
+WORDS = ("the quick brown fox jumps over a lazy dog while seven bright engineers measure "
+         "latency throughput and memory across every stage of the speech pipeline").split()
+
+def synthesize_speech(duration, sample_rate=config.SAMPLE_RATE, seed=0, block_duration=60):
+    """Yield blocks of speech-like audio: voiced harmonic bursts separated by pauses, over low noise"""
+    rng = np.random.default_rng(seed)
+    total = int(duration * sample_rate)
+    block_size = int(block_duration * sample_rate)
+    written = 0
+    phase = 0.0
+    while written < total:
+        size = min(block_size, total - written)
+        block = rng.normal(0, 0.003, size).astype(np.float32)
+        position = 0
+        while position < size:
+            # A "word" of 150-600 ms, then a 100-800 ms pause
+            word = min(int(rng.uniform(0.15, 0.6) * sample_rate), size - position)
+            f0 = rng.uniform(100, 250)
+            t = np.arange(word) / sample_rate
+            voiced = sum(np.sin(2 * np.pi * f0 * k * t + phase) / k for k in range(1, 6))
+            envelope = np.sin(np.pi * np.arange(word) / max(word, 1)) * rng.uniform(0.2, 0.6)
+            block[position:position + word] += (voiced * envelope).astype(np.float32)
+            phase += 2 * np.pi * f0 * word / sample_rate
+            position += word + int(rng.uniform(0.1, 0.8) * sample_rate)
+        yield np.clip(block, -1.0, 1.0)
+        written += size
+
+def synthetic_transcript(audio_seconds, words_per_minute=150):
+    """Lower-case, unpunctuated text of the length a talker would produce"""
+    count = max(1, int(audio_seconds / 60 * words_per_minute))
+    return " ".join(WORDS[i % len(WORDS)] for i in range(count))
+
+def prepare_audio(durations, formats, ffmpeg_path):
+    """Write (once) a synthetic file per duration and format; returns [(path, format, seconds)]"""
+    os.makedirs(BENCHMARK_DIR, exist_ok=True)
+    files = []
+    for duration in durations:
+        wav_path = os.path.join(BENCHMARK_DIR, f"speech_{duration}s.wav")
+        if not os.path.exists(wav_path):
+            print(f"Generating {duration}s of synthetic speech...")
+            tmp_path = f"{wav_path}.tmp"
+            with sf.SoundFile(tmp_path, "w", config.SAMPLE_RATE, 1, subtype="PCM_16", format="WAV") as f:
+                for block in synthesize_speech(duration):
+                    f.write(block)
+            os.replace(tmp_path, wav_path)
+
+        for fmt in formats:
+            path = os.path.join(BENCHMARK_DIR, f"speech_{duration}s.{fmt}")
+            if fmt != "wav" and not os.path.exists(path):
+                tmp_path = os.path.join(BENCHMARK_DIR, f"tmp_speech_{duration}s.{fmt}")
+                try:
+                    if fmt == "flac":
+                        data, sr = sf.read(wav_path, dtype="float32")
+                        sf.write(tmp_path, data, sr, format="FLAC")
+                    else:
+                        subprocess.run([ffmpeg_path, "-y", "-loglevel", "error", "-i", wav_path, tmp_path],
+                                       check=True, capture_output=True)
+                    os.replace(tmp_path, path)
+                except Exception as e:
+                    print(f"Skipping {fmt}: {str(e)}")
+                    continue
+            files.append((path, fmt, float(duration)))
+    return files
+
+def build_tiny_model(model_dir):
+    """Save a randomly initialized two-layer Wav2Vec2 CTC model so nothing is downloaded"""
+    if os.path.exists(os.path.join(model_dir, "config.json")):
+        return model_dir
+
+    import torch
+    from transformers import (Wav2Vec2Config, Wav2Vec2CTCTokenizer, Wav2Vec2FeatureExtractor,
+                              Wav2Vec2ForCTC, Wav2Vec2Processor)
+
+    os.makedirs(model_dir, exist_ok=True)
+    vocab_path = os.path.join(model_dir, "vocab.json")
+    with open(vocab_path, "w", encoding="utf-8") as f:
+        json.dump({token: i for i, token in enumerate(VOCAB)}, f)
+
+    tokenizer = Wav2Vec2CTCTokenizer(vocab_path, unk_token="<unk>", pad_token="<pad>", word_delimiter_token="|")
+    feature_extractor = Wav2Vec2FeatureExtractor(feature_size=1, sampling_rate=config.SAMPLE_RATE,
+                                                 padding_value=0.0, do_normalize=True, return_attention_mask=False)
+    Wav2Vec2Processor(feature_extractor=feature_extractor, tokenizer=tokenizer).save_pretrained(model_dir)
+
+    torch.manual_seed(0)
+    model_config = Wav2Vec2Config(
+        vocab_size=len(VOCAB), hidden_size=64, num_hidden_layers=2, num_attention_heads=2,
+        intermediate_size=128, conv_dim=(32,) * 7, num_conv_pos_embeddings=16, num_conv_pos_embedding_groups=4,
+        pad_token_id=tokenizer.pad_token_id, ctc_loss_reduction="mean"
+    )
+    Wav2Vec2ForCTC(model_config).save_pretrained(model_dir)
+    return model_dir
+
+class StageTimer:
+    """Best-of-N wall time plus peak traced allocations for each (file, stage) measured"""
+
+    def __init__(self, repeat=1):
+        self.repeat = repeat
+        self.results = {}
+
+    def measure(self, name, audio_seconds, func, *args, **kwargs):
+        times = []
+        peak = 0
+        result = None
+        for _ in range(self.repeat):
+            # tracemalloc sees numpy buffers but not torch's allocator, hence the RSS high-water mark too
+            tracemalloc.start()
+            start_time = time.perf_counter()
+            result = func(*args, **kwargs)
+            times.append(time.perf_counter() - start_time)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+        seconds = min(times)
+        self.results[name] = {
+            "seconds": seconds,
+            "rtf": seconds / audio_seconds if audio_seconds > 0 else 0.0,
+            "x_realtime": audio_seconds / seconds if seconds > 0 else 0.0,
+            "peak_mb": peak / (1024 * 1024),
+            "rss_peak_mb": peak_rss_bytes() / (1024 * 1024)
+        }
+        print(f"  {name:<40} {seconds:9.3f}s  RTF {self.results[name]['rtf']:.4f}  "
+              f"peak {self.results[name]['peak_mb']:.1f} MB")
+        return result
+
+def run_benchmarks(durations, formats, repeat=1, groq_latency=0.0, backend="eager"):
+    from audio_processor import AudioProcessor, find_ffmpeg
+    from groq_integration import GroqPostProcessor
+    from speech_recognizer import SpeechRecognizer
+    from stub_chat_server import StubChatServer
+
+    files = prepare_audio(durations, formats, find_ffmpeg())
+    model_dir = build_tiny_model(os.path.join(BENCHMARK_DIR, "tiny-wav2vec2"))
+
+    # Real API calls and cached responses would both distort the numbers
+    config.GROQ_CACHE_MODE = "off"
+    config.GROQ_SUMMARY_MEMO = False
+    config.GROQ_API_KEY = config.GROQ_API_KEY or "stub"
+
+    timer = StageTimer(repeat)
+    audio_processor = AudioProcessor()
+    speech_recognizer = SpeechRecognizer(model_name=model_dir, backend=backend, device="cpu")
+
+    for path, fmt, duration in files:
+        print(f"\n{os.path.basename(path)}")
+        label = f"{int(duration)}s.{fmt}"
+        audio = timer.measure(f"{label}/load_audio", duration, audio_processor.load_audio, path)
+        # Decode cost is the only stage that differs between formats
+        if fmt != formats[0]:
+            continue
+        audio = timer.measure(f"{label}/preprocess_audio", duration, audio_processor.preprocess_audio, audio)
+        chunks = timer.measure(f"{label}/chunk_audio", duration, audio_processor.chunk_audio, audio)
+        chunk_seconds = sum(len(chunk) for chunk in chunks) / config.SAMPLE_RATE
+        if chunks:
+            timer.measure(f"{label}/transcribe_audio", len(chunks[0]) / config.SAMPLE_RATE,
+                          speech_recognizer.transcribe_audio, chunks[0])
+            timer.measure(f"{label}/transcribe_chunks", chunk_seconds, speech_recognizer.transcribe_chunks, chunks)
+
+    with StubChatServer(latency=groq_latency) as server:
+        config.GROQ_BASE_URL = server.base_url
+        groq_processor = GroqPostProcessor()
+        for duration in durations:
+            text = synthetic_transcript(duration)
+            timer.measure(f"{int(duration)}s/groq_correct", duration, groq_processor.correct_transcription, text)
+            timer.measure(f"{int(duration)}s/groq_summarize", duration, groq_processor.summarize_text, text)
+        print(f"  Stub served {len(server.requests)} requests")
+
+    return timer.results
+
+def environment():
+    info = {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()}
+    try:
+        import torch
+        info["torch"] = torch.__version__
+        info["torch_threads"] = torch.get_num_threads()
+    except ImportError:
+        pass
+    return info
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Return a list of human-readable regressions beyond the relative tolerance"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            continue
+        for metric in ("seconds", "peak_mb"):
+            # Ignore noise on very small values (sub-10 ms stages, sub-1 MB allocations)
+            floor = 0.01 if metric == "seconds" else 1.0
+            if current[metric] > max(previous[metric], floor) * (1 + tolerance):
+                regressions.append(f"{name} {metric}: {previous[metric]:.3f} -> {current[metric]:.3f} "
+                                   f"(+{(current[metric] / max(previous[metric], 1e-9) - 1) * 100:.0f}%)")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the speech-to-text pipeline")
+    parser.add_argument("--durations", type=int, nargs="+", default=[5, 300, 3600],
+                        help="Synthetic audio lengths in seconds")
+    parser.add_argument("--formats", nargs="+", default=["wav", "flac", "mp3"],
+                        help="Audio formats to decode (the first one also runs the later stages)")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per stage; the fastest is reported")
+    parser.add_argument("--groq-latency", type=float, default=0.0, help="Simulated Groq response latency")
+    parser.add_argument("--backend", choices=list(BACKENDS), default="eager")
+    parser.add_argument("--output", type=str, default="benchmark_results.json")
+    parser.add_argument("--baseline", type=str, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown/growth before flagging")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.durations, args.formats, args.repeat, args.groq_latency, args.backend)
+    report = {"created": time.time(), "environment": environment(), "results": results}
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to: {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to: {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("environment") != report["environment"]:
+        print("Warning: baseline was recorded on a different environment")
+
+    regressions = compare_to_baseline(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print(f"\nNo regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+if __name__ == "__main__":
+    main()
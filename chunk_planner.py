@@ -0,0 +1,278 @@
+import json
+import os
+import platform
+import time
+import numpy as np
+from config import config
+from instrumentation import peak_rss_bytes
+
+FRAMES_PER_SECOND = 50 # Wav2Vec2 emits one logit frame per 320 samples at 16 kHz
+
+def plan_batches(lengths, batch_size=None, max_batch_samples=None):
+    """Group chunk indices into length-bucketed batches
+
+    Chunks are padded to the longest one in their batch, and models trained
+    without an attention mask see that padding, so a chunk's text depends on
+    which batch it lands in; plan once over a file's chunks and run (or
+    checkpoint) batch by batch rather than re-planning over parts of it.
+    """
+    batch_size = batch_size or config.BATCH_SIZE
+    max_batch_samples = max_batch_samples or config.MAX_BATCH_SAMPLES
+
+    # Longest first, so the first chunk of a batch sets its padded length
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    batches = []
+    current = []
+
+    for i in order:
+        padded_samples = lengths[current[0]] * (len(current) + 1) if current else lengths[i]
+        if current and (len(current) >= batch_size or padded_samples > max_batch_samples):
+            batches.append(current)
+            current = []
+        current.append(i)
+
+    if current:
+        batches.append(current)
+
+    return batches
+
+class CostModel:
+    """Forward-pass time and peak memory of a batch of B chunks of f frames each
+
+    seconds = o + B * (a*f + b*f^2) and memory_mb = m0 + B * (m1*f + m2*f^2),
+    where the quadratic terms are self-attention and the rest is the
+    convolutional front end, feed-forward layers and fixed per-call overhead.
+    """
+
+    def __init__(self, time_coefficients, memory_coefficients):
+        self.time_coefficients = [float(c) for c in time_coefficients]
+        self.memory_coefficients = [float(c) for c in memory_coefficients]
+
+    @staticmethod
+    def _evaluate(coefficients, batch, duration):
+        fixed, linear, quadratic = coefficients
+        frames = duration * FRAMES_PER_SECOND
+        return fixed + batch * (linear * frames + quadratic * frames * frames)
+
+    def seconds(self, batch, duration):
+        return self._evaluate(self.time_coefficients, batch, duration)
+
+    def memory_mb(self, batch, duration):
+        return self._evaluate(self.memory_coefficients, batch, duration)
+
+    def largest_batch(self, duration, memory_budget_mb):
+        """Most chunks of `duration` seconds one pass can take within the budget (0 if not even one fits)"""
+        batch = 0
+        while batch < config.PLANNER_MAX_BATCH_SIZE and self.memory_mb(batch + 1, duration) <= memory_budget_mb:
+            batch += 1
+        return batch
+
+    @classmethod
+    def fit(cls, samples):
+        """Least-squares fit to measured {"batch", "duration", "seconds", "memory_mb"} samples
+
+        Samples whose memory_mb is None (not measurable) only count towards the time fit.
+        """
+        fitted = []
+        for field in ("seconds", "memory_mb"):
+            measured = [s for s in samples if s[field] is not None]
+            rows = np.array([[1.0, s["batch"] * s["duration"] * FRAMES_PER_SECOND,
+                              s["batch"] * (s["duration"] * FRAMES_PER_SECOND) ** 2] for s in measured])
+            values = np.array([s[field] for s in measured])
+            coefficients = np.linalg.lstsq(rows, values, rcond=None)[0]
+            # Noise can push a term below zero; no cost actually shrinks with length
+            fitted.append(np.maximum(coefficients, 0.0))
+        return cls(*fitted)
+
+    def to_dict(self):
+        return {"time": self.time_coefficients, "memory": self.memory_coefficients}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["time"], data["memory"])
+
+class ChunkPlan:
+    """Chunk length and batch limits to use for one model on this machine"""
+
+    def __init__(self, chunk_duration, batch_size, max_batch_samples, memory_budget_mb, cost=None,
+                 overlap_duration=0.0):
+        self.chunk_duration = chunk_duration
+        self.overlap_duration = overlap_duration
+        self.batch_size = batch_size
+        self.max_batch_samples = max_batch_samples
+        self.memory_budget_mb = memory_budget_mb
+        self.cost = cost
+
+    def chunked_seconds(self, duration):
+        """Estimated inference time for `duration` seconds cut into planned chunks"""
+        step = self.chunk_duration - self.overlap_duration
+        chunks = max(1, int(np.ceil((duration - self.overlap_duration) / step)))
+        full_batches, remainder = divmod(chunks, self.batch_size)
+        seconds = full_batches * self.cost.seconds(self.batch_size, self.chunk_duration)
+        if remainder:
+            seconds += self.cost.seconds(remainder, self.chunk_duration)
+        return seconds
+
+    def should_chunk(self, num_samples):
+        """Whether cutting `num_samples` of audio into chunks beats one forward pass over all of it"""
+        duration = num_samples / config.SAMPLE_RATE
+        if self.cost is None:
+            # Uncalibrated: nothing predicts a saving, so only audio past the one-pass limit is cut
+            return duration > config.MAX_AUDIO_LENGTH
+        if duration <= self.chunk_duration:
+            return False
+        return (self.cost.memory_mb(1, duration) > self.memory_budget_mb
+                or self.chunked_seconds(duration) < self.cost.seconds(1, duration))
+
+    def batch_limits(self, duration):
+        """(batch_size, max_batch_samples) for chunks of `duration` seconds, e.g. chunks cut for another model"""
+        if self.cost is None:
+            return self.batch_size, self.max_batch_samples
+        batch = max(self.cost.largest_batch(duration, self.memory_budget_mb), 1)
+        return batch, int(batch * duration * config.SAMPLE_RATE)
+
+    def describe(self):
+        source = "calibrated" if self.cost else "default, not calibrated"
+        overlap = f" overlapping by {self.overlap_duration}s" if self.overlap_duration else ""
+        return (f"{self.chunk_duration}s chunks{overlap}, batches of up to {self.batch_size} "
+                f"({source}, budget {self.memory_budget_mb} MB)")
+
+class ChunkPlanner:
+    """Pick chunk length and batch size from a memory budget and a measured cost curve
+
+    `calibrate` times forward passes of synthetic audio at several lengths and
+    batch sizes, fits a CostModel and stores it per (model, backend, device)
+    in a JSON profile. `plan` then takes, for each candidate chunk length, the
+    largest batch whose predicted peak memory fits the budget and keeps the
+    length with the lowest predicted time per second of audio. Without a
+    profile it falls back to the fixed CHUNK_DURATION and BATCH_SIZE.
+    """
+
+    def __init__(self, profile_path=config.CHUNK_PROFILE_PATH, memory_budget_mb=config.CHUNK_MEMORY_BUDGET_MB):
+        self.profile_path = profile_path
+        self.memory_budget_mb = memory_budget_mb
+
+    @staticmethod
+    def profile_key(model_name, backend, device):
+        return f"{model_name}|{backend}|{device}"
+
+    def load_profiles(self):
+        try:
+            with open(self.profile_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    @staticmethod
+    def default_device(backend):
+        """The device SpeechRecognizer picks for this backend, found without loading a model"""
+        import torch
+        return "cuda" if torch.cuda.is_available() and backend in ("eager", "compile") else "cpu"
+
+    def plan(self, model_name, backend, device=None, overlap_duration=0.0):
+        """Plan for this model; with overlapping windows only the non-shared part of a window counts as progress"""
+        profiles = self.load_profiles()
+        if device is None and any(key.startswith(self.profile_key(model_name, backend, "")) for key in profiles):
+            device = self.default_device(backend)
+        profile = profiles.get(self.profile_key(model_name, backend, str(device)))
+        if profile is None:
+            return ChunkPlan(config.CHUNK_DURATION, config.BATCH_SIZE, config.MAX_BATCH_SAMPLES, self.memory_budget_mb,
+                             overlap_duration=overlap_duration)
+
+        # Hard cuts damage words at every boundary, so short chunks are only worth it with overlap
+        if overlap_duration > 0:
+            candidates = [d for d in config.CHUNK_CANDIDATE_DURATIONS if d > 2 * overlap_duration]
+        else:
+            candidates = [d for d in config.CHUNK_CANDIDATE_DURATIONS if d >= config.CHUNK_MIN_DURATION]
+        cost = CostModel.from_dict(profile["cost"])
+        best = None
+        for duration in candidates:
+            batch = cost.largest_batch(duration, self.memory_budget_mb)
+            if batch == 0:
+                continue
+            per_second = cost.seconds(batch, duration) / (batch * (duration - overlap_duration))
+            if best is None or per_second < best[0]:
+                best = (per_second, duration, batch)
+
+        if best is None:
+            # Nothing fits the budget; the shortest chunk one at a time is the least memory available
+            print(f"Warning: no chunk length fits the {self.memory_budget_mb} MB budget")
+            best = (None, min(candidates or config.CHUNK_CANDIDATE_DURATIONS), 1)
+        _, duration, batch = best
+        return ChunkPlan(duration, batch, int(batch * duration * config.SAMPLE_RATE), self.memory_budget_mb, cost,
+                         overlap_duration)
+
+    def _measure(self, speech_recognizer, batch, duration, repeat):
+        import torch
+        rng = np.random.default_rng(0)
+        chunks = [rng.normal(0, 0.1, int(duration * config.SAMPLE_RATE)).astype(np.float32) for _ in range(batch)]
+        cuda = speech_recognizer.device.type == "cuda"
+        if cuda:
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats()
+            baseline = torch.cuda.memory_allocated()
+
+        best = None
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            with torch.inference_mode():
+                speech_recognizer.compute_logits(chunks)
+            if cuda:
+                torch.cuda.synchronize()
+            seconds = time.perf_counter() - start_time
+            best = seconds if best is None else min(best, seconds)
+
+        if cuda:
+            memory_mb = (torch.cuda.max_memory_allocated() - baseline) / (1024 * 1024)
+        else:
+            # A high-water mark: it only shows this run's peak if no earlier run went higher (see calibrate)
+            memory_mb = peak_rss_bytes() / (1024 * 1024)
+        return {"batch": batch, "duration": duration, "seconds": best, "memory_mb": memory_mb}
+
+    def calibrate(self, speech_recognizer, model_name, backend, durations=(2, 5, 10, 20, 40, 80),
+                  batch_sizes=(1, 2, 4), max_batch_seconds=80, repeat=2):
+        """Profile forward passes on this machine, store the fitted cost curve and return the new plan"""
+        # Ordered by the quadratic (attention) term of the predicted peak, then the linear one
+        runs = sorted(((batch, duration) for batch in batch_sizes for duration in durations
+                       if batch * duration <= max_batch_seconds),
+                      key=lambda run: (run[0] * run[1] ** 2, run[0] * run[1]))
+        # Warm up (lazy init, compilation), then take the memory baseline
+        self._measure(speech_recognizer, 1, durations[0], 1)
+        baseline_mb = peak_rss_bytes() / (1024 * 1024)
+
+        samples = []
+        largest = (0, 0)
+        for batch, duration in runs:
+            sample = self._measure(speech_recognizer, batch, duration, repeat)
+            if speech_recognizer.device.type != "cuda":
+                # ru_maxrss never falls, so it is this run's peak only if both terms of the predicted peak
+                # are at least those of every earlier run; otherwise the run is left out of the memory fit
+                terms = (batch * duration ** 2, batch * duration)
+                if terms[0] >= largest[0] and terms[1] >= largest[1]:
+                    sample["memory_mb"] = max(sample["memory_mb"] - baseline_mb, 0.0)
+                else:
+                    sample["memory_mb"] = None
+                largest = (max(largest[0], terms[0]), max(largest[1], terms[1]))
+            peak = "n/a" if sample["memory_mb"] is None else f"+{sample['memory_mb']:.0f} MB"
+            print(f"  batch {batch} x {duration:>3}s: {sample['seconds']:.3f}s, peak {peak}")
+            samples.append(sample)
+
+        cost = CostModel.fit(samples)
+        device = str(speech_recognizer.device)
+        profiles = self.load_profiles()
+        profiles[self.profile_key(model_name, backend, device)] = {
+            "model": model_name,
+            "backend": backend,
+            "device": device,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "created": time.time(),
+            "cost": cost.to_dict(),
+            "samples": samples
+        }
+        os.makedirs(os.path.dirname(self.profile_path) or ".", exist_ok=True)
+        tmp_path = f"{self.profile_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(profiles, f, indent=2)
+        os.replace(tmp_path, self.profile_path)
+        return self.plan(model_name, backend, device)
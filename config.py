@@ -4,17 +4,118 @@ class Config:
     # Audio Settings
     SAMPLE_RATE = 16000
     CHUNK_DURATION = 30 # Seconds per Chunk
-    MAX_AUDIO_LENGTH = 300 # maximum audio length in seconds
+    MAX_AUDIO_LENGTH = 300 # Longer files are decoded and transcribed as a stream
+    CHUNK_OVERLAP_DURATION = float(os.getenv("CHUNK_OVERLAP_DURATION", "0")) # Seconds shared by neighbouring windows; 0 cuts hard
+
+    # Decoder settings
+    RESAMPLE_QUALITY = "MQ" # soxr quality for WAV/FLAC resampling: QQ, LQ, MQ, HQ, VHQ
+
+    # Streaming loader settings
+    LOADER_BLOCK_DURATION = 10 # Seconds decoded per block
+    LOADER_WINDOW_DURATION = 60 # Seconds per VAD window when streaming
+
+    # Batched inference settings
+    BATCH_SIZE = int(os.getenv("BATCH_SIZE", "8")) # Max chunks per forward pass
+    MAX_BATCH_SAMPLES = int(os.getenv("MAX_BATCH_SAMPLES", str(8 * 30 * 16000))) # Max padded samples per batch
+
+    # Adaptive chunk planning; calibrate a model on this machine with `python main.py --calibrate`
+    CHUNK_MEMORY_BUDGET_MB = int(os.getenv("CHUNK_MEMORY_BUDGET_MB", "2048")) # Peak inference memory per batch
+    CHUNK_CANDIDATE_DURATIONS = (5, 10, 15, 20, 30, 45, 60) # Chunk lengths (seconds) the planner chooses from
+    CHUNK_MIN_DURATION = 10 # Shortest planned chunk when chunks are cut without overlap
+    PLANNER_MAX_BATCH_SIZE = 32
+
+    # Voice activity detection settings
+    VAD_ENABLED = True
+    VAD_FRAME_DURATION = 0.03 # Seconds per analysis frame
+    VAD_ENERGY_MARGIN_DB = 12 # Speech must be this far above the noise floor
+    VAD_FLATNESS_THRESHOLD = 0.5 # Frames flatter than this look like noise
+    VAD_MIN_SILENCE = 0.5 # Shorter pauses are kept inside a speech region
+    VAD_MIN_SPEECH = 0.25 # Shorter bursts are discarded
+    VAD_PADDING = 0.2 # Seconds kept around each speech region
+
+    # Pipelined mode settings
+    PIPELINE_QUEUE_SIZE = 4 # Chunks buffered between stages before the producer blocks
+
+    # Streamlit app settings
+    APP_JOB_WORKERS = 2 # Background transcription jobs running at once (inference itself is serialized)
+
+    # Batch mode settings
+    BATCH_WORKERS = max(1, (os.cpu_count() or 1) // 4) # Worker processes, each pinned to a share of the cores
+
+    # Transcription server settings
+    SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+    SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+    SERVER_MAX_BATCH_SIZE = BATCH_SIZE # Chunks merged across requests per forward pass
+    SERVER_MAX_WAIT = 0.05 # Seconds a chunk may wait for others to fill its batch
+    SERVER_LATENCY_SLO = float(os.getenv("SERVER_LATENCY_SLO", "10")) # Target request latency; 0 disables
+    SERVER_MAX_QUEUE_CHUNKS = 256 # Waiting chunks before new requests are rejected
+    SERVER_MAX_UPLOAD_BYTES = 200 * 1024 * 1024
+
+    # Sharded single-file settings
+    SHARD_WORKERS = max(1, (os.cpu_count() or 1) // 4) # Processes sharing one file's chunks, each pinned to its cores
+    SHARD_CHUNKS = 4 # Chunks per task sent to a worker
+
+    # Streaming settings
+    STREAM_STEP_DURATION = 0.5 # Seconds of new audio between partial hypotheses
+    STREAM_SEGMENT_DURATION = 5 # Seconds of audio before a segment is finalized
+    STREAM_CONTEXT_DURATION = 1 # Seconds of finalized audio kept as left context
+    STREAM_LATENCY_TARGET = 0.5 # Seconds allowed per model update
 
     # Model settings
     SPEECH_MODEL_NAME = "facebook/wav2vec2-base-960h"  # Alternative to Whisper
     # Other options: "facebook/wav2vec2-large-960h-lv60-self", "patrickvonplaten/wav2vec2-large-960h-lv60-self"
+    AVAILABLE_MODELS = [
+        "facebook/wav2vec2-base-960h",
+        "facebook/wav2vec2-large-960h-lv60-self",
+        "patrickvonplaten/wav2vec2-large-960h-lv60-self"
+    ]
+    MAX_RESIDENT_MODELS = int(os.getenv("MAX_RESIDENT_MODELS", "2")) # Models kept in memory by the registry
+
+    # Cascade: chunks the base model is unsure about are re-run on the large model
+    CASCADE_LARGE_MODEL = "facebook/wav2vec2-large-960h-lv60-self"
+    CASCADE_CONFIDENCE_THRESHOLD = float(os.getenv("CASCADE_CONFIDENCE_THRESHOLD", "0.85")) # Mean token probability
+
+    # Inference backend: "eager" (fp32), "int8" (dynamic quantization), "compile" (torch.compile) or "onnx"
+    INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "eager")
 
     # Groq API settings
     GROQ_API_KEY = os.getenv("GROQ_API_KEY", "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")
     GROQ_MODEL = "llama-3.3-70b-versatile"  # or "mixtral-8x7b-32768", "gemma-7b-it"
+    GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") # Point at a local stand-in server for testing
+    GROQ_CHUNKED_CORRECTION = True
+    GROQ_SEGMENT_TOKENS = 600 # Input token budget per correction segment
+    GROQ_SEGMENT_OVERLAP_TOKENS = 40 # Context carried over from the previous segment
+    GROQ_CONCURRENCY = 4 # Concurrent correction and summary requests
+    GROQ_SUMMARY_SECTION_TOKENS = 3000 # Input token budget per summary call; longer text is map-reduced
+    GROQ_SUMMARY_TOKENS = 300 # Output budget per (partial) summary
+    GROQ_MAX_RETRIES = 3
+    GROQ_RETRY_BACKOFF = 0.5 # Seconds before the first retry, doubled each time
+    GROQ_CACHE_MODE = os.getenv("GROQ_CACHE_MODE", "on") # "on", "off", or "only" for offline replays
+    GROQ_CACHE_TTL = 30 * 24 * 3600 # Seconds before a cached response expires
+    GROQ_CACHE_MAX_BYTES = 64 * 1024 * 1024
+    GROQ_SUMMARY_MEMO = os.getenv("GROQ_SUMMARY_MEMO", "1") == "1" # Keep partial summaries even with the cache off
+    GROQ_SUMMARY_MEMO_MAX_BYTES = 16 * 1024 * 1024
+
+    # Instrumentation settings
+    INSTRUMENTATION_ENABLED = os.getenv("INSTRUMENTATION", "0") == "1" # Per-stage timing and metrics
+    INSTRUMENTATION_LOG = os.getenv("INSTRUMENTATION_LOG") # JSON-lines event log, one line per stage run
+
+    # Transcription cache settings
+    CACHE_ENABLED = True
+    CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+    # Job journal: per-chunk results of unfinished files, so a re-run resumes instead of starting over
+    JOURNAL_ENABLED = os.getenv("JOURNAL", "1") == "1"
+    JOURNAL_GROUP_CHUNKS = 4 * BATCH_SIZE # Overlapping windows stitched between checkpoints (chunks checkpoint per batch)
 
     # File paths
     TEMP_AUDIO_DIR = "temp_audio"
+    CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+    TRANSCRIPTION_CACHE_DIR = os.path.join(CACHE_DIR, "transcriptions")
+    GROQ_CACHE_DIR = os.path.join(CACHE_DIR, "groq")
+    GROQ_SUMMARY_MEMO_DIR = os.path.join(CACHE_DIR, "summaries")
+    MODEL_CACHE_DIR = os.path.join(CACHE_DIR, "models")
+    JOURNAL_DIR = os.path.join(CACHE_DIR, "journal")
+    CHUNK_PROFILE_PATH = os.path.join(CACHE_DIR, "chunk_profiles.json")
 
 config = Config()
\ No newline at end of file
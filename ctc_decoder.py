@@ -0,0 +1,211 @@
+import numpy as np
+
+class CTCDecoder:
+    """Greedy CTC decoding of whole batches of argmax ids, with word start/end times
+
+    Collapsing repeats, dropping blanks and splitting on the word delimiter are
+    array operations over the batch; Python only runs once per emitted word to
+    build the strings, instead of once per frame inside the tokenizer.
+    """
+
+    def __init__(self, tokenizer, frame_duration):
+        self.frame_duration = frame_duration
+        self.blank_id = tokenizer.pad_token_id
+        self.delimiter_id = tokenizer.word_delimiter_token_id
+
+        vocab = tokenizer.get_vocab()
+        self.tokens = np.full(max(vocab.values()) + 1, "", dtype=object)
+        for token, index in vocab.items():
+            self.tokens[index] = token
+        # Special tokens other than the delimiter never appear in the text
+        skipped = set(tokenizer.all_special_ids) - {self.delimiter_id}
+        self.skip = np.zeros(len(self.tokens), dtype=bool)
+        self.skip[list(skipped)] = True
+
+    def decode(self, ids, lengths=None):
+        """Decode a [batch, frames] id array; returns a list of (text, words) per row
+
+        `words` are dicts with "word", "start" and "end" in seconds from the start
+        of the row. Frames at or beyond a row's length are padding and ignored.
+        """
+        ids = np.asarray(ids)
+        if ids.ndim == 1:
+            ids = ids[None, :]
+        batch, frames = ids.shape
+        if lengths is None:
+            lengths = np.full(batch, frames)
+        lengths = np.asarray(lengths).reshape(-1, 1)
+
+        frame_index = np.arange(frames)
+        valid = frame_index[None, :] < lengths
+        # A frame starts a new token when it differs from the previous frame
+        changed = np.ones_like(ids, dtype=bool)
+        changed[:, 1:] = ids[:, 1:] != ids[:, :-1]
+        starts = changed & valid
+
+        # Each run ends where the next run starts (or at the row length)
+        run_rows, run_starts = np.nonzero(starts)
+        run_ids = ids[run_rows, run_starts]
+        run_ends = np.empty_like(run_starts)
+        run_ends[:-1] = run_starts[1:]
+        last_of_row = np.ones(len(run_rows), dtype=bool)
+        last_of_row[:-1] = run_rows[1:] != run_rows[:-1]
+        run_ends[last_of_row] = lengths[run_rows[last_of_row], 0]
+
+        emitted = (run_ids != self.blank_id) & ~self.skip[run_ids]
+        run_rows, run_starts, run_ends, run_ids = (
+            run_rows[emitted], run_starts[emitted], run_ends[emitted], run_ids[emitted])
+
+        # Words are the runs of characters between delimiters
+        is_delimiter = run_ids == self.delimiter_id
+        new_row = np.ones(len(run_rows), dtype=bool)
+        new_row[1:] = run_rows[1:] != run_rows[:-1]
+        word_ids = np.cumsum(is_delimiter | new_row)
+        chars = ~is_delimiter
+
+        results = [("", []) for _ in range(batch)]
+        if not chars.any():
+            return results
+
+        char_rows = run_rows[chars]
+        char_words = word_ids[chars]
+        char_tokens = self.tokens[run_ids[chars]]
+        boundaries = np.flatnonzero(np.diff(char_words)) + 1
+        word_starts = np.concatenate([[0], boundaries])
+        word_ends = np.concatenate([boundaries, [len(char_words)]])
+        first_frames = run_starts[chars][word_starts]
+        last_frames = run_ends[chars][word_ends - 1]
+
+        words_by_row = [[] for _ in range(batch)]
+        for row, begin, end, first, last in zip(char_rows[word_starts], word_starts, word_ends,
+                                                first_frames, last_frames):
+            words_by_row[row].append({
+                "word": "".join(char_tokens[begin:end]),
+                "start": round(float(first) * self.frame_duration, 3),
+                "end": round(float(last) * self.frame_duration, 3)
+            })
+
+        return [(" ".join(word["word"] for word in words), words) for words in words_by_row]
+
+    def cut_frame(self, ids, lo, hi):
+        """Frame in [lo, hi) at which to split one id sequence into two decodes, between words if it can
+
+        Takes the word delimiter nearest the middle, else the nearest blank,
+        else the middle itself. Only the ids inside the range are looked at, so
+        two decodes that agree on them pick the same frame.
+        """
+        if hi <= lo:
+            return lo
+        middle = (lo + hi) // 2
+        order = lo + np.argsort(np.abs(np.arange(lo, hi) - middle), kind="stable")
+        for token in (self.delimiter_id, self.blank_id):
+            hits = order[np.asarray(ids)[order] == token]
+            if len(hits):
+                return int(hits[0])
+        return middle
+
+class WindowStitcher:
+    """Merge log-probabilities of overlapping windows into one frame sequence
+
+    Each window is placed at its frame offset and cross-faded with its
+    neighbours over the frames they share, so every frame is taken mostly
+    from the window where it has the most context. Windows can be added in
+    any order, e.g. as their length-bucketed batches come back.
+
+    A long recording can be stitched a range of windows at a time: adding
+    just the windows `overlapping` the range and calling `decode` with it
+    gives the same text as stitching everything and decoding once, and
+    consecutive ranges meet at the same cut frame.
+    """
+
+    def __init__(self, starts, frames, total_frames):
+        self.starts = list(starts)
+        self.frames = list(frames)
+        self.ends = [start + n for start, n in zip(self.starts, self.frames)]
+        self.merged = None
+        self.weight_sum = np.zeros(total_frames, dtype=np.float32)
+
+    @staticmethod
+    def window_weights(frames, ramp_in, ramp_out):
+        """Cross-fade weights: linear ramps over the frames shared with the previous and next window"""
+        position = np.arange(frames) + 0.5
+        weights = np.ones(frames, dtype=np.float32)
+        if ramp_in:
+            weights = np.minimum(weights, position / ramp_in)
+        if ramp_out:
+            weights = np.minimum(weights, (frames - position) / ramp_out)
+        return weights
+
+    def add(self, k, log_probs):
+        """Add the [frames, vocab] log-probabilities of window `k`; padding frames past its length are dropped"""
+        if self.merged is None:
+            self.merged = np.zeros((len(self.weight_sum), log_probs.shape[-1]), dtype=np.float32)
+        start = self.starts[k]
+        n = min(self.frames[k], len(log_probs))
+        ramp_in = max(0, self.ends[k - 1] - start) if k > 0 else 0
+        ramp_out = max(0, self.ends[k] - self.starts[k + 1]) if k + 1 < len(self.starts) else 0
+        weights = self.window_weights(n, ramp_in, ramp_out)
+        self.merged[start:start + n] += weights[:, None] * log_probs[:n]
+        self.weight_sum[start:start + n] += weights
+
+    def predicted_ids(self, blank_id):
+        """Greedy ids of the merged frames; frames no window covered are blank"""
+        if self.merged is None:
+            return np.full(len(self.weight_sum), blank_id)
+        predicted_ids = np.argmax(self.merged, axis=-1)
+        predicted_ids[self.weight_sum == 0] = blank_id
+        return predicted_ids
+
+    def overlapping(self, first, last):
+        """Windows sharing frames with windows first..last-1; those are all that decoding the range needs"""
+        lo, hi = self.starts[first], self.ends[last - 1]
+        return [k for k in range(len(self.starts)) if self.starts[k] < hi and self.ends[k] > lo]
+
+    def decode(self, decoder, first=0, last=None):
+        """(text, words) of windows first..last-1, word times in seconds from frame 0
+
+        The range is cut from its neighbours inside the frames it shares with
+        them (see CTCDecoder.cut_frame), so decoding consecutive ranges splits
+        the text the way one decode of all windows would. A cut side gets a
+        space when a word delimiter lies between it and the nearest character;
+        without one the cut went through a word, which `join_ranges` mends.
+        """
+        last = len(self.starts) if last is None else last
+        predicted_ids = self.predicted_ids(decoder.blank_id)
+        lo = decoder.cut_frame(predicted_ids, self.starts[first], self.ends[first - 1]) if first > 0 else 0
+        hi = (decoder.cut_frame(predicted_ids, self.starts[last], self.ends[last - 1])
+              if last < len(self.starts) else len(self.weight_sum))
+        ids = predicted_ids[lo:hi]
+        text, words = decoder.decode(ids)[0]
+
+        is_delimiter = ids == decoder.delimiter_id
+        chars = np.flatnonzero((ids != decoder.blank_id) & ~is_delimiter & ~decoder.skip[ids])
+        head = is_delimiter[:chars[0]] if len(chars) else is_delimiter
+        tail = is_delimiter[chars[-1]:] if len(chars) else is_delimiter
+        if lo > 0 and head.any():
+            text = " " + text
+        if hi < len(self.weight_sum) and tail.any():
+            text = text + " "
+        return text, offset_words(words, lo * decoder.frame_duration)
+
+def join_ranges(results):
+    """Join the (text, words) of consecutive WindowStitcher.decode ranges into one (text, words)
+
+    Where neither side of a cut has a space the cut went through a word, and
+    its two halves are glued back together.
+    """
+    text = ""
+    words = []
+    for part, part_words in results:
+        if words and part_words and not text.endswith(" ") and not part.startswith(" "):
+            words[-1] = {**words[-1], "word": words[-1]["word"] + part_words[0]["word"],
+                         "end": part_words[0]["end"]}
+            part_words = part_words[1:]
+        text += part
+        words.extend(part_words)
+    return " ".join(text.split()), words
+
+def offset_words(words, offset_seconds):
+    """Shift chunk-relative word times to absolute file time"""
+    return [{**word, "start": round(word["start"] + offset_seconds, 3),
+             "end": round(word["end"] + offset_seconds, 3)} for word in words]
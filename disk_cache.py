@@ -0,0 +1,116 @@
+import json
+import os
+import threading
+import time
+
+class DiskCache:
+    """Size-bounded JSON cache on disk with LRU eviction by access time and optional TTL"""
+
+    def __init__(self, cache_dir, max_bytes, ttl=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.stats = {}
+        os.makedirs(cache_dir, exist_ok=True)
+        self.total_bytes = sum(size for _, size, _ in self._entries())
+
+    def _path(self, namespace, key):
+        return os.path.join(self.cache_dir, namespace, key[:2], f"{key}.json")
+
+    def _entries(self):
+        """Yield (path, size, last_access) for every cached entry"""
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _count(self, namespace, field):
+        counters = self.stats.setdefault(namespace, {"hits": 0, "misses": 0, "writes": 0, "expired": 0})
+        counters[field] += 1
+
+    def get(self, namespace, key):
+        """Return the cached value or None, refreshing its LRU position on a hit"""
+        path = self._path(namespace, key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            with self.lock:
+                self._count(namespace, "misses")
+            return None
+
+        if self.ttl is not None and time.time() - entry.get("created", 0) > self.ttl:
+            self.delete(namespace, key)
+            with self.lock:
+                self._count(namespace, "expired")
+                self._count(namespace, "misses")
+            return None
+
+        # The mtime doubles as the last-access time for eviction
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        with self.lock:
+            self._count(namespace, "hits")
+        return entry["value"]
+
+    def set(self, namespace, key, value):
+        """Write an entry atomically and evict old entries if over budget"""
+        path = self._path(namespace, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps({"created": time.time(), "value": value}, ensure_ascii=False).encode("utf-8")
+
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        previous = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            self._count(namespace, "writes")
+            self.total_bytes += len(data) - previous
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def delete(self, namespace, key):
+        """Remove a single entry if present"""
+        path = self._path(namespace, key)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        with self.lock:
+            self.total_bytes -= size
+
+    def _evict(self):
+        """Drop least recently used entries until back under 90% of the budget"""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        self.total_bytes = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+
+        for path, size, _ in entries:
+            if self.total_bytes <= target:
+                break
+            try:
+                os.remove(path)
+                self.total_bytes -= size
+            except FileNotFoundError:
+                pass
+
+    def report(self):
+        """Hit/miss counters per namespace plus the current size"""
+        with self.lock:
+            namespaces = {}
+            for namespace, counters in self.stats.items():
+                lookups = counters["hits"] + counters["misses"]
+                namespaces[namespace] = {**counters, "hit_rate": counters["hits"] / lookups if lookups else 0.0}
+            return {"bytes": self.total_bytes, "max_bytes": self.max_bytes, "namespaces": namespaces}
@@ -1,13 +1,169 @@
-from groq import Groq
+import asyncio
+import hashlib
+import json
+import random
+import re
 from config import config
+from disk_cache import DiskCache
+from instrumentation import instrumentation
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+WHITESPACE = re.compile(r"\s+")
+CHARS_PER_TOKEN = 4
+
+def normalize_text(text):
+    """Collapse whitespace so trivially different inputs share a cache entry"""
+    return WHITESPACE.sub(" ", text).strip()
+
+def estimate_tokens(text):
+    """Rough token count for budgeting (about 4 characters per token)"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def _split_words(text, max_chars):
+    """Greedy word groups of at most max_chars characters"""
+    pieces = []
+    current = []
+    length = 0
+    for word in text.split():
+        if current and length + len(word) + 1 > max_chars:
+            pieces.append(" ".join(current))
+            current = []
+            length = 0
+        current.append(word)
+        length += len(word) + 1
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+def split_segments(text, max_tokens=config.GROQ_SEGMENT_TOKENS, overlap_tokens=config.GROQ_SEGMENT_OVERLAP_TOKENS):
+    """Split text at sentence boundaries into (context, segment) pairs within a token budget"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+
+    # Raw CTC output has no punctuation, so oversized sentences fall back to word groups
+    pieces = []
+    for sentence in SENTENCE_BOUNDARY.split(text.strip()):
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+        else:
+            pieces.extend(_split_words(sentence, max_chars))
+
+    segments = []
+    current = []
+    length = 0
+    for piece in pieces:
+        if current and length + len(piece) + 1 > max_chars:
+            segments.append(" ".join(current))
+            current = []
+            length = 0
+        current.append(piece)
+        length += len(piece) + 1
+    if current:
+        segments.append(" ".join(current))
+
+    return [(segment_context(segments[i - 1], overlap_tokens) if i > 0 else "", segment)
+            for i, segment in enumerate(segments)]
+
+def segment_context(previous, overlap_tokens=config.GROQ_SEGMENT_OVERLAP_TOKENS):
+    """The tail of the previous segment, from a word start, passed along as read-only context"""
+    overlap_chars = overlap_tokens * CHARS_PER_TOKEN
+    if overlap_chars <= 0:
+        return ""
+    tail = previous[-overlap_chars:]
+    return tail.split(" ", 1)[-1] if " " in tail else tail
+
+def run_coroutine(coro):
+    """Run a coroutine from sync code, even when an event loop is already running"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    # Inside a running loop (e.g. Jupyter): use a helper thread with its own loop
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
 
 class GroqPostProcessor:
     def __init__(self):
-        self.client = Groq(api_key=config.GROQ_API_KEY)
+        self._client = None
         self.model = config.GROQ_MODEL
+        self.stats = {"requests": 0, "retries": 0, "failures": 0}
+        self.cache_mode = config.GROQ_CACHE_MODE
+        self.response_cache = None
+        if self.cache_mode != "off":
+            self.response_cache = DiskCache(config.GROQ_CACHE_DIR, config.GROQ_CACHE_MAX_BYTES,
+                                            ttl=config.GROQ_CACHE_TTL)
+        # Partial summaries of a long transcript, kept whatever the response cache mode
+        self.summary_memo = None
+        if config.GROQ_SUMMARY_MEMO:
+            self.summary_memo = DiskCache(config.GROQ_SUMMARY_MEMO_DIR, config.GROQ_SUMMARY_MEMO_MAX_BYTES,
+                                          ttl=config.GROQ_CACHE_TTL)
         
-    def correct_transcription(self, text):
-        """Use LLM to correct and improve transcription"""
+    @property
+    def client(self):
+        """Groq client, created (and the SDK imported) on first use"""
+        if self._client is None:
+            from groq import Groq
+            self._client = Groq(api_key=config.GROQ_API_KEY, base_url=config.GROQ_BASE_URL)
+        return self._client
+
+    def _cache_key(self, messages, max_tokens, temperature):
+        """Model, rendered prompt (template plus normalized input) and sampling settings"""
+        payload = json.dumps({
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }, sort_keys=True)
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=20).hexdigest()
+
+    def _cached(self, namespace, key):
+        """Return a cached response, or raise in cache-only mode when there is none"""
+        cached = self.response_cache.get(namespace, key) if self.response_cache else None
+        if cached is None and self.cache_mode == "only":
+            raise Exception("No cached response available (cache-only mode)")
+        return cached
+
+    def _complete(self, namespace, messages, max_tokens, temperature=0.1):
+        """One chat completion, served from the response cache when possible"""
+        key = self._cache_key(messages, max_tokens, temperature)
+        cached = self._cached(namespace, key)
+        if cached is not None:
+            return cached
+
+        self.stats["requests"] += 1
+        with instrumentation.stage("llm", bytes=len(json.dumps(messages)), call=namespace):
+            completion = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+        content = completion.choices[0].message.content.strip()
+        if self.response_cache:
+            self.response_cache.set(namespace, key, content)
+        return content
+
+    def cache_report(self):
+        """Response cache hit rates per call type"""
+        return self.response_cache.report() if self.response_cache else {}
+
+    def correct_transcription(self, text, journal=None):
+        """Use LLM to correct and improve transcription
+
+        With a JobJournal, corrections already journaled are reused and new ones
+        are journaled as they arrive.
+        """
+        text = normalize_text(text)
+
+        # Long transcripts would be truncated by max_tokens, so correct them in segments
+        if config.GROQ_CHUNKED_CORRECTION and estimate_tokens(text) > config.GROQ_SEGMENT_TOKENS:
+            return self.correct_transcription_chunked(text, journal)
+
+        journaled = journal.corrected("", text) if journal else None
+        if journaled is not None:
+            return journaled
+
         prompt = f"""
         Please correct and improve the following speech transcription. 
         Fix any grammatical errors, punctuation, and make it more readable.
@@ -19,24 +175,135 @@ class GroqPostProcessor:
         """
         
         try:
-            completion = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that corrects speech transcriptions."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,
-                max_tokens=1000
-            )
-            
-            return completion.choices[0].message.content.strip()
+            corrected = self._complete("correction", [
+                {"role": "system", "content": "You are a helpful assistant that corrects speech transcriptions."},
+                {"role": "user", "content": prompt}
+            ], max_tokens=1000)
+            if journal:
+                journal.record_corrected("", text, corrected)
+            return corrected
             
         except Exception as e:
             print(f"Groq API error: {e}")
             return text  # Return original text if API fails
+
+    def _segment_prompt(self, context, segment):
+        context_note = ""
+        if context:
+            context_note = f"""
+        The transcription continues from this earlier text, which is given only as context
+        and must not be repeated: {context}
+        """
+        return f"""
+        Please correct and improve the following speech transcription. 
+        Fix any grammatical errors, punctuation, and make it more readable.
+        Return only the corrected text without any additional commentary.
+        {context_note}
+        Transcription: {segment}
+        
+        Corrected transcription:
+        """
+
+    def _segment_messages(self, context, segment):
+        return [
+            {"role": "system", "content": "You are a helpful assistant that corrects speech transcriptions."},
+            {"role": "user", "content": self._segment_prompt(context, segment)}
+        ]
+
+    def correct_segment(self, context, segment, journal=None):
+        """Correct one (context, segment) pair of split_segments, from sync code such as a worker thread
+
+        Goes through the concurrent path, so it shares its prompt, response
+        cache entries, journal records and retries of rate limits and server
+        errors, and keeps the segment as it is if the call still fails.
+        """
+        return run_coroutine(self._correct_segments([(context, segment)], journal))[0]
+
+    def _is_retryable(self, error):
+        import groq
+        if isinstance(error, groq.APIConnectionError):
+            return True
+        if isinstance(error, groq.APIStatusError):
+            return error.status_code == 429 or error.status_code >= 500
+        return False
+
+    async def _complete_async(self, client, semaphore, namespace, messages, max_tokens, temperature=0.1):
+        """One chat completion with caching, bounded concurrency and exponential backoff"""
+        key = self._cache_key(messages, max_tokens, temperature)
+        cached = self._cached(namespace, key)
+        if cached is not None:
+            return cached
+
+        delay = config.GROQ_RETRY_BACKOFF
+        # Spans the retries and backoff too, so the recorded time is what the caller waited
+        with instrumentation.stage("llm", bytes=len(json.dumps(messages)), call=namespace) as span:
+            for attempt in range(config.GROQ_MAX_RETRIES + 1):
+                try:
+                    async with semaphore:
+                        self.stats["requests"] += 1
+                        completion = await client.chat.completions.create(
+                            model=self.model,
+                            messages=messages,
+                            temperature=temperature,
+                            max_tokens=max_tokens
+                        )
+                    content = completion.choices[0].message.content.strip()
+                    if self.response_cache:
+                        self.response_cache.set(namespace, key, content)
+                    return content
+                except Exception as e:
+                    if attempt == config.GROQ_MAX_RETRIES or not self._is_retryable(e):
+                        raise
+                    self.stats["retries"] += 1
+                    span.retries += 1
+                    await asyncio.sleep(delay * (1 + random.random()))
+                    delay *= 2
+
+    async def _correct_segments(self, segments, journal=None):
+        # One pooled client per run; retries are handled above, not by the SDK
+        from groq import AsyncGroq
+        client = AsyncGroq(api_key=config.GROQ_API_KEY, base_url=config.GROQ_BASE_URL, max_retries=0)
+        semaphore = asyncio.Semaphore(config.GROQ_CONCURRENCY)
+
+        async def correct(context, segment):
+            journaled = journal.corrected(context, segment) if journal else None
+            if journaled is not None:
+                return journaled
+            try:
+                corrected = await self._complete_async(client, semaphore, "correction",
+                                                       self._segment_messages(context, segment),
+                                                       2 * config.GROQ_SEGMENT_TOKENS)
+                if journal:
+                    journal.record_corrected(context, segment, corrected)
+                return corrected
+            except Exception as e:
+                self.stats["failures"] += 1
+                print(f"Groq API error on segment: {e}")
+                return segment  # Keep the original text for this segment only
+
+        try:
+            return await asyncio.gather(*(correct(context, segment) for context, segment in segments))
+        finally:
+            await client.close()
+
+    def correct_transcription_chunked(self, text, journal=None):
+        """Correct a long transcription segment by segment, concurrently, in order"""
+        segments = split_segments(normalize_text(text), config.GROQ_SEGMENT_TOKENS, config.GROQ_SEGMENT_OVERLAP_TOKENS)
+        print(f"Correcting {len(segments)} segments with concurrency {config.GROQ_CONCURRENCY}...")
+        corrected = run_coroutine(self._correct_segments(segments, journal))
+        return " ".join(part for part in corrected if part)
     
     def summarize_text(self, text):
         """Optional: Summarize long transcriptions"""
+        text = normalize_text(text)
+        # Beyond one prompt's budget, summarize sections and then the summaries
+        if estimate_tokens(text) > config.GROQ_SUMMARY_SECTION_TOKENS:
+            try:
+                return self.summarize_map_reduce(text)
+            except Exception as e:
+                print(f"Groq API error: {e}")
+                return "Summary not available"
+
         prompt = f"""
         Please provide a concise summary of the following text:
         
@@ -46,18 +313,105 @@ class GroqPostProcessor:
         """
         
         try:
-            completion = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that summarizes text."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,
-                max_tokens=500
-            )
-            
-            return completion.choices[0].message.content.strip()
+            return self._complete("summary", [
+                {"role": "system", "content": "You are a helpful assistant that summarizes text."},
+                {"role": "user", "content": prompt}
+            ], max_tokens=500)
             
         except Exception as e:
             print(f"Groq API error: {e}")
-            return "Summary not available"
\ No newline at end of file
+            return "Summary not available"
+
+    def _summary_messages(self, text, combine):
+        if combine:
+            instruction = ("Combine these summaries of consecutive parts of one transcript, given in order, "
+                           "into a single concise summary of the whole that keeps the order of events:")
+        else:
+            instruction = "Please provide a concise summary of the following part of a longer transcript:"
+        return [
+            {"role": "system", "content": "You are a helpful assistant that summarizes text."},
+            {"role": "user", "content": f"""
+        {instruction}
+        
+        {text}
+        
+        Summary:
+        """}
+        ]
+
+    def _group_summaries(self, summaries, max_tokens):
+        """Pack consecutive summaries into groups within the token budget, at least two per group
+
+        Only the last group can hold a single summary, when the one before it is full.
+        """
+        groups = []
+        current = []
+        length = 0
+        for summary in summaries:
+            tokens = estimate_tokens(summary)
+            if len(current) >= 2 and length + tokens > max_tokens:
+                groups.append(current)
+                current = []
+                length = 0
+            current.append(summary)
+            length += tokens
+        if current:
+            groups.append(current)
+        return groups
+
+    async def _summarize_levels(self, sections, section_tokens):
+        from groq import AsyncGroq
+        client = AsyncGroq(api_key=config.GROQ_API_KEY, base_url=config.GROQ_BASE_URL, max_retries=0)
+        semaphore = asyncio.Semaphore(config.GROQ_CONCURRENCY)
+
+        async def summarize(text, combine):
+            messages = self._summary_messages(text, combine)
+            key = self._cache_key(messages, config.GROQ_SUMMARY_TOKENS, 0.1)
+            memo = self.summary_memo.get("partial", key) if self.summary_memo else None
+            if memo is not None:
+                return memo
+            summary = await self._complete_async(client, semaphore, "summary", messages, config.GROQ_SUMMARY_TOKENS)
+            if self.summary_memo:
+                self.summary_memo.set("partial", key, summary)
+            return summary
+
+        async def combine(group):
+            # A summary left on its own goes up a level as it is; summarizing it again would only lose detail
+            if len(group) == 1:
+                return group[0]
+            return await summarize("\n\n".join(group), True)
+
+        try:
+            # Map: every section on its own, concurrently
+            summaries = await asyncio.gather(*(summarize(section, False) for section in sections))
+            levels = [len(summaries)]
+            calls = len(summaries)
+            # Reduce: combine neighbouring summaries until one is left
+            while len(summaries) > 1:
+                groups = self._group_summaries(summaries, section_tokens)
+                summaries = await asyncio.gather(*(combine(group) for group in groups))
+                levels.append(len(summaries))
+                calls += sum(len(group) > 1 for group in groups)
+            return summaries[0], levels, calls
+        finally:
+            await client.close()
+
+    def summarize_map_reduce(self, text, section_tokens=config.GROQ_SUMMARY_SECTION_TOKENS):
+        """Summarize token-budgeted sections concurrently, then combine the summaries level by level
+
+        Sections are packed greedily from the start and every partial summary
+        is memoized on its prompt (model, input text and whether it combines
+        summaries) in its own store, independent of the response cache mode,
+        so when text is appended only the calls covering the changed tail are
+        made again.
+        """
+        sections = [segment for _, segment in split_segments(normalize_text(text), section_tokens, 0)]
+        if not sections:
+            return ""
+        print(f"Summarizing {len(sections)} sections with concurrency {config.GROQ_CONCURRENCY}...")
+        before = self.stats["requests"] - self.stats["retries"]
+        summary, levels, calls = run_coroutine(self._summarize_levels(sections, section_tokens))
+        made = self.stats["requests"] - self.stats["retries"] - before
+        print(f"Summary levels: {' -> '.join(str(count) for count in levels)} "
+              f"({calls} summaries, {calls - made} reused from cache)")
+        return summary
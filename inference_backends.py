@@ -0,0 +1,202 @@
+import copy
+import os
+import time
+from config import config
+
+# torch is imported where it is used, so the CLI can list BACKENDS without loading it
+
+def artifact_path(model_name, suffix):
+    """Location of a built artifact, keyed by model and torch version so upgrades rebuild it"""
+    import torch
+    os.makedirs(config.MODEL_CACHE_DIR, exist_ok=True)
+    slug = model_name.replace("/", "--")
+    return os.path.join(config.MODEL_CACHE_DIR, f"{slug}-torch{torch.__version__}-{suffix}")
+
+def _logits_only(model):
+    """Wrap `model` to expose only the logits tensor, which is what export and compile need"""
+    import torch
+
+    class LogitsOnly(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_values, attention_mask=None):
+            return self.model(input_values, attention_mask=attention_mask).logits
+
+    return LogitsOnly(model)
+
+def _cpu_copy(model):
+    """A copy of `model` on the CPU; the original is shared through the registry and must stay as it is"""
+    return copy.deepcopy(model).cpu()
+
+class EagerBackend:
+    """Plain fp32 PyTorch"""
+    name = "eager"
+
+    def __init__(self, model, model_name, use_attention_mask):
+        self.model = model
+
+    def __call__(self, input_values, attention_mask=None):
+        import torch
+        with torch.no_grad():
+            return self.model(input_values, attention_mask=attention_mask).logits
+
+class Int8Backend(EagerBackend):
+    """Dynamically quantized int8 Linear layers (CPU only), with the quantized module cached on disk"""
+    name = "int8"
+
+    def __init__(self, model, model_name, use_attention_mask):
+        import torch
+        path = artifact_path(model_name, "int8.pt")
+        if os.path.exists(path):
+            print(f"Loading int8 model from {path}")
+            # Local artifact written below; a pickled module needs weights_only=False
+            quantized = torch.load(path, weights_only=False)
+        else:
+            quantized = torch.ao.quantization.quantize_dynamic(_cpu_copy(model), {torch.nn.Linear},
+                                                               dtype=torch.qint8, inplace=True)
+            tmp_path = f"{path}.tmp"
+            try:
+                torch.save(quantized, tmp_path)
+                os.replace(tmp_path, path)
+                print(f"Saved int8 model to {path}")
+            except Exception as e:
+                # Some torch/transformers versions cannot pickle the model (weight-norm hooks); quantize each run
+                print(f"Could not save int8 model: {e}")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        quantized.eval()
+        self.model = quantized
+
+    def __call__(self, input_values, attention_mask=None):
+        # The recognizer may be on a GPU (e.g. comparing against eager), but quantized kernels only run on the CPU
+        if attention_mask is not None:
+            attention_mask = attention_mask.cpu()
+        return super().__call__(input_values.cpu(), attention_mask)
+
+class CompiledBackend(EagerBackend):
+    """torch.compile with dynamic shapes; Inductor's on-disk cache persists compiled kernels"""
+    name = "compile"
+
+    def __init__(self, model, model_name, use_attention_mask):
+        import torch
+        os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", os.path.join(config.MODEL_CACHE_DIR, "inductor"))
+        os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+        self.module = torch.compile(_logits_only(model), dynamic=True)
+
+    def __call__(self, input_values, attention_mask=None):
+        import torch
+        with torch.no_grad():
+            return self.module(input_values, attention_mask)
+
+class OnnxBackend:
+    """ONNX Runtime session over an export with dynamic batch and sequence length"""
+    name = "onnx"
+
+    def __init__(self, model, model_name, use_attention_mask):
+        import torch
+        try:
+            import onnxruntime
+        except ImportError:
+            raise Exception("The onnx backend needs onnxruntime (pip install onnxruntime)")
+
+        self.use_attention_mask = use_attention_mask
+        path = artifact_path(model_name, "mask.onnx" if use_attention_mask else "model.onnx")
+        if not os.path.exists(path):
+            self._export(model, path)
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = torch.get_num_threads()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def _export(self, model, path):
+        import torch
+        print(f"Exporting ONNX model to {path}...")
+        wrapper = _logits_only(_cpu_copy(model)).eval()
+        dummy = torch.zeros(1, config.SAMPLE_RATE)
+        inputs = (dummy,)
+        input_names = ["input_values"]
+        dynamic_axes = {"input_values": {0: "batch", 1: "samples"}, "logits": {0: "batch", 1: "frames"}}
+        if self.use_attention_mask:
+            inputs = (dummy, torch.ones(1, config.SAMPLE_RATE, dtype=torch.long))
+            input_names.append("attention_mask")
+            dynamic_axes["attention_mask"] = {0: "batch", 1: "samples"}
+
+        tmp_path = f"{path}.tmp"
+        with torch.no_grad():
+            torch.onnx.export(wrapper, inputs, tmp_path, input_names=input_names, output_names=["logits"],
+                              dynamic_axes=dynamic_axes, opset_version=17)
+        os.replace(tmp_path, path)
+
+    def __call__(self, input_values, attention_mask=None):
+        import torch
+        feeds = {"input_values": input_values.cpu().numpy()}
+        if self.use_attention_mask:
+            if attention_mask is None:
+                attention_mask = torch.ones_like(input_values, dtype=torch.long)
+            feeds["attention_mask"] = attention_mask.cpu().numpy().astype("int64")
+        return torch.from_numpy(self.session.run(["logits"], feeds)[0])
+
+BACKENDS = {
+    "eager": EagerBackend,
+    "int8": Int8Backend,
+    "compile": CompiledBackend,
+    "onnx": OnnxBackend
+}
+
+def build_backend(name, model, model_name, use_attention_mask):
+    if name not in BACKENDS:
+        raise Exception(f"Unknown inference backend '{name}', choose from {', '.join(BACKENDS)}")
+    return BACKENDS[name](model, model_name, use_attention_mask)
+
+def word_error_rate(reference, hypothesis):
+    """Word-level Levenshtein distance divided by the reference length"""
+    ref = reference.split()
+    hyp = hypothesis.split()
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word))
+        previous = current
+    return previous[-1] / max(len(ref), 1)
+
+def compare_backends(speech_recognizer, audio_chunks, backends=tuple(BACKENDS)):
+    """Real-time factor per backend and transcript divergence from eager fp32"""
+    audio_seconds = sum(len(chunk) for chunk in audio_chunks) / config.SAMPLE_RATE
+    original = speech_recognizer.backend
+    rows = []
+    reference = None
+    # fp32 runs first so every other backend has a reference transcript
+    backends = ["eager"] + [name for name in backends if name != "eager"]
+
+    try:
+        for name in backends:
+            try:
+                speech_recognizer.backend = build_backend(
+                    name, speech_recognizer.model, speech_recognizer.model_name, speech_recognizer.use_attention_mask)
+                # Warm up once so compile/export time is not counted as inference
+                speech_recognizer.compute_logits(audio_chunks[:1])
+
+                start_time = time.perf_counter()
+                texts = speech_recognizer.transcribe_batch(audio_chunks)
+                elapsed = time.perf_counter() - start_time
+            except Exception as e:
+                rows.append({"backend": name, "error": str(e)})
+                continue
+
+            transcript = " ".join(texts)
+            if name == "eager":
+                reference = transcript
+            rows.append({
+                "backend": name,
+                "seconds": elapsed,
+                "rtf": elapsed / audio_seconds if audio_seconds > 0 else 0.0,
+                "wer_vs_fp32": word_error_rate(reference, transcript) if reference is not None else None
+            })
+    finally:
+        speech_recognizer.backend = original
+
+    return rows
@@ -0,0 +1,163 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from config import config
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def peak_rss_bytes():
+    """Process memory high-water mark; ru_maxrss is KiB on Linux and bytes on macOS
+
+    Without `resource` (Windows) the peak working set from psutil is used if
+    it is installed, otherwise 0.
+    """
+    if resource is None:
+        try:
+            import psutil
+            return getattr(psutil.Process().memory_info(), "peak_wset", 0)
+        except ImportError:
+            return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class Span:
+    """Measurements a stage can fill in while it runs"""
+
+    def __init__(self, audio_seconds=0.0, bytes=0, fields=None):
+        self.audio_seconds = audio_seconds
+        self.bytes = bytes
+        self.retries = 0
+        self.fields = fields or {}
+
+# Handed out when disabled; writes to it are simply discarded
+_NULL_SPAN = Span()
+
+class Instrumentation:
+    """Per-stage durations, audio seconds, bytes, retries and memory, as JSON logs and a Prometheus snapshot
+
+    Disabled by default, in which case stage() does no timing, locking or I/O.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.log_path = None
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    def configure(self, enabled=True, log_path=None):
+        self.enabled = enabled
+        self.log_path = log_path
+
+    @contextmanager
+    def stage(self, name, audio_seconds=0.0, bytes=0, **fields):
+        """Time a block of work; the yielded Span takes values only known once the work is done"""
+        if not self.enabled:
+            yield _NULL_SPAN
+            return
+
+        span = Span(audio_seconds, bytes, fields)
+        status = "ok"
+        start_time = time.perf_counter()
+        try:
+            yield span
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            self._record(name, span, status, time.perf_counter() - start_time)
+
+    def _record(self, name, span, status, seconds):
+        rss = peak_rss_bytes()
+        with self.lock:
+            totals = self.stages.setdefault(name, {
+                "count": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0,
+                "audio_seconds": 0.0, "bytes": 0, "retries": 0, "rss_peak_bytes": 0
+            })
+            totals["count"] += 1
+            totals["errors"] += status == "error"
+            totals["seconds"] += seconds
+            totals["max_seconds"] = max(totals["max_seconds"], seconds)
+            totals["audio_seconds"] += span.audio_seconds
+            totals["bytes"] += span.bytes
+            totals["retries"] += span.retries
+            totals["rss_peak_bytes"] = max(totals["rss_peak_bytes"], rss)
+
+            if self.log_path:
+                event = {
+                    "ts": time.time(),
+                    "pid": os.getpid(),
+                    "stage": name,
+                    "status": status,
+                    "seconds": round(seconds, 6),
+                    "audio_seconds": round(span.audio_seconds, 3),
+                    "bytes": span.bytes,
+                    "retries": span.retries,
+                    "rss_peak_bytes": rss,
+                    **span.fields
+                }
+                # One short append per event, so several worker processes can share the file
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(event, default=str) + "\n")
+
+    def snapshot(self):
+        """Copy of the per-stage totals"""
+        with self.lock:
+            return {name: dict(totals) for name, totals in self.stages.items()}
+
+    def prometheus_text(self):
+        """Totals in the Prometheus text exposition format"""
+        metrics = [
+            ("count", "stage_calls_total", "counter", "Completed stage invocations"),
+            ("errors", "stage_errors_total", "counter", "Stage invocations that raised"),
+            ("seconds", "stage_seconds_total", "counter", "Wall time spent in the stage"),
+            ("max_seconds", "stage_max_seconds", "gauge", "Slowest single invocation"),
+            ("audio_seconds", "stage_audio_seconds_total", "counter", "Seconds of audio processed"),
+            ("bytes", "stage_bytes_total", "counter", "Bytes read or sent"),
+            ("retries", "stage_retries_total", "counter", "Retried attempts"),
+            ("rss_peak_bytes", "stage_rss_peak_bytes", "gauge", "Process RSS high-water mark after the stage")
+        ]
+        snapshot = self.snapshot()
+        lines = []
+        for field, metric, kind, help_text in metrics:
+            lines.append(f"# HELP stt_{metric} {help_text}")
+            lines.append(f"# TYPE stt_{metric} {kind}")
+            for name in sorted(snapshot):
+                lines.append(f'stt_{metric}{{stage="{name}"}} {snapshot[name][field]}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def reset(self):
+        with self.lock:
+            self.stages = {}
+
+@contextmanager
+def torch_profile(trace_path=None):
+    """Record a torch profiler trace (viewable in chrome://tracing or Perfetto) around a block"""
+    if not trace_path:
+        yield None
+        return
+
+    import torch
+    from torch.profiler import ProfilerActivity, profile
+
+    activities = [ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(ProfilerActivity.CUDA)
+    with profile(activities=activities, record_shapes=True, profile_memory=True) as profiler:
+        yield profiler
+    profiler.export_chrome_trace(trace_path)
+    print(f"Profiler trace saved to: {trace_path}")
+
+instrumentation = Instrumentation()
+instrumentation.configure(config.INSTRUMENTATION_ENABLED, config.INSTRUMENTATION_LOG)
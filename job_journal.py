@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import threading
+from config import config
+
+class JobJournal:
+    """Per-chunk transcripts and correction segments of one unfinished file
+
+    Every result is appended as one JSON line and fsynced as soon as it
+    exists, so a crash or kill loses at most the work in flight; a torn last
+    line from an interrupted write is skipped on load. The journal is named
+    after the transcript key (file content hash plus transcription settings),
+    so only a re-run of the same job picks it up. Corrections are keyed by
+    the text they were made from and the LLM model, since the raw transcript
+    may be rebuilt from the cache rather than the journal.
+    """
+
+    def __init__(self, key, journal_dir=config.JOURNAL_DIR):
+        os.makedirs(journal_dir, exist_ok=True)
+        self.path = os.path.join(journal_dir, f"{key}.jsonl")
+        self.lock = threading.Lock()
+        self.file = None
+        self.layout = None
+        self.raw_results = {}
+        self.corrections = {}
+        self.stats = {
+            "chunks_skipped": 0, "seconds_skipped": 0.0, "chunks_done": 0, "seconds_done": 0.0,
+            "segments_skipped": 0, "segments_done": 0
+        }
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record.get("kind") == "raw":
+                        self.raw_results[record["index"]] = record
+                    elif record.get("kind") == "corrected":
+                        self.corrections[record["key"]] = record["text"]
+        except FileNotFoundError:
+            pass
+        if self.raw_results or self.corrections:
+            print(f"Resuming from journal: {len(self.raw_results)} chunks and "
+                  f"{len(self.corrections)} corrected segments already done")
+
+    def _append(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.path, "a+b")
+                # Start on a fresh line if the last run died mid-write
+                if self.file.tell() > 0:
+                    self.file.seek(-1, os.SEEK_END)
+                    if self.file.read(1) != b"\n":
+                        self.file.write(b"\n")
+            self.file.write(line.encode("utf-8"))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def set_layout(self, layout):
+        """How this run cuts and numbers chunks (mode, chunk length, first sample); others are not reused"""
+        self.layout = layout
+        stale = [index for index, record in self.raw_results.items() if record.get("layout") != layout]
+        if stale:
+            print(f"Chunk layout changed, {len(stale)} journaled chunks will be transcribed again")
+            for index in stale:
+                del self.raw_results[index]
+
+    def raw(self, index):
+        """Journaled (text, words) of chunk `index`, or None if it still has to be transcribed"""
+        record = self.raw_results.get(index)
+        if record is None:
+            return None
+        with self.lock:
+            self.stats["chunks_skipped"] += 1
+            self.stats["seconds_skipped"] += record["seconds"]
+        return record["text"], record["words"]
+
+    def record_raw(self, index, text, words, seconds):
+        record = {"kind": "raw", "index": index, "layout": self.layout, "text": text, "words": words,
+                  "seconds": seconds}
+        self._append(record)
+        self.raw_results[index] = record
+        with self.lock:
+            self.stats["chunks_done"] += 1
+            self.stats["seconds_done"] += seconds
+
+    def _correction_key(self, context, segment):
+        payload = json.dumps([config.GROQ_MODEL, context, segment])
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=20).hexdigest()
+
+    def corrected(self, context, segment):
+        """Journaled correction of this segment, or None"""
+        text = self.corrections.get(self._correction_key(context, segment))
+        if text is not None:
+            with self.lock:
+                self.stats["segments_skipped"] += 1
+        return text
+
+    def record_corrected(self, context, segment, text):
+        key = self._correction_key(context, segment)
+        self._append({"kind": "corrected", "key": key, "text": text})
+        self.corrections[key] = text
+        with self.lock:
+            self.stats["segments_done"] += 1
+
+    def report(self):
+        with self.lock:
+            return dict(self.stats)
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def finish(self):
+        """The job's result is complete (and cached), so its journal is no longer needed"""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
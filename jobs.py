@@ -0,0 +1,97 @@
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+class JobCancelled(Exception):
+    """Raised inside a job at its next progress update once cancellation is requested"""
+
+class Job:
+    """State of one background task; the UI thread reads it while a worker thread updates it"""
+
+    def __init__(self, name):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.status = "queued"
+        self.progress = 0
+        self.message = "Waiting for a free worker..."
+        self.result = None
+        self.error = None
+        self.traceback = None
+        self.details = {}
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_requested = threading.Event()
+
+    @property
+    def done(self):
+        return self.status in ("done", "error", "cancelled")
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def check_cancelled(self):
+        if self.cancel_requested.is_set():
+            raise JobCancelled()
+
+    def update(self, progress=None, message=None):
+        """Report progress (0-100) and/or a status message; also the cancellation point"""
+        self.check_cancelled()
+        if progress is not None:
+            self.progress = max(self.progress, min(100, int(progress)))
+        if message is not None:
+            self.message = message
+
+    def cancel(self):
+        self.cancel_requested.set()
+
+class JobManager:
+    """Run jobs on a small thread pool that outlives any single Streamlit script run"""
+
+    def __init__(self, max_workers=1, max_finished=50):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.max_finished = max_finished
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, name, func, *args, **kwargs):
+        """Start `func(job, *args, **kwargs)` in the background and return its Job"""
+        job = Job(name)
+        with self.lock:
+            self.jobs[job.id] = job
+            self._prune()
+        self.executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def _run(self, job, func, args, kwargs):
+        job.started = time.time()
+        try:
+            job.check_cancelled()
+            job.status = "running"
+            job.result = func(job, *args, **kwargs)
+            job.progress = 100
+            job.status = "done"
+        except JobCancelled:
+            job.status = "cancelled"
+            job.message = "Cancelled"
+        except Exception as e:
+            job.error = str(e)
+            job.traceback = traceback.format_exc()
+            job.status = "error"
+        finally:
+            job.finished = time.time()
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond `max_finished`"""
+        finished = sorted((job for job in self.jobs.values() if job.done), key=lambda job: job.created)
+        for job in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job.id]
@@ -1,81 +1,716 @@
 import argparse
+import itertools
 import os
 import sys
 import time
-from audio_processor import AudioProcessor
-from speech_recognizer import SpeechRecognizer
-from groq_integration import GroqPostProcessor
+from inference_backends import BACKENDS
+from instrumentation import instrumentation, torch_profile
+from ctc_decoder import join_ranges, offset_words
+from model_registry import registry
+from startup_profile import startup
+from transcription_cache import TranscriptionCache, transcript_key
 from config import config
 
 class SpeechToTextPipeline:
-    def __init__(self):
-        print("Initializing audio processor...")
-        self.audio_processor = AudioProcessor()
-        print("Initializing speech recognizer...")
-        self.speech_recognizer = SpeechRecognizer()
-        print("Initializing Groq processor...")
-        self.groq_processor = GroqPostProcessor()
+    def __init__(self, use_cache=config.CACHE_ENABLED, model_name=None, shard_workers=0, cascade_model=None,
+                 use_journal=config.JOURNAL_ENABLED, overlap_duration=config.CHUNK_OVERLAP_DURATION, progress=None):
+        # Heavy components are built on first use, so e.g. a cache hit never imports torch
+        self.model_name = model_name or config.SPEECH_MODEL_NAME
+        self._audio_processor = None
+        self._speech_recognizer = None
+        self._groq_processor = None
+        self.cache = TranscriptionCache() if use_cache else None
+        # Word timings (absolute seconds) of the last raw transcription
+        self.words = []
+        # Above zero, one file's chunks are spread over this many worker processes
+        self.shard_workers = shard_workers
+        self._sharded = None
+        # When set, chunks the model above is unsure about are re-run on this larger model
+        self.cascade_model = cascade_model
+        # Checkpoints of the file being processed, and what the last file resumed from them
+        self.use_journal = use_journal
+        self.journal = None
+        self.journal_report = None
+        # Chunks of the last file that failed to transcribe; while any did, nothing is cached or finished
+        self.failed_chunks = 0
+        self._chunk_plan = None
+        # Decode/correction stages of a pipelined run (see StagedPipeline), and their last report
+        self.stages = None
+        self.stage_report = None
+        # Above zero, in-memory audio is cut into windows sharing this many seconds, stitched at the logit level.
+        # Shards are cut hard, so the plan and cache key must not claim an overlap there
+        self.overlap_duration = 0.0 if shard_workers else overlap_duration
+        # Called as progress(percent, message) as a file is worked through (e.g. jobs.Job.update); an exception
+        # it raises stops the run, keeping the journal. Transcription reaches 80%, correction is reported at 80%
+        self.progress = progress
+        # Length of the file being transcribed, when known, to report streamed progress against
+        self.duration = None
+
+    @property
+    def cache_model_name(self):
+        """Model identity for cache keys; a cascade can produce different text than its base model"""
+        if self.cascade_model:
+            return f"{self.model_name}>{self.cascade_model}@{config.CASCADE_CONFIDENCE_THRESHOLD}"
+        return self.model_name
+
+    @property
+    def audio_processor(self):
+        if self._audio_processor is None:
+            with startup.phase("audio processor"):
+                from audio_processor import AudioProcessor
+                print("Initializing audio processor...")
+                self._audio_processor = AudioProcessor()
+        return self._audio_processor
+
+    @property
+    def speech_recognizer(self):
+        if self._speech_recognizer is None:
+            with startup.phase("speech recognizer"):
+                print("Initializing speech recognizer...")
+                self._speech_recognizer = registry.get(self.model_name)
+                if self.cascade_model:
+                    from model_cascade import CascadeRecognizer
+                    self._speech_recognizer = CascadeRecognizer(self._speech_recognizer, self.cascade_model)
+        return self._speech_recognizer
+
+    @property
+    def chunk_plan(self):
+        """Chunk length and batch size for this model on this machine (see chunk_planner.py)"""
+        if self._chunk_plan is None:
+            from chunk_planner import ChunkPlanner
+            # Shard workers always run on the CPU, and a cache lookup should not load a model to find the device
+            if self.shard_workers:
+                device = "cpu"
+            else:
+                device = self._speech_recognizer.device if self._speech_recognizer is not None else None
+            self._chunk_plan = ChunkPlanner().plan(self.model_name, config.INFERENCE_BACKEND, device,
+                                                   self.overlap_duration)
+            print(f"Chunk plan: {self._chunk_plan.describe()}")
+        return self._chunk_plan
+
+    @property
+    def groq_processor(self):
+        if self._groq_processor is None:
+            with startup.phase("groq processor"):
+                from groq_integration import GroqPostProcessor
+                print("Initializing Groq processor...")
+                self._groq_processor = GroqPostProcessor()
+        return self._groq_processor
         
-    def process_audio_file(self, audio_path, use_groq_correction=True):
-        """Process audio file through the entire pipeline"""
-        print(f"Processing audio file: {audio_path}")
+    def report_progress(self, percent=None, message=None):
+        if self.progress:
+            self.progress(percent, message)
+
+    def report_chunks(self, done, total):
+        self.report_progress(10 + 70 * done / max(total, 1), f"Transcribed {done} of {total} chunks...")
+
+    def report_position(self, seconds):
+        if self.duration:
+            self.report_progress(10 + 70 * min(seconds / self.duration, 1.0),
+                                 f"Transcribed up to {seconds:.0f}s of {self.duration:.0f}s...")
+
+    def feed_stages(self, index, text, joined=False):
+        """Hand chunk `index`'s text to the correction stage of a pipelined run"""
+        if self.stages:
+            self.stages.feed(index, text, joined)
+
+    def prefetched(self, items):
+        """Lazily decoded audio, decoded ahead on a thread in a pipelined run"""
+        return self.stages.prefetch(items) if self.stages else items
+
+    def transcribe_speech_regions(self, audio_array):
+        """Transcribe only the speech regions found by VAD"""
+        regions = self.audio_processor.detect_speech(audio_array)
+        segments = self.audio_processor.chunk_speech(audio_array, regions, chunk_duration=self.chunk_plan.chunk_duration)
+        speech_samples = sum(len(chunk) for _, chunk in segments)
+        print(f"VAD kept {speech_samples/config.SAMPLE_RATE:.2f}s of speech in {len(segments)} segments "
+              f"({100 * speech_samples / max(len(audio_array), 1):.1f}% of audio)")
+
+        results = self.transcribe_journaled([chunk for _, chunk in segments], "regions")
+        texts = []
+        for (offset, chunk), (text, words) in zip(segments, results):
+            start = offset / config.SAMPLE_RATE
+            print(f"[{start:.2f}-{start + len(chunk)/config.SAMPLE_RATE:.2f}s] {text[:100]}")
+            texts.append(text)
+            self.words.extend(offset_words(words, start))
+
+        return " ".join(text for text in texts if text)
+
+    def set_journal_layout(self, mode, start=0):
+        """Tell the journal how this run numbers its chunks
+
+        Chunk i only means the same audio (and its words the same time base) for
+        the same chunking mode, chunk length and first sample.
+        """
+        if self.journal:
+            self.journal.set_layout({"mode": mode, "chunk_duration": self.chunk_plan.chunk_duration,
+                                     "overlap_duration": self.chunk_plan.overlap_duration, "start": int(start)})
+
+    def record_chunk(self, index, text, words, seconds):
+        """Checkpoint chunk `index`'s (text, words); a chunk that failed (text None) is counted, not journaled
+
+        Returns what the transcript uses for it, empty for a failed chunk, so a
+        re-run transcribes it again instead of reading it back as silence.
+        """
+        if text is None:
+            self.failed_chunks += 1
+            return "", []
+        if self.journal:
+            self.journal.record_raw(index, text, words, seconds)
+        return text, words
+
+    def transcribe_journaled(self, chunks, mode, start=0):
+        """transcribe_batch_timed, reusing journaled chunks and checkpointing the rest batch by batch
+
+        Batches are planned over every chunk, journaled or not, and a batch is
+        run whole if any of its chunks is missing, so each chunk is padded the
+        same way with or without the journal and on a resumed run.
+        """
+        plan = self.chunk_plan
+        self.set_journal_layout(mode, start)
+        batches = self.speech_recognizer.make_batches([len(chunk) for chunk in chunks], plan.batch_size,
+                                                      plan.max_batch_samples)
+        results = [self.journal.raw(i) if self.journal else None for i in range(len(chunks))]
+        journaled = sum(result is not None for result in results)
+        if journaled:
+            print(f"Skipping {journaled}/{len(chunks)} chunks already in the journal")
+        for i, result in enumerate(results):
+            if result is not None:
+                self.feed_stages(i, result[0])
+
+        pending = [batch for batch in batches if any(results[i] is None for i in batch)]
+        done = len(chunks) - sum(len(batch) for batch in pending)
+        self.report_chunks(done, len(chunks))
+        for batch, batch_results in self.speech_recognizer.transcribe_batches_scored(chunks, pending):
+            for i, (text, words, _) in zip(batch, batch_results):
+                if results[i] is not None:
+                    continue
+                results[i] = self.record_chunk(i, text, words, len(chunks[i]) / config.SAMPLE_RATE)
+                self.feed_stages(i, results[i][0])
+            done += len(batch)
+            self.report_chunks(done, len(chunks))
+        return results
+
+    def transcribe_window_groups(self, windows, group_size=None):
+        """Stitch overlapping (offset, window) pairs group by group, returning (text, words) per group for join_ranges
+
+        `windows` is read lazily, holding only the current group and the two
+        windows on either side of it (a window shifted back to end with the
+        audio can reach two places back). Each group is stitched together
+        with the windows overlapping it and cut where it meets the next, so
+        the groups join as one stitched pass would; journaled groups are
+        reused and new ones checkpointed.
+        """
+        plan = self.chunk_plan
+        group_size = group_size or config.JOURNAL_GROUP_CHUNKS
+        windows = iter(windows)
+        ahead = []
+        previous = []
+        results = []
+        while True:
+            ahead.extend(itertools.islice(windows, group_size + 2 - len(ahead)))
+            if not ahead:
+                return results
+            group, ahead = ahead[:group_size], ahead[group_size:]
+            index = len(results)
+            journaled = self.journal.raw(index) if self.journal else None
+            if journaled is None:
+                context = previous + group + ahead[:2]
+                journaled = self.speech_recognizer.transcribe_windows(
+                    context, context[-1][0] + len(context[-1][1]), plan.batch_size, plan.max_batch_samples,
+                    (len(previous), len(previous) + len(group)))
+                if self.journal:
+                    seconds = (group[-1][0] + len(group[-1][1]) - group[0][0]) / config.SAMPLE_RATE
+                    self.journal.record_raw(index, *journaled, seconds)
+            print(f"[{group[0][0]/config.SAMPLE_RATE:.2f}s] {journaled[0].strip()[:100]}")
+            self.feed_stages(index, journaled[0], joined=True)
+            self.report_position((group[-1][0] + len(group[-1][1])) / config.SAMPLE_RATE)
+            results.append(journaled)
+            previous = group[-2:]
+
+    def transcribe_streamed(self, audio_path, use_vad=config.VAD_ENABLED):
+        """Decode and transcribe a long file block by block with flat memory use"""
+        plan = self.chunk_plan
+        if self.overlap_duration > 0 and not use_vad:
+            self.set_journal_layout("streamed_overlapping")
+            windows = self.audio_processor.stream_audio_overlapping(audio_path, plan.chunk_duration,
+                                                                    self.overlap_duration)
+            text, words = join_ranges(self.transcribe_window_groups(self.prefetched(windows)))
+            self.words.extend(words)
+            return text
+
+        self.set_journal_layout("streamed")
+        if use_vad:
+            segments = self.audio_processor.stream_speech_segments(audio_path, chunk_duration=plan.chunk_duration)
+        else:
+            segments = self.audio_processor.stream_audio(audio_path, chunk_duration=plan.chunk_duration)
+        segments = iter(self.prefetched(segments))
+
+        # Segments are batched `batch_size` at a time in arrival order, as transcribe_stream_timed does. Journaled
+        # segments are still decoded (to find where later ones start); a group is only run if one of its segments
+        # is missing, and then whole, so a resumed run pads every segment as a fresh one does
+        texts = []
+        index = 0
+        while True:
+            group = list(itertools.islice(segments, plan.batch_size))
+            if not group:
+                break
+            results = [self.journal.raw(index + j) if self.journal else None for j in range(len(group))]
+            if any(result is None for result in results):
+                transcribed = self.speech_recognizer.transcribe_batch_timed([chunk for _, chunk in group],
+                                                                            plan.batch_size, plan.max_batch_samples)
+                for j, ((offset, chunk), (text, words)) in enumerate(zip(group, transcribed)):
+                    if results[j] is None:
+                        results[j] = self.record_chunk(index + j, text, offset_words(words, offset / config.SAMPLE_RATE),
+                                                       len(chunk) / config.SAMPLE_RATE)
+            for j, ((offset, _), (text, words)) in enumerate(zip(group, results)):
+                print(f"[{offset/config.SAMPLE_RATE:.2f}s] {text[:100]}")
+                self.feed_stages(index + j, text)
+                self.words.extend(words)
+                if text:
+                    texts.append(text)
+            index += len(group)
+            self.report_position((group[-1][0] + len(group[-1][1])) / config.SAMPLE_RATE)
+
+        return " ".join(texts)
+
+    def transcribe_sharded(self, audio_path, use_vad=config.VAD_ENABLED):
+        """Transcribe one file's chunks in parallel on worker processes reading shared memory"""
+        from chunk_planner import plan_batches
+        from sharded_transcriber import ShardedTranscriber
+        if self._sharded is None:
+            self._sharded = ShardedTranscriber(self.shard_workers, self.model_name)
+
+        # The whole file is decoded once; workers slice it in place
+        audio_array = self.audio_processor.load_audio(audio_path)
+        audio_array = self.audio_processor.preprocess_audio(audio_array, trim_silence=False)
+        if use_vad:
+            regions = self.audio_processor.detect_speech(audio_array)
+            segments = self.audio_processor.chunk_speech(audio_array, regions, chunk_duration=self.chunk_plan.chunk_duration)
+            spans = [(offset, offset + len(chunk)) for offset, chunk in segments]
+        else:
+            start, end = self.audio_processor.silence_bounds(audio_array)
+            chunk_size = int(self.chunk_plan.chunk_duration * config.SAMPLE_RATE)
+            spans = [(i, min(i + chunk_size, end)) for i in range(start, end, chunk_size)
+                     if min(i + chunk_size, end) - i > config.SAMPLE_RATE]  # At least 1 second, as in chunk_audio
+        self.set_journal_layout("sharded", spans[0][0] if spans else 0)
+        # Planned over every span and sent whole, so the shards pad chunks as an in-memory run batches them
+        batches = plan_batches([end - start for start, end in spans], self.chunk_plan.batch_size,
+                               self.chunk_plan.max_batch_samples)
+        results = [self.journal.raw(i) if self.journal else None for i in range(len(spans))]
+        journaled = sum(result is not None for result in results)
+        if journaled:
+            print(f"Skipping {journaled}/{len(spans)} chunks already in the journal")
+        pending = [batch for batch in batches if any(results[i] is None for i in batch)]
+
+        def checkpoint(index, text, words):
+            if results[index] is None:
+                start, end = spans[index]
+                results[index] = self.record_chunk(index, text, words, (end - start) / config.SAMPLE_RATE)
+                self.report_chunks(sum(result is not None for result in results), len(spans))
+
+        if pending:
+            print(f"Sharding {sum(len(batch) for batch in pending)} chunks over {self._sharded.workers} workers...")
+            _, report = self._sharded.transcribe(audio_array, spans, checkpoint, pending)
+
+            print(f"Sharded transcription: {report['audio_seconds']:.1f}s of audio in {report['wall_time']:.2f}s "
+                  f"({report['x_realtime']:.1f}x real time, workers started in {report['startup_seconds']:.2f}s)")
+            for worker in report["workers"]:
+                print(f"  worker {worker['worker']} ({worker['cores']} cores): {worker['chunks']} chunks in "
+                      f"{worker['shards']} shards, busy {worker['seconds']:.2f}s ({worker['x_realtime']:.1f}x real time)")
+
+        for i, ((start, _), (text, words)) in enumerate(zip(spans, results)):
+            self.words.extend(offset_words(words, start / config.SAMPLE_RATE))
+            self.feed_stages(i, text)
+        return " ".join(text for text, _ in results if text)
+
+    def close(self):
+        if self._sharded is not None:
+            self._sharded.close()
+            self._sharded = None
+
+    def transcribe_file(self, audio_path, use_vad=config.VAD_ENABLED):
+        """Load, preprocess and transcribe an audio file, returning the raw text"""
+        self.words = []
+        self.failed_chunks = 0
+        self.duration = None
+        if self.shard_workers:
+            self.report_progress(message="Decoding audio for the shard workers...")
+            return self.transcribe_sharded(audio_path, use_vad)
+
+        self.duration = self.audio_processor.get_duration(audio_path)
+        print(f"Audio length: {self.duration:.2f} seconds")
+        self.report_progress(message=f"Audio length: {self.duration:.2f} seconds")
+
+        # Above the threshold the file is never held in memory as a whole
+        if self.duration > config.MAX_AUDIO_LENGTH:
+            print("Audio is long, streaming in blocks...")
+            self.report_progress(message="Audio is long, streaming in blocks...")
+            return self.transcribe_streamed(audio_path, use_vad)
+
+        # Load and preprocess audio
+        print("Loading audio...")
+        self.report_progress(message="Loading audio...")
+        audio_array = self.audio_processor.load_audio(audio_path)
+
+        print("Preprocessing audio...")
+        self.report_progress(5, "Preprocessing audio...")
+        audio_array = self.audio_processor.preprocess_audio(audio_array, trim_silence=False)
+        self.report_progress(10)
+
+        if use_vad:
+            print("Detecting speech regions...")
+            self.report_progress(message="Detecting speech regions...")
+            return self.transcribe_speech_regions(audio_array)
+
+        # Trim here rather than in preprocessing so word times can be shifted back
+        start, end = self.audio_processor.silence_bounds(audio_array)
+        audio_array = audio_array[start:end]
+        start_time = start / config.SAMPLE_RATE
+
+        # Overlapping windows were asked for, so anything longer than one window is cut into them
+        plan = self.chunk_plan
+        if self.overlap_duration > 0 and len(audio_array) > plan.chunk_duration * config.SAMPLE_RATE:
+            windows = self.audio_processor.chunk_audio_overlapping(audio_array, plan.chunk_duration,
+                                                                   self.overlap_duration)
+            print(f"Split into {len(windows)} windows of {plan.chunk_duration}s "
+                  f"overlapping by {self.overlap_duration}s")
+            self.set_journal_layout("overlapping", start)
+            # Without a journal there is nothing to checkpoint, so everything is stitched at once
+            group_size = config.JOURNAL_GROUP_CHUNKS if self.journal else len(windows)
+            text, words = join_ranges(self.transcribe_window_groups(windows, group_size))
+            self.words.extend(offset_words(words, start_time))
+            return text
+
+        # Chunk whenever that is cheaper than one pass; attention cost grows with the square of the length
+        if plan.should_chunk(len(audio_array)):
+            print(f"Chunking into {plan.chunk_duration}s chunks...")
+            chunks = self.audio_processor.chunk_audio(audio_array, plan.chunk_duration)
+            print(f"Split into {len(chunks)} chunks")
+            results = self.transcribe_journaled(chunks, "chunked", start)
+            for i, (text, words) in enumerate(results):
+                print(f"Chunk {i+1}: {text[:100]}...")
+                self.words.extend(offset_words(words, start_time + i * plan.chunk_duration))
+            return " ".join(text for text, _ in results)
+
+        print("Transcribing audio...")
+        self.report_progress(message="Transcribing audio...")
+        text, words = self.speech_recognizer.transcribe_audio_timed(audio_array)
+        self.words = offset_words(words, start_time)
+        self.feed_stages(0, text)
+        return text
+
+    def finish_journal(self, complete=True):
+        """Drop the journal once the file's result is complete, otherwise keep it for the next run"""
+        if self.journal is None:
+            return
+        self.journal_report = self.journal.report()
+        if complete:
+            self.journal.finish()
+        else:
+            self.journal.close()
+            print(f"Progress kept in {self.journal.path}; re-run to resume")
+        self.journal = None
+
+    def process_audio_file(self, audio_path, use_groq_correction=True, use_vad=config.VAD_ENABLED, raise_errors=False,
+                           pipelined=False):
+        """Process audio file through the entire pipeline
+
+        `pipelined` overlaps decoding, inference and correction (see
+        StagedPipeline) without changing the result.
+        """
+        from audio_decoders import source_name
+        print(f"Processing audio file: {source_name(audio_path)}")
         
         try:
-            # Load and preprocess audio
-            print("Loading audio...")
-            audio_array = self.audio_processor.load_audio(audio_path)
-            print(f"Audio length: {len(audio_array)/config.SAMPLE_RATE:.2f} seconds")
-            
-            print("Preprocessing audio...")
-            audio_array = self.audio_processor.preprocess_audio(audio_array)
-            
-            # Chunk audio if too long
-            if len(audio_array) > config.MAX_AUDIO_LENGTH * config.SAMPLE_RATE:
-                print("Audio is too long, chunking...")
-                chunks = self.audio_processor.chunk_audio(audio_array)
-                print(f"Split into {len(chunks)} chunks")
-                transcription = self.speech_recognizer.transcribe_chunks(chunks)
-            else:
-                print("Transcribing audio...")
-                transcription = self.speech_recognizer.transcribe_audio(audio_array)
+            cache_key = None
+            transcription = None
+            corrected_transcription = None
+            self.journal = None
+            self.journal_report = None
+            self.stage_report = None
+            self.failed_chunks = 0
+            if self.cache or self.use_journal:
+                cache_key = transcript_key(audio_path, self.cache_model_name, use_vad, self.chunk_plan)
+            if self.use_journal:
+                from job_journal import JobJournal
+                self.journal = JobJournal(cache_key)
+            if self.cache:
+                cached = self.cache.get_transcript(cache_key)
+                if cached is not None:
+                    transcription, self.words = cached
+                    print("Raw transcription loaded from cache")
+                    self.report_progress(80, "Raw transcription loaded from cache")
+            if pipelined:
+                from staged_pipeline import StagedPipeline
+                # Looked up before transcribing, so a cached correction is not worked on alongside
+                if use_groq_correction and self.cache:
+                    corrected_transcription = self.cache.get_corrected(cache_key)
+                correct = use_groq_correction and corrected_transcription is None
+                self.stages = StagedPipeline(self.groq_processor if correct else None, self.journal)
+                if transcription is not None:
+                    self.feed_stages(0, transcription)
+
+            if transcription is None:
+                transcription = self.transcribe_file(audio_path, use_vad)
+                if self.failed_chunks:
+                    print(f"{self.failed_chunks} chunks failed to transcribe; re-run to retry them")
+                elif self.cache:
+                    self.cache.set_raw(cache_key, transcription, self.words)
         
             print(f"\nRaw transcription:\n{transcription}")
             
             # Post-process with Groq
             if use_groq_correction and transcription.strip():
-                print("Post-processing with Groq...")
-                corrected_transcription = self.groq_processor.correct_transcription(transcription)
+                if not pipelined and self.cache:
+                    corrected_transcription = self.cache.get_corrected(cache_key)
+                if corrected_transcription is None:
+                    print("Post-processing with Groq...")
+                    self.report_progress(80, "Post-processing with Groq...")
+                    if self.stages:
+                        corrected_transcription = self.stages.finish(transcription)
+                    else:
+                        corrected_transcription = self.groq_processor.correct_transcription(transcription,
+                                                                                            self.journal)
+                    # Identical text means the API call failed and fell back, so do not cache it
+                    if self.cache and corrected_transcription != transcription and not self.failed_chunks:
+                        self.cache.set_corrected(cache_key, corrected_transcription)
+                else:
+                    print("Corrected transcription loaded from cache")
+                    self.report_progress(80, "Corrected transcription loaded from cache")
                 print(f"\nCorrected transcription:\n{corrected_transcription}")
+                # A fallback to the raw text keeps the journal, so a re-run retries only the correction
+                self.finish_journal(complete=corrected_transcription != transcription and not self.failed_chunks)
                 return corrected_transcription
             else:
+                self.finish_journal(complete=not self.failed_chunks)
                 return transcription
                 
         except Exception as e:
+            self.finish_journal(complete=False)
+            if raise_errors:
+                raise
             print(f"Error in processing pipeline: {str(e)}")
             import traceback
             traceback.print_exc()
             return f"Error: {str(e)}"
+        finally:
+            if self.stages:
+                self.stages.close()
+                self.stage_report = self.stages.report()
+                self.stages = None
+
+    def process_audio_file_pipelined(self, audio_path, use_groq_correction=True, use_vad=config.VAD_ENABLED,
+                                     raise_errors=False):
+        """process_audio_file with decoding, inference and correction overlapped across stages"""
+        result = self.process_audio_file(audio_path, use_groq_correction, use_vad, raise_errors, pipelined=True)
+        report = self.stage_report
+        if report:
+            print(f"\nStage utilization over {report['wall_time']:.2f}s:")
+            for stage in report["stages"]:
+                print(f"  {stage['stage']:<10} {100 * stage['utilization']:5.1f}% busy, "
+                      f"starved {stage['starved']:.2f}s, blocked {stage['blocked']:.2f}s, {stage['items']} items")
+        return result
+
+    def stream_audio_file(self, audio_path, frame_duration=0.1):
+        """Feed an audio file through the streaming transcriber frame by frame"""
+        from streaming_transcriber import StreamingTranscriber
+        print(f"Streaming audio file: {audio_path}")
+        audio_array = self.audio_processor.load_audio(audio_path)
+        frame_size = int(frame_duration * config.SAMPLE_RATE)
+        frames = (audio_array[i:i + frame_size] for i in range(0, len(audio_array), frame_size))
+
+        transcriber = StreamingTranscriber(self.speech_recognizer)
+        finals = []
+        for event in transcriber.transcribe_stream(frames):
+            print(f"[{event['type']:>7}] {event['start']:7.2f}-{event['end']:7.2f}s "
+                  f"({event['latency']*1000:.0f} ms) {event['text']}")
+            if event["type"] == "final":
+                finals.append(event["text"])
+
+        print(f"Latency report: {transcriber.latency_report()}")
+        return " ".join(text for text in finals if text)
+
+def run_backend_comparison(pipeline, audio_path):
+    """Print real-time factor and WER against fp32 for every inference backend"""
+    from inference_backends import compare_backends
+
+    audio_array = pipeline.audio_processor.load_audio(audio_path)
+    audio_array = pipeline.audio_processor.preprocess_audio(audio_array)
+    chunks = pipeline.audio_processor.chunk_audio(audio_array)
+    rows = compare_backends(pipeline.speech_recognizer, chunks)
+
+    print("\n" + "="*50)
+    print(f"{'backend':<10} {'seconds':>9} {'RTF':>7} {'WER vs fp32':>12}")
+    for row in rows:
+        if "error" in row:
+            print(f"{row['backend']:<10} failed: {row['error']}")
+        else:
+            # No fp32 reference when eager itself failed
+            wer = "n/a" if row["wer_vs_fp32"] is None else f"{row['wer_vs_fp32']:.3%}"
+            print(f"{row['backend']:<10} {row['seconds']:9.2f} {row['rtf']:7.3f} {wer:>12}")
+
+def run_calibration(args):
+    """Profile the speech model on this machine and store its chunk cost curve"""
+    from chunk_planner import ChunkPlanner
+
+    pipeline = SpeechToTextPipeline(use_cache=False, model_name=args.model or None)
+    planner = ChunkPlanner()
+    print(f"Calibrating {pipeline.model_name} ({config.INFERENCE_BACKEND} backend)...")
+    plan = planner.calibrate(pipeline.speech_recognizer, pipeline.model_name, config.INFERENCE_BACKEND)
+    print(f"Cost curve saved to: {planner.profile_path}")
+    print(f"Chunk plan: {plan.describe()}")
+
+def format_journal_report(report):
+    """One line on how much work a run resumed from its journal and how much it did itself"""
+    chunks = report["chunks_skipped"] + report["chunks_done"]
+    seconds = report["seconds_skipped"] + report["seconds_done"]
+    segments = report["segments_skipped"] + report["segments_done"]
+    return (f"resumed {report['chunks_skipped']}/{chunks} chunks ({report['seconds_skipped']:.1f}s of "
+            f"{seconds:.1f}s audio) and {report['segments_skipped']}/{segments} corrected segments")
+
+def run_batch(args):
+    """Transcribe every input on a pool of worker processes"""
+    from batch_runner import BatchRunner, collect_inputs
+
+    audio_paths = collect_inputs(args.batch)
+    if not audio_paths:
+        print("No audio files found for batch mode")
+        return
+
+    runner = BatchRunner(
+        workers=args.workers,
+        use_groq=not args.no_groq,
+        use_vad=not args.no_vad,
+        use_cache=config.CACHE_ENABLED and not args.no_cache,
+        model_name=args.model or None,
+        overlap_duration=args.overlap
+    )
+    summary = runner.run(audio_paths, args.output)
+
+    print("\n" + "="*50)
+    print(f"Batch complete: {summary['ok']} ok, {summary['error']} failed, "
+          f"{summary['seconds']:.2f}s ({summary['files_per_second']:.2f} files/s)")
+    print(f"Results written to: {args.output}")
 
 def main():
+    # Enabled before parsing so the profile covers everything imported from here on
+    if "--startup-profile" in sys.argv:
+        startup.enable()
+
     parser = argparse.ArgumentParser(description="Speech-to-Text with Transformer Models")
-    parser.add_argument("--audio", type=str, required=True, help="Path to audio file")
+    parser.add_argument("--audio", type=str, help="Path to audio file")
+    parser.add_argument("--batch", nargs="+", metavar="INPUT",
+                        help="Directories, glob patterns or manifest files to transcribe in batch mode")
+    parser.add_argument("--workers", type=int, default=config.BATCH_WORKERS, help="Worker processes for batch and sharded modes")
+    parser.add_argument("--output", type=str, default="batch_results.jsonl", help="JSONL output for batch mode")
     parser.add_argument("--no-groq", action="store_true", help="Disable Groq post-processing")
-    parser.add_argument("--model", type=str, default="", help="Specific model to use")
+    parser.add_argument("--model", type=str, default="",
+                        help=f"Specific model to use (default {config.SPEECH_MODEL_NAME}; "
+                             f"options: {', '.join(config.AVAILABLE_MODELS)})")
+    parser.add_argument("--stream", action="store_true", help="Simulate real-time streaming transcription")
+    parser.add_argument("--backend", choices=list(BACKENDS), default=config.INFERENCE_BACKEND,
+                        help="Inference backend for the speech model")
+    parser.add_argument("--compare-backends", action="store_true",
+                        help="Benchmark every inference backend on the audio file against eager fp32")
+    parser.add_argument("--calibrate", action="store_true",
+                        help="Measure the model's time and memory per chunk length here and store the chunk plan")
+    parser.add_argument("--startup-profile", action="store_true",
+                        help="Report import and initialization time of each component")
+    parser.add_argument("--sharded", action="store_true",
+                        help="Spread one file's chunks over --workers processes reading the audio from shared memory")
+    parser.add_argument("--cascade", nargs="?", const=config.CASCADE_LARGE_MODEL, metavar="LARGE_MODEL",
+                        help="Re-run only low-confidence chunks on a larger model "
+                             f"(default {config.CASCADE_LARGE_MODEL}); not used by --sharded or --batch")
+    parser.add_argument("--cascade-threshold", type=float, default=config.CASCADE_CONFIDENCE_THRESHOLD,
+                        help="Mean token probability below which a chunk is escalated in --cascade mode")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="Overlap decoding, inference and Groq correction in concurrent stages")
+    parser.add_argument("--summarize", action="store_true",
+                        help="Also summarize the transcript with Groq (map-reduce over sections for long ones)")
+    parser.add_argument("--overlap", type=float, metavar="SECONDS",
+                        help="With --no-vad, cut audio longer than one chunk into windows sharing this many seconds "
+                             "and stitch their logits; allows short, low-memory chunks without losing boundary "
+                             f"words (default {config.CHUNK_OVERLAP_DURATION})")
+    parser.add_argument("--no-vad", action="store_true", help="Disable voice activity detection")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the on-disk transcription cache")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Do not checkpoint chunk results or resume an interrupted run of the same file")
+    parser.add_argument("--groq-cache", choices=["on", "off", "only"], default=config.GROQ_CACHE_MODE,
+                        help="Groq response cache mode; 'only' replays cached responses without API calls")
+    parser.add_argument("--format", choices=["txt", "srt", "vtt", "json"], default="txt",
+                        help="Output format; srt, vtt and json carry word timings from the raw transcript")
+    parser.add_argument("--metrics-log", type=str, help="Append one JSON line per pipeline stage run to this file")
+    parser.add_argument("--metrics", type=str, help="Write a Prometheus text snapshot of per-stage metrics here")
+    parser.add_argument("--profile-trace", type=str, help="Save a torch profiler (Chrome trace) of the run here")
     
     args = parser.parse_args()
+    if args.overlap is not None:
+        if args.overlap < 0:
+            parser.error("--overlap must not be negative")
+        if args.overlap > 0 and not args.no_vad:
+            parser.error("--overlap applies to audio cut without VAD; add --no-vad")
+        if args.overlap > 0 and args.stream:
+            parser.error("--overlap does not apply to --stream")
+        if args.overlap > 0 and args.sharded:
+            parser.error("--overlap does not apply to --sharded")
+    else:
+        args.overlap = config.CHUNK_OVERLAP_DURATION
+    if args.cascade and args.overlap > 0 and args.no_vad:
+        parser.error("--cascade escalates whole chunks and cannot re-run stitched windows; "
+                     "drop --overlap (or set CHUNK_OVERLAP_DURATION=0)")
     
+    # Exported too, so batch worker processes pick up the same settings
+    config.GROQ_CACHE_MODE = os.environ["GROQ_CACHE_MODE"] = args.groq_cache
+    config.INFERENCE_BACKEND = os.environ["INFERENCE_BACKEND"] = args.backend
+    config.CASCADE_CONFIDENCE_THRESHOLD = args.cascade_threshold
+    if args.no_resume:
+        config.JOURNAL_ENABLED = False
+        os.environ["JOURNAL"] = "0"
+    if args.metrics_log or args.metrics:
+        instrumentation.configure(enabled=True, log_path=args.metrics_log)
+        os.environ["INSTRUMENTATION"] = "1"
+        if args.metrics_log:
+            os.environ["INSTRUMENTATION_LOG"] = os.path.abspath(args.metrics_log)
+
+    if args.calibrate:
+        run_calibration(args)
+        return
+
+    if args.batch:
+        run_batch(args)
+        return
+
+    if not args.audio:
+        parser.error("one of --audio or --batch is required")
+
     if not os.path.exists(args.audio):
         print(f"Audio file not found: {args.audio}")
         return
     
     # Initialize pipeline
-    pipeline = SpeechToTextPipeline()
+    pipeline = SpeechToTextPipeline(use_cache=config.CACHE_ENABLED and not args.no_cache,
+                                    model_name=args.model or None,
+                                    shard_workers=args.workers if args.sharded else 0,
+                                    cascade_model=args.cascade,
+                                    use_journal=config.JOURNAL_ENABLED and not args.no_resume,
+                                    overlap_duration=args.overlap)
+
+    if args.compare_backends:
+        run_backend_comparison(pipeline, args.audio)
+        return
     
     try:
         start_time = time.time()
         
         # Process audio
-        result = pipeline.process_audio_file(args.audio, not args.no_groq)
+        with torch_profile(args.profile_trace):
+            if args.stream:
+                result = pipeline.stream_audio_file(args.audio)
+            elif args.pipelined:
+                result = pipeline.process_audio_file_pipelined(args.audio, not args.no_groq, use_vad=not args.no_vad)
+            else:
+                result = pipeline.process_audio_file(args.audio, not args.no_groq, use_vad=not args.no_vad)
         
         processing_time = time.time() - start_time
         
@@ -84,18 +719,55 @@ def main():
         print("="*50)
         print(result)
         print(f"\nProcessing time: {processing_time:.2f} seconds")
+        # Only report on components that were actually initialized
+        if pipeline._audio_processor is not None:
+            for row in pipeline.audio_processor.decoders.report():
+                print(f"Decode {row['format']} via {row['decoder']}: {row['seconds']:.3f}s "
+                      f"for {row['audio_seconds']:.1f}s of audio ({row['x_realtime']:.0f}x real time)")
+        if pipeline._speech_recognizer is not None and pipeline.cascade_model:
+            cascade = pipeline.speech_recognizer.report()
+            print(f"Cascade: escalated {cascade['escalated_chunks']}/{cascade['chunks']} chunks, "
+                  f"{cascade['escalated_seconds']:.1f}s of {cascade['audio_seconds']:.1f}s audio "
+                  f"({cascade['escalated_fraction']:.1%}); base model {cascade['small_seconds']:.2f}s, "
+                  f"large model {cascade['large_seconds']:.2f}s")
+        if pipeline.journal_report:
+            print(f"Journal: {format_journal_report(pipeline.journal_report)}")
+        if pipeline.cache:
+            print(f"Cache: {pipeline.cache.report()}")
+        if pipeline._groq_processor is not None:
+            print(f"Groq response cache: {pipeline.groq_processor.cache_report()}")
         
         # Save result to file
-        output_file = f"{os.path.splitext(args.audio)[0]}_transcription.txt"
+        from subtitles import format_transcript
+        if args.format != "txt" and not pipeline.words:
+            print(f"Warning: no word timings available in this mode, the {args.format} output will be empty")
+        output_file = f"{os.path.splitext(args.audio)[0]}_transcription.{args.format}"
         with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(result)
+            f.write(format_transcript(args.format, result, pipeline.words))
         
         print(f"\nTranscription saved to: {output_file}")
+
+        if args.summarize and result.strip() and not result.startswith("Error:"):
+            print("\nSummarizing transcript...")
+            summary = pipeline.groq_processor.summarize_text(result)
+            print(f"\nSUMMARY:\n{summary}")
+            summary_file = f"{os.path.splitext(args.audio)[0]}_summary.txt"
+            with open(summary_file, 'w', encoding='utf-8') as f:
+                f.write(summary)
+            print(f"Summary saved to: {summary_file}")
         
     except Exception as e:
         print(f"Error processing audio: {str(e)}")
         import traceback
         traceback.print_exc()
+    finally:
+        pipeline.close()
+
+    if args.metrics:
+        instrumentation.write_prometheus(args.metrics)
+        print(f"Metrics snapshot saved to: {args.metrics}")
+    if args.startup_profile:
+        print(startup.report())
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,115 @@
+import threading
+import time
+from model_registry import registry
+from speech_recognizer import SpeechRecognizer
+from config import config
+
+class CascadeRecognizer(SpeechRecognizer):
+    """Run every chunk through a small model and only the doubtful ones through a large one
+
+    Chunks are first transcribed by the small model; those whose confidence
+    (mean probability of the emitted CTC tokens) falls below `threshold` are
+    transcribed again by the large model and its result replaces theirs. The
+    large model is loaded from the registry on the first escalation, so audio
+    the small model handles confidently never pays for it, and batches its
+    chunks by its own chunk plan (they are cut for the small one). Everything else
+    (batch, stream and chunk helpers) is inherited and runs through the
+    cascade; frame-level calls such as compute_logits use the small model.
+    Overlapping windows are merged before there is a chunk to score, so
+    transcribe_windows is not supported.
+    """
+
+    def __init__(self, small, large_model_name=config.CASCADE_LARGE_MODEL,
+                 threshold=config.CASCADE_CONFIDENCE_THRESHOLD):
+        # Wraps two loaded recognizers instead of loading a model of its own
+        self.small = small
+        self.large_model_name = large_model_name
+        self._large = None
+        self._large_plan = None
+        self.threshold = threshold
+        self.model_name = f"{small.model_name}>{large_model_name}@{threshold}"
+        self.model = small.model
+        self.processor = small.processor
+        self.device = small.device
+        self.backend = small.backend
+        self.use_attention_mask = small.use_attention_mask
+        self.ctc_decoder = small.ctc_decoder
+        self.lock = small.lock
+        self.stats_lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def large(self):
+        if self._large is None:
+            self._large = registry.get(self.large_model_name)
+        return self._large
+
+    @property
+    def large_plan(self):
+        """Chunk plan of the large model on its device, whose memory per chunk can be far above the small one's"""
+        if self._large_plan is None:
+            from chunk_planner import ChunkPlanner
+            self._large_plan = ChunkPlanner().plan(self.large_model_name, config.INFERENCE_BACKEND, self.large.device)
+        return self._large_plan
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.stats = {
+                "chunks": 0, "escalated_chunks": 0,
+                "audio_seconds": 0.0, "escalated_seconds": 0.0,
+                "small_seconds": 0.0, "large_seconds": 0.0
+            }
+
+    def compute_logits(self, audio_arrays):
+        return self.small.compute_logits(audio_arrays)
+
+    def decode_logits(self, logits_list):
+        return self.small.decode_logits(logits_list)
+
+    def transcribe_windows(self, windows, total_samples, batch_size=None, max_batch_samples=None, owned=None):
+        raise Exception("Overlapping windows cannot be escalated by a cascade; use chunks without overlap")
+
+    def transcribe_audio_scored(self, audio_array):
+        return self.transcribe_batch_scored([audio_array])[0]
+
+    def transcribe_batches_scored(self, audio_chunks, batches):
+        """Small model batch by batch, then the large model on each batch's low-confidence chunks
+
+        Escalating per planned batch keeps the large model's batches the same
+        whether the caller runs them all at once or checkpoints in between.
+        """
+        start_time = time.perf_counter()
+        for batch, results in self.small.transcribe_batches_scored(audio_chunks, batches):
+            small_seconds = time.perf_counter() - start_time
+            chunks = [audio_chunks[i] for i in batch]
+            escalate = [j for j, (_, _, confidence) in enumerate(results) if confidence < self.threshold]
+            large_seconds = 0.0
+            if escalate:
+                print(f"Escalating {len(escalate)}/{len(chunks)} low-confidence chunks "
+                      f"to {self.large_model_name}...")
+                large_start = time.perf_counter()
+                escalated = [chunks[j] for j in escalate]
+                batch_size, max_batch_samples = self.large_plan.batch_limits(
+                    max(len(chunk) for chunk in escalated) / config.SAMPLE_RATE)
+                rerun = self.large.transcribe_batch_scored(escalated, batch_size, max_batch_samples)
+                large_seconds = time.perf_counter() - large_start
+                for j, result in zip(escalate, rerun):
+                    results[j] = result
+
+            with self.stats_lock:
+                self.stats["chunks"] += len(chunks)
+                self.stats["escalated_chunks"] += len(escalate)
+                self.stats["audio_seconds"] += sum(len(chunk) for chunk in chunks) / config.SAMPLE_RATE
+                self.stats["escalated_seconds"] += sum(len(chunks[j]) for j in escalate) / config.SAMPLE_RATE
+                self.stats["small_seconds"] += small_seconds
+                self.stats["large_seconds"] += large_seconds
+            yield batch, results
+            start_time = time.perf_counter()
+
+    def report(self):
+        """Escalation totals since the last reset, with the fraction of audio sent to the large model"""
+        with self.stats_lock:
+            report = dict(self.stats)
+        report["escalated_fraction"] = (report["escalated_seconds"] / report["audio_seconds"]
+                                        if report["audio_seconds"] > 0 else 0.0)
+        return report
@@ -0,0 +1,60 @@
+import threading
+from collections import OrderedDict
+from config import config
+
+class ModelRegistry:
+    """Process-wide SpeechRecognizer instances, loaded lazily and shared by every caller
+
+    Models are keyed by (model name, device, backend). Concurrent requests for
+    a model that is still loading wait for that one load instead of starting
+    their own, and at most `max_models` stay resident (least recently used
+    are dropped first).
+    """
+
+    def __init__(self, max_models=config.MAX_RESIDENT_MODELS):
+        self.max_models = max_models
+        self.models = OrderedDict()
+        self.loading = {}
+        self.lock = threading.Lock()
+
+    def get(self, model_name=None, device=None, backend=None):
+        """Return the shared recognizer for this model, loading it on first use"""
+        from speech_recognizer import SpeechRecognizer
+
+        key = (model_name or config.SPEECH_MODEL_NAME, device, backend or config.INFERENCE_BACKEND)
+        while True:
+            with self.lock:
+                if key in self.models:
+                    self.models.move_to_end(key)
+                    return self.models[key]
+                event = self.loading.get(key)
+                if event is None:
+                    event = self.loading[key] = threading.Event()
+                    break
+            # Someone else is loading this model; wait and look again
+            event.wait()
+
+        try:
+            recognizer = SpeechRecognizer(key[0], backend=key[2], device=device)
+            with self.lock:
+                self.models[key] = recognizer
+                while len(self.models) > self.max_models:
+                    # Callers still holding the evicted model keep it alive until they finish
+                    evicted, _ = self.models.popitem(last=False)
+                    print(f"Evicting model from registry: {evicted[0]}")
+            return recognizer
+        finally:
+            with self.lock:
+                del self.loading[key]
+            event.set()
+
+    def resident(self):
+        """Keys of the models currently in memory, least recently used first"""
+        with self.lock:
+            return list(self.models)
+
+    def clear(self):
+        with self.lock:
+            self.models.clear()
+
+registry = ModelRegistry()
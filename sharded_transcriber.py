@@ -0,0 +1,155 @@
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+import numpy as np
+from batch_runner import split_cores
+from chunk_planner import plan_batches
+from config import config
+
+# Per-process state, set up once by _init_worker
+_recognizer = None
+_cores = None
+
+def _init_worker(core_queue, model_name, backend):
+    """Pin this worker to its cores, size torch's thread pool to match and load the model once"""
+    global _recognizer, _cores
+    _cores = core_queue.get()
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, _cores)
+
+    import torch
+    torch.set_num_threads(len(_cores))
+    torch.set_num_interop_threads(1)
+
+    from model_registry import registry
+    _recognizer = registry.get(model_name, device="cpu", backend=backend)
+
+def _transcribe_shard(shm_name, length, shard):
+    """Transcribe (index, start, end) spans read as zero-copy views of the shared audio, as one batch"""
+    start_time = time.perf_counter()
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        audio = np.ndarray((length,), dtype=np.float32, buffer=shm.buf)
+        chunks = [audio[start:end] for _, start, end in shard]
+        [(_, scored)] = _recognizer.transcribe_batches_scored(chunks, [list(range(len(chunks)))])
+        results = [(text, words) for text, words, _ in scored]
+        # Views into the buffer must be gone before it can be closed
+        del chunks, audio
+    finally:
+        shm.close()
+
+    return {
+        "worker": os.getpid(),
+        "cores": len(_cores),
+        "results": [(index, text, words) for (index, _, _), (text, words) in zip(shard, results)],
+        "chunks": len(shard),
+        "audio_seconds": sum(end - start for _, start, end in shard) / config.SAMPLE_RATE,
+        "seconds": time.perf_counter() - start_time
+    }
+
+class ShardedTranscriber:
+    """Transcribe the chunks of one long file on a pool of worker processes
+
+    The decoded audio is copied once into shared memory and workers slice it
+    in place, so only (start, end) offsets and the resulting text cross the
+    process boundary. Each worker owns a model and a contiguous share of the
+    cores, which scales better than one process with many intra-op threads
+    on small per-chunk tensors.
+    """
+
+    def __init__(self, workers=config.SHARD_WORKERS, model_name=None, backend=None,
+                 chunks_per_shard=config.SHARD_CHUNKS):
+        self.core_sets = split_cores(workers)
+        self.workers = len(self.core_sets)
+        self.model_name = model_name
+        self.backend = backend
+        self.chunks_per_shard = chunks_per_shard
+        self.executor = None
+        self.startup_seconds = 0.0
+
+    def _start_pool(self):
+        context = multiprocessing.get_context("spawn")
+        core_queue = context.Queue()
+        for cores in self.core_sets:
+            core_queue.put(cores)
+        start_time = time.perf_counter()
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_init_worker,
+                                            initargs=(core_queue, self.model_name, self.backend))
+        # Bring the workers up (and their models loaded) before anything is timed
+        for future in [self.executor.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+        self.startup_seconds = time.perf_counter() - start_time
+        print(f"Started {self.workers} shard workers ({len(self.core_sets[0])} cores each) "
+              f"in {self.startup_seconds:.2f}s")
+
+    def transcribe(self, audio_array, spans, on_result=None, batches=None):
+        """Transcribe [(start, end)] sample spans of audio_array
+
+        Returns ([(text, words)] in span order, with word times relative to each
+        span, and a report with wall time and per-worker timings).
+        `on_result(index, text, words)` is called as each span's result arrives.
+        Each of `batches` (lists of span indices, see plan_batches) is sent to
+        a worker as one task and run as one forward pass; spans in none of them
+        are skipped and come back empty. By default every span is transcribed,
+        `chunks_per_shard` at a time.
+        """
+        if self.executor is None:
+            self._start_pool()
+
+        audio_array = np.ascontiguousarray(audio_array, dtype=np.float32)
+        if batches is None:
+            batches = plan_batches([end - start for start, end in spans], self.chunks_per_shard)
+        # Longest spans first (as plan_batches orders them) so the last shards to finish are short ones
+        shards = [[(i, spans[i][0], spans[i][1]) for i in batch] for batch in batches]
+
+        results = [("", [])] * len(spans)
+        workers = {}
+        shm = shared_memory.SharedMemory(create=True, size=max(audio_array.nbytes, 1))
+        start_time = time.perf_counter()
+        try:
+            np.ndarray(audio_array.shape, dtype=np.float32, buffer=shm.buf)[:] = audio_array
+            futures = [self.executor.submit(_transcribe_shard, shm.name, len(audio_array), shard)
+                       for shard in shards]
+            for future in as_completed(futures):
+                shard = future.result()
+                for index, text, words in shard["results"]:
+                    results[index] = (text, words)
+                    if on_result:
+                        on_result(index, text, words)
+                stats = workers.setdefault(shard["worker"], {
+                    "worker": shard["worker"], "cores": shard["cores"], "shards": 0, "chunks": 0,
+                    "seconds": 0.0, "audio_seconds": 0.0
+                })
+                stats["shards"] += 1
+                stats["chunks"] += shard["chunks"]
+                stats["seconds"] += shard["seconds"]
+                stats["audio_seconds"] += shard["audio_seconds"]
+        finally:
+            shm.close()
+            shm.unlink()
+        wall_time = time.perf_counter() - start_time
+
+        for stats in workers.values():
+            stats["x_realtime"] = stats["audio_seconds"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+        audio_seconds = sum(end - start for shard in shards for _, start, end in shard) / config.SAMPLE_RATE
+        report = {
+            "wall_time": wall_time,
+            "startup_seconds": self.startup_seconds,
+            "audio_seconds": audio_seconds,
+            "x_realtime": audio_seconds / wall_time if wall_time > 0 else 0.0,
+            "workers": sorted(workers.values(), key=lambda stats: stats["worker"])
+        }
+        return results, report
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,21 +1,46 @@
 from transformers import Wav2Vec2Processor, Wav2Vec2ForCTC
+import threading
 import torch
 import numpy as np
+from chunk_planner import plan_batches
 from config import config
+from ctc_decoder import CTCDecoder, WindowStitcher, offset_words
+from inference_backends import build_backend
+from instrumentation import instrumentation
 
 class SpeechRecognizer:
-    def __init__(self, model_name=config.SPEECH_MODEL_NAME):
+    def __init__(self, model_name=config.SPEECH_MODEL_NAME, backend=None, device=None):
+        backend = backend or config.INFERENCE_BACKEND
         self.model_name = model_name
         print(f"Loading model: {model_name}")
         self.processor = Wav2Vec2Processor.from_pretrained(model_name)
         self.model = Wav2Vec2ForCTC.from_pretrained(model_name)
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        # int8 and ONNX Runtime backends are CPU-only
+        use_cuda = torch.cuda.is_available() and backend in ("eager", "compile")
+        self.device = torch.device(device or ("cuda" if use_cuda else "cpu"))
         print(f"Using device: {self.device}")
         self.model.to(self.device)
         self.model.eval()  # Set to evaluation mode
+        # Base checkpoints are trained without an attention mask and expect zero padding instead
+        self.use_attention_mask = bool(getattr(self.processor.feature_extractor, "return_attention_mask", False))
+        print(f"Inference backend: {backend}")
+        self.backend = build_backend(backend, self.model, model_name, self.use_attention_mask)
+        # One logit frame per `inputs_to_logits_ratio` samples (20 ms for Wav2Vec2)
+        frame_duration = self.model.config.inputs_to_logits_ratio / config.SAMPLE_RATE
+        self.ctc_decoder = CTCDecoder(self.processor.tokenizer, frame_duration)
+        # Shared instances serve several threads; one forward pass at a time avoids oversubscribing cores
+        self.lock = threading.Lock()
         
     def transcribe_audio(self, audio_array):
         """Transcribe audio using Wav2Vec2 model"""
+        return self.transcribe_audio_timed(audio_array)[0]
+
+    def transcribe_audio_timed(self, audio_array):
+        """Transcribe one array, returning (text, words) with word times relative to its start"""
+        return self.transcribe_audio_scored(audio_array)[:2]
+
+    def transcribe_audio_scored(self, audio_array):
+        """Transcribe one array, returning (text, words, confidence)"""
         try:
             # Ensure audio is numpy array
             if isinstance(audio_array, torch.Tensor):
@@ -37,20 +62,220 @@ class SpeechRecognizer:
             input_values = inputs.input_values.to(self.device)
             
             # Inference
-            with torch.no_grad():
-                logits = self.model(input_values).logits
+            with instrumentation.stage("inference", audio_seconds=len(audio_array) / config.SAMPLE_RATE, chunks=1):
+                with self.lock:
+                    logits = self.backend(input_values)
                 
             # Decode
-            predicted_ids = torch.argmax(logits, dim=-1)
-            transcription = self.processor.batch_decode(predicted_ids)
-            
-            return transcription[0] if isinstance(transcription, list) else transcription
+            frame_lengths = torch.tensor([logits.shape[1]], device=logits.device)
+            return self.decode_batch(logits, frame_lengths)[0]
             
         except Exception as e:
             raise Exception(f"Transcription error: {str(e)}")
     
-    def transcribe_chunks(self, audio_chunks):
+    def make_batches(self, lengths, batch_size=None, max_batch_samples=None):
+        """Group chunk indices into length-bucketed batches (see chunk_planner.plan_batches)"""
+        return plan_batches(lengths, batch_size, max_batch_samples)
+
+    def compute_logits(self, audio_arrays):
+        """Run one padded batch through the model and return per-chunk logits"""
+        logits, frame_lengths = self._forward(audio_arrays)
+        return [logits[i, :int(frame_lengths[i])] for i in range(len(frame_lengths))]
+
+    def _forward(self, audio_arrays):
+        """Padded batch logits plus the number of real (non-padding) frames per chunk"""
+        arrays = []
+        for audio_array in audio_arrays:
+            if isinstance(audio_array, torch.Tensor):
+                audio_array = audio_array.numpy()
+            if len(audio_array) < config.SAMPLE_RATE:  # Less than 1 second
+                audio_array = np.pad(audio_array, (0, config.SAMPLE_RATE - len(audio_array)))
+            arrays.append(audio_array)
+
+        inputs = self.processor(
+            arrays,
+            sampling_rate=config.SAMPLE_RATE,
+            return_tensors="pt",
+            padding=True,
+            return_attention_mask=True
+        )
+
+        input_values = inputs.input_values.to(self.device)
+        attention_mask = inputs.attention_mask.to(self.device)
+
+        audio_seconds = sum(len(audio_array) for audio_array in arrays) / config.SAMPLE_RATE
+        with instrumentation.stage("inference", audio_seconds=audio_seconds, chunks=len(arrays),
+                                   padded_samples=int(input_values.numel())):
+            with self.lock:
+                logits = self.backend(input_values, attention_mask if self.use_attention_mask else None)
+
+        # Frames past these lengths only cover padding
+        frame_lengths = self.model._get_feat_extract_output_lengths(attention_mask.sum(-1))
+        return logits, frame_lengths
+
+    def decode_batch(self, logits, frame_lengths):
+        """Greedy CTC decode of a padded logits batch into (text, words, confidence) per chunk"""
+        with instrumentation.stage("decode_text", chunks=len(frame_lengths)):
+            top_probs, predicted_ids = torch.softmax(logits.float(), dim=-1).max(dim=-1)
+            confidences = self.confidence(top_probs, predicted_ids, frame_lengths)
+            decoded = self.ctc_decoder.decode(predicted_ids.cpu().numpy(), frame_lengths.cpu().numpy())
+            return [(text, words, confidence) for (text, words), confidence in zip(decoded, confidences)]
+
+    def confidence(self, top_probs, predicted_ids, frame_lengths):
+        """Mean argmax probability over the frames that emit a token, per chunk
+
+        Blank frames are almost always near-certain, so averaging over them
+        would hide uncertain characters; chunks that are all blank (silence)
+        are scored over every real frame instead.
+        """
+        frames = torch.arange(top_probs.shape[1], device=top_probs.device)[None, :]
+        valid = frames < frame_lengths.to(top_probs.device)[:, None]
+        emitting = valid & (predicted_ids != self.ctc_decoder.blank_id)
+        mask = torch.where(emitting.any(dim=-1, keepdim=True), emitting, valid).float()
+        return ((top_probs * mask).sum(dim=-1) / mask.sum(dim=-1).clamp(min=1)).tolist()
+
+    def decode_logits(self, logits_list):
+        """Greedy CTC decode of per-chunk logits"""
+        if not logits_list:
+            return []
+        with instrumentation.stage("decode_text", chunks=len(logits_list)):
+            lengths = [len(logits) for logits in logits_list]
+            predicted_ids = np.full((len(logits_list), max(lengths)), self.ctc_decoder.blank_id)
+            for i, logits in enumerate(logits_list):
+                predicted_ids[i, :lengths[i]] = torch.argmax(logits, dim=-1).cpu().numpy()
+            return [text for text, _ in self.ctc_decoder.decode(predicted_ids, lengths)]
+
+    def transcribe_batch_timed(self, audio_chunks, batch_size=None, max_batch_samples=None):
+        """Like transcribe_batch, but returns (text, words) per chunk with chunk-relative word times
+
+        A chunk that cannot be transcribed even on its own comes back as
+        (None, []), so callers can tell it from silence and retry it later.
+        """
+        return [(text, words) for text, words, _ in
+                self.transcribe_batch_scored(audio_chunks, batch_size, max_batch_samples)]
+
+    def transcribe_batch_scored(self, audio_chunks, batch_size=None, max_batch_samples=None):
+        """Like transcribe_batch_timed, with each chunk's decoding confidence as a third element"""
+        results = [(None, [], 0.0)] * len(audio_chunks)
+        batches = self.make_batches([len(chunk) for chunk in audio_chunks], batch_size, max_batch_samples)
+        for batch, batch_results in self.transcribe_batches_scored(audio_chunks, batches):
+            for i, result in zip(batch, batch_results):
+                results[i] = result
+        return results
+
+    def transcribe_batches_scored(self, audio_chunks, batches):
+        """Run planned batches of chunk indices (see make_batches) one at a time
+
+        Yields (batch, results) in batch order, each result being (text, words,
+        confidence) for the chunk at the same position in the batch, so a
+        caller can checkpoint after every forward pass without changing which
+        chunks share one. A chunk that fails on its own too is (None, [], 0.0).
+        """
+        for b, batch in enumerate(batches):
+            print(f"Processing batch {b+1}/{len(batches)} ({len(batch)} chunks)...")
+            try:
+                logits, frame_lengths = self._forward([audio_chunks[i] for i in batch])
+                yield batch, self.decode_batch(logits, frame_lengths)
+            except Exception as e:
+                # Retry one chunk at a time so a single bad chunk does not drop the batch
+                print(f"Error processing batch {b+1}: {e}. Retrying chunks individually...")
+                results = []
+                for i in batch:
+                    try:
+                        results.append(self.transcribe_audio_scored(audio_chunks[i]))
+                    except Exception as chunk_error:
+                        print(f"Error processing chunk {i+1}: {chunk_error}")
+                        results.append((None, [], 0.0))
+                yield batch, results
+
+    def transcribe_windows(self, windows, total_samples, batch_size=None, max_batch_samples=None, owned=None):
+        """Transcribe overlapping (offset, window) pairs as one sequence, returning (text, words)
+
+        Window log-probabilities are cross-faded at the logit level (see
+        WindowStitcher) and the merged frames are CTC-decoded once, which
+        removes boundary cuts without having to de-duplicate text. With
+        `owned` = (first, last) only windows first..last-1 are transcribed:
+        just they and the windows overlapping them are run, and consecutive
+        ranges join exactly with join_ranges. `total_samples` is where the audio (or the last
+        window passed) ends; word times are relative to offset 0.
+        """
+        try:
+            first, last = owned or (0, len(windows))
+            ratio = self.model.config.inputs_to_logits_ratio
+            starts = [int(round(offset / ratio)) for offset, _ in windows]
+            # Frames count from the first window passed, so a range of a long file stays small
+            origin = starts[0]
+            starts = [start - origin for start in starts]
+            total_frames = int(np.ceil(total_samples / ratio)) - origin
+            # _forward pads anything under a second up to one
+            lengths = torch.tensor([max(len(window), config.SAMPLE_RATE) for _, window in windows])
+            frames = [min(int(n), total_frames - start)
+                      for n, start in zip(self.model._get_feat_extract_output_lengths(lengths), starts)]
+            stitcher = WindowStitcher(starts, frames, total_frames)
+            needed = stitcher.overlapping(first, last)
+
+            batches = self.make_batches([len(windows[k][1]) for k in needed], batch_size, max_batch_samples)
+            for b, batch in enumerate(batches):
+                batch = [needed[i] for i in batch]
+                print(f"Processing batch {b+1}/{len(batches)} ({len(batch)} windows)...")
+                try:
+                    logits, _ = self._forward([windows[k][1] for k in batch])
+                    log_probs = torch.log_softmax(logits.float(), dim=-1).cpu().numpy()
+                    for row, k in enumerate(batch):
+                        stitcher.add(k, log_probs[row])
+                except Exception as e:
+                    # Retry one window at a time; frames of a window that still fails come from its neighbours
+                    print(f"Error processing batch {b+1}: {e}. Retrying windows individually...")
+                    for k in batch:
+                        try:
+                            logits, _ = self._forward([windows[k][1]])
+                            stitcher.add(k, torch.log_softmax(logits.float(), dim=-1).cpu().numpy()[0])
+                        except Exception as window_error:
+                            print(f"Error processing window {k+1}: {window_error}")
+
+            with instrumentation.stage("decode_text", chunks=len(needed)):
+                text, words = stitcher.decode(self.ctc_decoder, first, last)
+            return text, offset_words(words, origin * self.ctc_decoder.frame_duration)
+
+        except Exception as e:
+            raise Exception(f"Transcription error: {str(e)}")
+
+    def transcribe_batch(self, audio_chunks, batch_size=None, max_batch_samples=None):
+        """Transcribe chunks in length-bucketed batches, keeping the original order"""
+        return [text or "" for text, _ in self.transcribe_batch_timed(audio_chunks, batch_size, max_batch_samples)]
+
+    def transcribe_stream_timed(self, segments, batch_size=None, max_batch_samples=None):
+        """Transcribe (offset, chunk) pairs, yielding (offset, text, words) with absolute word times"""
+        batch_size = batch_size or config.BATCH_SIZE
+        pending = []
+
+        def flush():
+            results = self.transcribe_batch_timed([chunk for _, chunk in pending], batch_size, max_batch_samples)
+            for (offset, _), (text, words) in zip(pending, results):
+                yield offset, text, offset_words(words, offset / config.SAMPLE_RATE)
+
+        for segment in segments:
+            pending.append(segment)
+            if len(pending) >= batch_size:
+                yield from flush()
+                pending = []
+
+        if pending:
+            yield from flush()
+
+    def transcribe_stream(self, segments, batch_size=None):
+        """Transcribe a generator of (offset, chunk) pairs, yielding (offset, text) in order"""
+        for offset, text, _ in self.transcribe_stream_timed(segments, batch_size):
+            yield offset, text or ""
+
+    def transcribe_chunks(self, audio_chunks, batched=True):
         """Transcribe multiple audio chunks"""
+        if batched:
+            transcriptions = self.transcribe_batch(audio_chunks)
+            for i, transcription in enumerate(transcriptions):
+                print(f"Chunk {i+1}: {transcription[:100]}...")
+            return " ".join(transcriptions)
+
         transcriptions = []
         
         for i, chunk in enumerate(audio_chunks):
@@ -0,0 +1,230 @@
+import queue
+import threading
+import time
+from config import config
+from groq_integration import normalize_text, segment_context, split_segments
+
+_END = object()
+
+class StageStats:
+    """Busy, starved (waiting for input) and blocked (waiting on a full queue) time per stage"""
+
+    def __init__(self, name, workers=1):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+        self.starved = 0.0
+        self.blocked = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, field, seconds):
+        with self.lock:
+            setattr(self, field, getattr(self, field) + seconds)
+
+    def report(self, wall_time):
+        capacity = wall_time * self.workers
+        return {
+            "stage": self.name,
+            "workers": self.workers,
+            "items": self.items,
+            "busy": self.busy,
+            "starved": self.starved,
+            "blocked": self.blocked,
+            "utilization": self.busy / capacity if capacity > 0 else 0.0
+        }
+
+class StagedPipeline:
+    """Decoding, inference and Groq correction of one file running concurrently
+
+    The stages hook into SpeechToTextPipeline.transcribe_file, which keeps
+    its cache, journal, chunk plan and word timings. `prefetch` decodes
+    streamed audio on a thread, at most `queue_size` chunks ahead of the
+    model, and `feed` takes each chunk's text as it is transcribed. Text
+    released in chunk order is cut into the (context, segment) pairs that
+    correcting the whole transcript would use (split_segments packs greedily
+    from the start, so only the last segment can still change), and every
+    finished segment is corrected on a worker thread while inference goes on.
+    """
+
+    def __init__(self, groq_processor=None, journal=None, queue_size=config.PIPELINE_QUEUE_SIZE,
+                 correction_workers=config.GROQ_CONCURRENCY):
+        self.groq_processor = groq_processor
+        self.journal = journal
+        self.queue_size = queue_size
+        self.stop = threading.Event()
+        self.error = None
+        self.lock = threading.Lock()
+        self.start_time = time.perf_counter()
+        self.wall_time = None
+        self.stats = [StageStats("decode"), StageStats("inference"), StageStats("correction", correction_workers)]
+
+        # Chunk texts waiting for an earlier one, and released text not yet cut into segments
+        self.pending = {}
+        self.next_index = 0
+        self.buffer = ""
+        self.segments = []
+        self.corrected = {}
+        self.segment_queue = queue.Queue()
+        self.workers = []
+        # Segmenting ahead only pays off where the whole transcript would be corrected in segments too
+        if groq_processor is not None and config.GROQ_CHUNKED_CORRECTION:
+            for _ in range(correction_workers):
+                worker = threading.Thread(target=self._correction_stage, args=(self.stats[2],), daemon=True)
+                worker.start()
+                self.workers.append(worker)
+
+    def _put(self, q, item, stats):
+        start_time = time.perf_counter()
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        stats.add("blocked", time.perf_counter() - start_time)
+
+    def _get(self, q, stats):
+        start_time = time.perf_counter()
+        while not self.stop.is_set():
+            try:
+                item = q.get(timeout=0.1)
+                stats.add("starved", time.perf_counter() - start_time)
+                return item
+            except queue.Empty:
+                continue
+        return _END
+
+    def _fail(self, error):
+        if self.error is None:
+            self.error = error
+        self.stop.set()
+
+    def prefetch(self, items):
+        """Iterate `items`, e.g. lazily decoded audio blocks, produced on a thread running ahead"""
+        q = queue.Queue(maxsize=self.queue_size)
+        decode_stats = self.stats[0]
+
+        def produce():
+            try:
+                iterator = iter(items)
+                while not self.stop.is_set():
+                    # Decoding happens lazily inside next(), so time it as busy
+                    start_time = time.perf_counter()
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        break
+                    decode_stats.add("busy", time.perf_counter() - start_time)
+                    decode_stats.items += 1
+                    self._put(q, item, decode_stats)
+            except Exception as e:
+                self._fail(e)
+            finally:
+                self._put(q, _END, decode_stats)
+
+        thread = threading.Thread(target=produce, daemon=True)
+        thread.start()
+        while True:
+            item = self._get(q, self.stats[1])
+            if item is _END:
+                break
+            yield item
+        thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def feed(self, index, text, joined=False):
+        """Take the text of chunk `index`, in any order
+
+        `joined` pieces (ranges of stitched windows, see join_ranges) carry
+        the spaces around them; other chunks are separated by one.
+        """
+        with self.lock:
+            self.stats[1].items += 1
+            self.pending[index] = (text, joined)
+            while self.next_index in self.pending:
+                text, joined = self.pending.pop(self.next_index)
+                self.buffer += text if joined else f" {text} "
+                self.next_index += 1
+            self._release(final=False)
+
+    def _release(self, final):
+        """Queue the segments that later text can no longer change (all of them when `final`)"""
+        if not self.workers:
+            return
+        text = normalize_text(self.buffer)
+        if not text:
+            return
+        segments = split_segments(text, config.GROQ_SEGMENT_TOKENS, 0)
+        ready = segments if final else segments[:-1]
+        for _, segment in ready:
+            context = segment_context(self.segments[-1][1], config.GROQ_SEGMENT_OVERLAP_TOKENS) if self.segments else ""
+            self.segments.append((context, segment))
+            self.segment_queue.put((len(self.segments) - 1, context, segment))
+        if ready:
+            # The held-back segment keeps a trailing space, or the next piece may continue its last word
+            self.buffer = "" if final else segments[-1][1] + (" " if self.buffer[-1:].isspace() else "")
+
+    def _correction_stage(self, stats):
+        try:
+            while not self.stop.is_set():
+                item = self._get(self.segment_queue, stats)
+                if item is _END:
+                    break
+                index, context, segment = item
+                start_time = time.perf_counter()
+                corrected = self.groq_processor.correct_segment(context, segment, self.journal)
+                stats.add("busy", time.perf_counter() - start_time)
+                with stats.lock:
+                    stats.items += 1
+                self.corrected[index] = corrected
+        except Exception as e:
+            self._fail(e)
+
+    def finish(self, raw_text):
+        """Corrected transcript of `raw_text`, the text fed in; None without a Groq processor
+
+        Segments still in the buffer are corrected and the workers waited
+        for. If nothing was segmented ahead (short text, or chunked correction
+        switched off) the whole text goes through correct_transcription, as
+        it would without the pipeline.
+        """
+        transcribed = time.perf_counter() - self.start_time
+        # The model runs on the caller's thread; whatever it did not wait for was inference
+        self.stats[1].busy = max(transcribed - self.stats[1].starved, 0.0)
+        try:
+            if self.groq_processor is None:
+                return None
+            with self.lock:
+                fed = [segment for _, segment in self.segments] + [self.buffer]
+                if self.segments and " ".join(fed).split() != raw_text.split():
+                    print("Warning: fed text differs from the transcript, correcting it as a whole")
+                    self.segments = []
+                if self.segments:
+                    self._release(final=True)
+            if not self.segments:
+                self.close()
+                return self.groq_processor.correct_transcription(raw_text, self.journal)
+
+            for _ in self.workers:
+                self.segment_queue.put(_END)
+            for worker in self.workers:
+                worker.join()
+            if self.error is not None:
+                raise self.error
+            corrected = [self.corrected[index] for index in range(len(self.segments))]
+            return " ".join(part for part in corrected if part)
+        finally:
+            self.close()
+            self.wall_time = time.perf_counter() - self.start_time
+
+    def close(self):
+        """Stop every stage; safe to call more than once"""
+        self.stop.set()
+        for worker in self.workers:
+            worker.join()
+
+    def report(self):
+        wall_time = self.wall_time if self.wall_time is not None else time.perf_counter() - self.start_time
+        return {"wall_time": wall_time, "stages": [stage.report(wall_time) for stage in self.stats]}
@@ -0,0 +1,70 @@
+import builtins
+import sys
+import time
+from contextlib import contextmanager
+
+class StartupProfiler:
+    """Times the first import of each top-level package and named startup phases
+
+    Disabled by default; until enable() is called nothing is patched and
+    phase() is a bare context manager.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.imports = {}
+        self.phases = []
+        self._active = set()
+        self._original_import = None
+        self.start_time = time.perf_counter()
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        self.start_time = time.perf_counter()
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._timed_import
+
+    def disable(self):
+        if self.enabled:
+            builtins.__import__ = self._original_import
+            self.enabled = False
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        top = name.partition(".")[0]
+        # Only the outermost first import of a package is timed
+        if level or not top or top in sys.modules or top in self._active:
+            return self._original_import(name, globals, locals, fromlist, level)
+
+        self._active.add(top)
+        start_time = time.perf_counter()
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            self._active.discard(top)
+            self.imports[top] = self.imports.get(top, 0.0) + time.perf_counter() - start_time
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start_time))
+
+    def report(self, top=15):
+        """Slowest imports (inclusive of what they import) and phase timings"""
+        lines = [f"Startup profile ({time.perf_counter() - self.start_time:.2f}s since profiling began)"]
+        lines.append("  Imports (inclusive):")
+        for name, seconds in sorted(self.imports.items(), key=lambda item: item[1], reverse=True)[:top]:
+            lines.append(f"    {name:<24} {seconds * 1000:8.1f} ms")
+        lines.append("  Phases:")
+        for name, seconds in self.phases:
+            lines.append(f"    {name:<24} {seconds * 1000:8.1f} ms")
+        return "\n".join(lines)
+
+startup = StartupProfiler()
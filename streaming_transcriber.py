@@ -0,0 +1,146 @@
+import time
+import numpy as np
+from config import config
+
+class StreamingTranscriber:
+    """Incremental transcription of pushed PCM frames with a rolling context window"""
+
+    def __init__(self, speech_recognizer,
+                 step_duration=config.STREAM_STEP_DURATION,
+                 segment_duration=config.STREAM_SEGMENT_DURATION,
+                 context_duration=config.STREAM_CONTEXT_DURATION,
+                 latency_target=config.STREAM_LATENCY_TARGET):
+        self.speech_recognizer = speech_recognizer
+        self.sample_rate = config.SAMPLE_RATE
+        self.step_size = int(step_duration * self.sample_rate)
+        self.segment_size = int(segment_duration * self.sample_rate)
+        self.context_size = int(context_duration * self.sample_rate)
+        self.latency_target = latency_target
+
+        # Samples per logit frame (320 for the wav2vec2 conv stack)
+        self.frame_size = speech_recognizer.model.config.inputs_to_logits_ratio
+        tokenizer = speech_recognizer.processor.tokenizer
+        self.blank_id = tokenizer.pad_token_id
+        self.delimiter_id = tokenizer.word_delimiter_token_id
+
+        self.reset()
+
+    def reset(self):
+        """Drop all buffered audio and start a new stream"""
+        self.context = np.zeros(0, dtype=np.float32)
+        self.segment = np.zeros(0, dtype=np.float32)
+        self.segment_offset = 0  # Absolute sample index where the open segment starts
+        self.samples_since_update = 0
+        self.latencies = []
+
+    def _to_float(self, frame):
+        """Convert raw int16 PCM bytes or an array to float32 samples"""
+        if isinstance(frame, (bytes, bytearray, memoryview)):
+            return np.frombuffer(frame, dtype=np.int16).astype(np.float32) / 2**15
+        frame = np.asarray(frame)
+        if frame.dtype == np.int16:
+            return frame.astype(np.float32) / 2**15
+        return frame.astype(np.float32, copy=False)
+
+    def _run_window(self):
+        """Transcribe context + open segment and return logits for the segment only"""
+        window = np.concatenate([self.context, self.segment])
+        start_time = time.perf_counter()
+        logits = self.speech_recognizer.compute_logits([window])[0]
+        latency = time.perf_counter() - start_time
+        self.latencies.append(latency)
+
+        # Frames belonging to the left context were already finalized
+        context_frames = len(self.context) // self.frame_size
+        return logits[context_frames:], latency
+
+    def _event(self, kind, text, end_sample, latency):
+        return {
+            "type": kind,
+            "text": text,
+            "start": self.segment_offset / self.sample_rate,
+            "end": end_sample / self.sample_rate,
+            "latency": latency,
+            "within_target": latency <= self.latency_target
+        }
+
+    def _find_cut(self, predicted_ids):
+        """Pick the last word boundary in the second half of the segment"""
+        for i in range(len(predicted_ids) - 1, len(predicted_ids) // 2, -1):
+            if predicted_ids[i] == self.delimiter_id:
+                return i
+        for i in range(len(predicted_ids) - 1, len(predicted_ids) // 2, -1):
+            if predicted_ids[i] == self.blank_id and predicted_ids[i - 1] == self.blank_id:
+                return i
+        return len(predicted_ids)
+
+    def _finalize(self, logits, latency, cut=None):
+        """Commit the segment up to a word boundary and carry the rest over"""
+        if cut is None:
+            cut = self._find_cut(logits.argmax(dim=-1).cpu().numpy())
+        text = self.speech_recognizer.decode_logits([logits[:cut]])[0]
+
+        cut_samples = min(cut * self.frame_size, len(self.segment))
+        event = self._event("final", text, self.segment_offset + cut_samples, latency)
+
+        committed = np.concatenate([self.context, self.segment[:cut_samples]])
+        self.context = committed[-self.context_size:] if self.context_size else committed[:0]
+        self.segment = self.segment[cut_samples:]
+        self.segment_offset += cut_samples
+        return event
+
+    def push(self, frame):
+        """Add a PCM frame and return any partial or final events it produced"""
+        samples = self._to_float(frame)
+        self.segment = np.concatenate([self.segment, samples])
+        self.samples_since_update += len(samples)
+
+        events = []
+        if self.samples_since_update < self.step_size:
+            return events
+        # A frame spanning several steps still changes the window only once
+        self.samples_since_update %= self.step_size
+        if len(self.segment) < self.frame_size:
+            return events
+
+        logits, latency = self._run_window()
+        if len(self.segment) >= self.segment_size:
+            events.append(self._finalize(logits, latency))
+        else:
+            text = self.speech_recognizer.decode_logits([logits])[0]
+            events.append(self._event("partial", text, self.segment_offset + len(self.segment), latency))
+
+        return events
+
+    def flush(self):
+        """Finalize whatever audio is still buffered"""
+        events = []
+        if len(self.segment) >= self.frame_size:
+            logits, latency = self._run_window()
+            events.append(self._finalize(logits, latency, cut=len(logits)))
+        self.samples_since_update = 0
+        return events
+
+    def transcribe_stream(self, frames):
+        """Yield partial and final events for an iterable of PCM frames"""
+        for frame in frames:
+            for event in self.push(frame):
+                yield event
+        for event in self.flush():
+            yield event
+
+    def latency_report(self):
+        """Summarize per-update model latency against the target"""
+        if not self.latencies:
+            return {"updates": 0}
+
+        latencies = np.array(self.latencies)
+        return {
+            "updates": len(latencies),
+            "mean": float(latencies.mean()),
+            "p50": float(np.percentile(latencies, 50)),
+            "p95": float(np.percentile(latencies, 95)),
+            "max": float(latencies.max()),
+            "over_target": float((latencies > self.latency_target).mean()),
+            "target": self.latency_target
+        }
@@ -0,0 +1,120 @@
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TRANSCRIPTION_PATTERN = re.compile(r"Transcription:\s*(.*?)\s*Corrected transcription:", re.S)
+SUMMARY_PATTERN = re.compile(r":\s*(.*?)\s*Summary:\s*$", re.S)
+SUMMARY_WORDS = 20
+
+def echo_reply(messages):
+    """Default reply: the transcription from the prompt in sentence case, the first words of a
+    text to summarize, else the whole prompt"""
+    prompt = messages[-1]["content"] if messages else ""
+    summary = SUMMARY_PATTERN.search(prompt)
+    if summary:
+        # Short and deterministic, so map-reduce levels shrink as a real summary would
+        return " ".join(summary.group(1).split()[:SUMMARY_WORDS])
+    match = TRANSCRIPTION_PATTERN.search(prompt)
+    text = match.group(1) if match else prompt.strip()
+    return text[:1].upper() + text[1:].lower()
+
+class StubChatServer:
+    """Local stand-in for the Groq chat-completions endpoint
+
+    Point the client at it with GROQ_BASE_URL=<server.base_url>. `fail_first`
+    answers that many requests with `fail_status` to exercise retries, and
+    `latency` delays every reply.
+    """
+
+    def __init__(self, reply=echo_reply, latency=0.0, fail_first=0, fail_status=503, port=0):
+        self.reply = reply
+        self.latency = latency
+        self.fail_remaining = fail_first
+        self.fail_status = fail_status
+        self.requests = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                if not self.path.endswith("/chat/completions"):
+                    self._send(404, {"error": {"message": "not found"}})
+                    return
+
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                with stub.lock:
+                    stub.requests.append(payload)
+                    fail = stub.fail_remaining > 0
+                    if fail:
+                        stub.fail_remaining -= 1
+
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if fail:
+                    self._send(stub.fail_status, {"error": {"message": "stub failure", "type": "server_error"}})
+                    return
+
+                content = stub.reply(payload.get("messages", []))
+                self._send(200, {
+                    "id": f"stub-{len(stub.requests)}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": payload.get("model", "stub"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop"
+                    }],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+                })
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Local chat-completions stub for Groq tests")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = StubChatServer(latency=args.latency, port=args.port)
+    print(f"Stub chat-completions server on {server.base_url} (set GROQ_BASE_URL to this)")
+    server.server.serve_forever()
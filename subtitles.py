@@ -0,0 +1,52 @@
+import json
+
+OUTPUT_FORMATS = ("txt", "srt", "vtt", "json")
+
+def group_cues(words, max_duration=6.0, max_chars=42, max_gap=1.0):
+    """Group timed words into subtitle cues, breaking on length, duration and pauses"""
+    cues = []
+    current = []
+    for word in words:
+        if current:
+            text_length = sum(len(w["word"]) + 1 for w in current) + len(word["word"])
+            if (text_length > max_chars or word["end"] - current[0]["start"] > max_duration
+                    or word["start"] - current[-1]["end"] > max_gap):
+                cues.append(current)
+                current = []
+        current.append(word)
+    if current:
+        cues.append(current)
+    return [{"start": cue[0]["start"], "end": cue[-1]["end"], "text": " ".join(w["word"] for w in cue)}
+            for cue in cues]
+
+def _timestamp(seconds, separator):
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
+def format_srt(words):
+    blocks = []
+    for i, cue in enumerate(group_cues(words), 1):
+        blocks.append(f"{i}\n{_timestamp(cue['start'], ',')} --> {_timestamp(cue['end'], ',')}\n{cue['text']}\n")
+    return "\n".join(blocks)
+
+def format_vtt(words):
+    blocks = ["WEBVTT\n"]
+    for cue in group_cues(words):
+        blocks.append(f"{_timestamp(cue['start'], '.')} --> {_timestamp(cue['end'], '.')}\n{cue['text']}\n")
+    return "\n".join(blocks)
+
+def format_json(text, words):
+    return json.dumps({"text": text, "words": words}, ensure_ascii=False, indent=2)
+
+def format_transcript(output_format, text, words):
+    """Render the transcript; subtitle formats use the raw word timings"""
+    if output_format == "srt":
+        return format_srt(words)
+    if output_format == "vtt":
+        return format_vtt(words)
+    if output_format == "json":
+        return format_json(text, words)
+    return text
@@ -0,0 +1,42 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+import chunk_planner
+from chunk_planner import FRAMES_PER_SECOND, ChunkPlanner
+from config import config
+
+# Simulated peak memory of one forward pass: 100 MB fixed plus linear and attention terms per chunk
+LINEAR, QUADRATIC = 0.01, 0.0001
+
+def true_peak_mb(batch, duration):
+    frames = duration * FRAMES_PER_SECOND
+    return 100 + batch * (LINEAR * frames + QUADRATIC * frames * frames)
+
+class FakeRecognizer:
+    """Runs nothing; each pass raises a simulated ru_maxrss, which like the real one never falls"""
+    device = torch.device("cpu")
+
+    def __init__(self):
+        self.high_water_mb = 0.0
+
+    def compute_logits(self, chunks):
+        peak = true_peak_mb(len(chunks), len(chunks[0]) / config.SAMPLE_RATE)
+        self.high_water_mb = max(self.high_water_mb, peak)
+
+def test_calibrate_fits_memory_only_from_runs_that_set_the_high_water_mark(tmp_path, monkeypatch):
+    recognizer = FakeRecognizer()
+    monkeypatch.setattr(chunk_planner, "peak_rss_bytes", lambda: recognizer.high_water_mb * 1024 * 1024)
+    planner = ChunkPlanner(profile_path=str(tmp_path / "profiles.json"))
+    planner.calibrate(recognizer, "fake", "eager", durations=(2, 5, 10, 20), batch_sizes=(1, 2, 4), repeat=1)
+
+    samples = planner.load_profiles()["fake|eager|cpu"]["samples"]
+    baseline = true_peak_mb(1, 2)
+    for sample in samples:
+        if sample["memory_mb"] is not None:
+            assert sample["memory_mb"] == pytest.approx(true_peak_mb(sample["batch"], sample["duration"]) - baseline)
+    # Only a run after a larger linear term cannot be told apart from the earlier peak
+    assert [(s["batch"], s["duration"]) for s in samples if s["memory_mb"] is None] == [(1, 5)]
+
+    _, linear, quadratic = planner.load_profiles()["fake|eager|cpu"]["cost"]["memory"]
+    assert linear == pytest.approx(LINEAR)
+    assert quadratic == pytest.approx(QUADRATIC)
@@ -0,0 +1,131 @@
+import numpy as np
+from ctc_decoder import CTCDecoder, WindowStitcher, join_ranges
+
+FRAME_DURATION = 0.02
+VOCAB = {"<pad>": 0, "<s>": 1, "</s>": 2, "<unk>": 3, "|": 4, "A": 5, "B": 6, "C": 7, "D": 8}
+
+class FakeTokenizer:
+    pad_token_id = 0
+    word_delimiter_token_id = 4
+    all_special_ids = [0, 1, 2, 3]
+
+    def get_vocab(self):
+        return dict(VOCAB)
+
+def make_decoder():
+    return CTCDecoder(FakeTokenizer(), FRAME_DURATION)
+
+def one_hot(ids, vocab_size=len(VOCAB)):
+    """Confident log-probabilities that pick `ids` frame by frame"""
+    log_probs = np.full((len(ids), vocab_size), -10.0, dtype=np.float32)
+    log_probs[np.arange(len(ids)), ids] = 0.0
+    return log_probs
+
+def test_decode_collapses_repeats_and_splits_words():
+    text, words = make_decoder().decode([5, 5, 0, 6, 4, 4, 7, 0, 7])[0]
+    assert text == "AB CC"
+    assert words == [
+        {"word": "AB", "start": 0.0, "end": 0.08},
+        {"word": "CC", "start": 0.12, "end": 0.18}
+    ]
+
+def test_decode_ignores_padding_and_special_tokens():
+    ids = np.array([
+        [1, 5, 5, 4, 6, 2, 0, 7, 7],
+        [8, 8, 0, 3, 8, 7, 7, 7, 7]
+    ])
+    results = make_decoder().decode(ids, lengths=[6, 5])
+    assert [text for text, _ in results] == ["A B", "DD"]
+    assert results[1][1] == [{"word": "DD", "start": 0.0, "end": 0.1}]
+
+def test_decode_empty_rows():
+    assert make_decoder().decode(np.zeros((2, 5), dtype=int)) == [("", []), ("", [])]
+
+# Frame by frame "AB C D"; two 10-frame windows share frames 6-9
+TRUTH = [5, 5, 0, 6, 0, 4, 4, 7, 7, 0, 4, 4, 8, 8, 0, 0]
+
+def windows():
+    first = list(TRUTH[:10])
+    second = list(TRUTH[6:])
+    # Each window is unreliable at its cut edge
+    first[-1] = 6
+    second[0] = 6
+    return one_hot(first), one_hot(second)
+
+def test_window_weights_cross_fade_over_shared_frames():
+    weights = WindowStitcher.window_weights(10, 0, 4)
+    assert np.allclose(weights[:6], 1.0)
+    assert np.allclose(weights[6:], [0.875, 0.625, 0.375, 0.125])
+    assert np.allclose(WindowStitcher.window_weights(10, 4, 0)[:4], weights[6:][::-1])
+
+def test_stitched_windows_decode_once_without_edge_errors():
+    first, second = windows()
+    stitcher = WindowStitcher([0, 6], [10, 10], len(TRUTH))
+    # Batches can come back in any order
+    stitcher.add(1, second)
+    stitcher.add(0, first)
+    predicted_ids = stitcher.predicted_ids(blank_id=0)
+    assert predicted_ids.tolist() == TRUTH
+    text, words = make_decoder().decode(predicted_ids)[0]
+    assert text == "AB C D"
+    assert [word["start"] for word in words] == [0.0, 0.14, 0.24]
+
+def test_uncovered_and_padding_frames():
+    first, _ = windows()
+    padded = np.concatenate([first, one_hot([7, 7, 7])])
+    stitcher = WindowStitcher([0], [10], 14)
+    stitcher.add(0, padded)
+    predicted_ids = stitcher.predicted_ids(blank_id=0)
+    # The three padding frames past the window length are dropped, so frames 10-13 stay blank
+    assert predicted_ids[10:].tolist() == [0, 0, 0, 0]
+    assert predicted_ids[:9].tolist() == TRUTH[:9]
+
+def test_cut_frame_prefers_delimiter_then_blank_nearest_middle():
+    decoder = make_decoder()
+    ids = np.array([5, 6, 4, 6, 6, 0, 7, 7])
+    assert decoder.cut_frame(ids, 0, 8) == 2
+    assert decoder.cut_frame(ids, 3, 7) == 5
+    assert decoder.cut_frame(np.array([5, 5, 6, 6]), 0, 4) == 2
+    assert decoder.cut_frame(np.array([5, 5, 6, 6]), 3, 3) == 3
+
+# Frame by frame "AB C DA BC", cut into 10-frame windows every 7 frames
+LONG_TRUTH = [5, 6, 0, 4, 7, 0, 4, 4, 8, 8, 5, 0, 4, 6, 6, 7, 0, 4, 0, 0, 0, 0]
+WINDOW_STARTS = [0, 7, 12]
+
+def long_stitcher():
+    frames = [min(10, len(LONG_TRUTH) - start) for start in WINDOW_STARTS]
+    return WindowStitcher(WINDOW_STARTS, frames, len(LONG_TRUTH))
+
+def long_window(k):
+    ids = list(LONG_TRUTH[WINDOW_STARTS[k]:WINDOW_STARTS[k] + 10])
+    # Wrong at the cut edges, where a window has no context
+    if k > 0:
+        ids[0] = 8
+    if k + 1 < len(WINDOW_STARTS):
+        ids[-1] = 6
+    return one_hot(ids)
+
+def test_decoding_window_ranges_joins_like_one_decode():
+    whole = long_stitcher()
+    for k in range(len(WINDOW_STARTS)):
+        whole.add(k, long_window(k))
+    text, words = whole.decode(make_decoder())
+    assert text == "AB C DA BC"
+
+    parts = []
+    for first, last in [(0, 1), (1, 3)]:
+        stitcher = long_stitcher()
+        needed = stitcher.overlapping(first, last)
+        assert needed == list(range(max(0, first - 1), min(len(WINDOW_STARTS), last + 1)))
+        for k in needed:
+            stitcher.add(k, long_window(k))
+        parts.append(stitcher.decode(make_decoder(), first, last))
+    assert join_ranges(parts) == (text, words)
+
+def test_join_ranges_glues_words_cut_in_two():
+    def word(text, start, end):
+        return {"word": text, "start": start, "end": end}
+
+    parts = [("X AB", [word("X", 0.0, 0.1), word("AB", 0.2, 0.4)]), ("", []),
+             ("C ", [word("C", 0.6, 0.7)]), ("D", [word("D", 0.9, 1.0)])]
+    assert join_ranges(parts) == ("X ABC D", [word("X", 0.0, 0.1), word("ABC", 0.2, 0.7), word("D", 0.9, 1.0)])
@@ -0,0 +1,125 @@
+import re
+import pytest
+from config import config
+from groq_integration import CHARS_PER_TOKEN, GroqPostProcessor, normalize_text, split_segments
+
+SECTION_TOKENS = 50
+LEVELS = re.compile(r"Summary levels: ([\d >-]+) \((\d+) summaries, (\d+) reused from cache\)")
+
+def sentences(first, last):
+    return " ".join(f"Sentence {i} is about topic {i} and a few other things." for i in range(first, last))
+
+def test_split_segments_short_text_is_one_segment():
+    assert split_segments("Hello there. How are you?", 100, 10) == [("", "Hello there. How are you?")]
+
+def test_split_segments_within_budget_and_in_order():
+    text = sentences(0, 60)
+    segments = split_segments(text, 40, 10)
+    assert len(segments) > 1
+    assert all(len(segment) <= 40 * CHARS_PER_TOKEN for _, segment in segments)
+    assert " ".join(segment for _, segment in segments) == text
+    # Segments end at sentence boundaries
+    assert all(segment.endswith(".") for _, segment in segments)
+
+def test_split_segments_context_is_tail_of_previous_segment():
+    segments = split_segments(sentences(0, 60), 40, 10)
+    assert segments[0][0] == ""
+    for (_, previous), (context, _) in zip(segments, segments[1:]):
+        assert context and previous.endswith(context)
+        assert len(context) <= 10 * CHARS_PER_TOKEN
+    assert all(context == "" for context, _ in split_segments(sentences(0, 60), 40, 0))
+
+def test_split_segments_unpunctuated_text_falls_back_to_words():
+    text = " ".join(f"word{i}" for i in range(200))
+    segments = split_segments(text, 20, 0)
+    assert all(len(segment) <= 20 * CHARS_PER_TOKEN for _, segment in segments)
+    assert " ".join(segment for _, segment in segments).split() == text.split()
+
+@pytest.fixture
+def stub_server(monkeypatch, tmp_path):
+    pytest.importorskip("groq")
+    from stub_chat_server import StubChatServer
+    with StubChatServer() as server:
+        monkeypatch.setattr(config, "GROQ_BASE_URL", server.base_url)
+        monkeypatch.setattr(config, "GROQ_API_KEY", "test")
+        monkeypatch.setattr(config, "GROQ_CACHE_MODE", "on")
+        monkeypatch.setattr(config, "GROQ_CACHE_DIR", str(tmp_path / "groq"))
+        monkeypatch.setattr(config, "GROQ_SUMMARY_MEMO", True)
+        monkeypatch.setattr(config, "GROQ_SUMMARY_MEMO_DIR", str(tmp_path / "summaries"))
+        yield server
+
+def test_correct_segment_retries_rate_limits(monkeypatch, tmp_path):
+    pytest.importorskip("groq")
+    from stub_chat_server import StubChatServer
+    monkeypatch.setattr(config, "GROQ_API_KEY", "test")
+    monkeypatch.setattr(config, "GROQ_CACHE_MODE", "off")
+    monkeypatch.setattr(config, "GROQ_RETRY_BACKOFF", 0.01)
+    with StubChatServer(fail_first=2, fail_status=429) as server:
+        monkeypatch.setattr(config, "GROQ_BASE_URL", server.base_url)
+        processor = GroqPostProcessor()
+        corrected = processor.correct_segment("", "hello there. how are you?")
+    assert corrected != "hello there. how are you?"
+    assert processor.stats == {"requests": 3, "retries": 2, "failures": 0}
+
+def summarize(text, capsys):
+    """Summary, summaries per level, the number of them that took a call and the number reused from cache"""
+    summary = GroqPostProcessor().summarize_map_reduce(text, SECTION_TOKENS)
+    match = LEVELS.search(capsys.readouterr().out)
+    levels = [int(count) for count in match.group(1).split(" -> ")]
+    return summary, levels, int(match.group(2)), int(match.group(3))
+
+def map_prompts(requests):
+    return [r["messages"][-1]["content"] for r in requests
+            if "part of a longer transcript" in r["messages"][-1]["content"]]
+
+def test_map_reduce_levels_shrink_to_one(stub_server, capsys):
+    text = sentences(0, 40)
+    summary, levels, calls, reused = summarize(text, capsys)
+    sections = split_segments(normalize_text(text), SECTION_TOKENS, 0)
+    assert levels[0] == len(sections) > 2
+    assert levels[-1] == 1
+    assert all(upper < lower for lower, upper in zip(levels, levels[1:]))
+    assert reused == 0
+    assert len(stub_server.requests) == calls
+    # A summary left over on its own went up a level without a combine call
+    assert calls < sum(levels)
+    combine_prompts = [r["messages"][-1]["content"] for r in stub_server.requests
+                       if "part of a longer transcript" not in r["messages"][-1]["content"]]
+    assert all("\n\n" in prompt.strip() for prompt in combine_prompts)
+    assert summary
+
+def test_appended_text_only_resummarizes_the_changed_tail(stub_server, capsys):
+    text = sentences(0, 40)
+    summarize(text, capsys)
+    first_run = len(stub_server.requests)
+
+    longer = f"{text} {sentences(40, 44)}"
+    _, levels, count, reused = summarize(longer, capsys)
+    calls = stub_server.requests[first_run:]
+    assert len(calls) == count - reused
+
+    # Map calls: only the sections the appended text changed or added
+    old_sections = {segment for _, segment in split_segments(normalize_text(text), SECTION_TOKENS, 0)}
+    new_sections = [segment for _, segment in split_segments(normalize_text(longer), SECTION_TOKENS, 0)]
+    changed = [i for i, segment in enumerate(new_sections) if segment not in old_sections]
+    assert changed == list(range(changed[0], len(new_sections)))
+    prompts = map_prompts(calls)
+    assert len(prompts) == len(changed)
+    # Requests run concurrently, so they can arrive in any order
+    assert all(any(new_sections[i] in prompt for prompt in prompts) for i in changed)
+
+    # Reduce calls: at most the trailing groups on each level above them
+    reduce_calls = len(calls) - len(changed)
+    assert 0 < reduce_calls <= 2 * (len(levels) - 1)
+    assert reused > len(calls)
+
+def test_partial_summaries_are_reused_with_the_response_cache_off(stub_server, monkeypatch, capsys):
+    monkeypatch.setattr(config, "GROQ_CACHE_MODE", "off")
+    text = sentences(0, 40)
+    first, _, calls, _ = summarize(text, capsys)
+    assert len(stub_server.requests) == calls
+
+    again, _, _, reused = summarize(text, capsys)
+    assert again == first
+    assert reused == calls
+    assert len(stub_server.requests) == calls
@@ -0,0 +1,36 @@
+import types
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+from benchmark import build_tiny_model
+from config import config
+from inference_backends import Int8Backend
+
+def test_int8_backend_quantizes_a_copy_of_the_shared_model(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "MODEL_CACHE_DIR", str(tmp_path / "models"))
+    model = transformers.Wav2Vec2ForCTC.from_pretrained(build_tiny_model(str(tmp_path / "tiny"))).eval()
+    linear_layers = [name for name, module in model.named_modules() if type(module) is torch.nn.Linear]
+
+    backend = Int8Backend(model, "tiny", use_attention_mask=False)
+
+    # Other backends and callers of the registry still see the fp32 model
+    assert [name for name, module in model.named_modules() if type(module) is torch.nn.Linear] == linear_layers
+    audio = torch.randn(1, config.SAMPLE_RATE)
+    with torch.no_grad():
+        expected = model(audio).logits
+    assert backend(audio).shape == expected.shape
+
+def test_comparison_prints_no_wer_without_an_fp32_reference(monkeypatch, capsys):
+    import main
+    rows = [{"backend": "eager", "error": "out of memory"},
+            {"backend": "int8", "seconds": 1.0, "rtf": 0.1, "wer_vs_fp32": None}]
+    monkeypatch.setattr("inference_backends.compare_backends", lambda speech_recognizer, chunks: rows)
+    audio_processor = types.SimpleNamespace(load_audio=lambda path: np.zeros(config.SAMPLE_RATE, dtype=np.float32),
+                                            preprocess_audio=lambda audio: audio, chunk_audio=lambda audio: [audio])
+    pipeline = types.SimpleNamespace(audio_processor=audio_processor, speech_recognizer=None)
+    main.run_backend_comparison(pipeline, "speech.wav")
+    out = capsys.readouterr().out
+    assert "eager      failed: out of memory" in out
+    assert "int8" in out and out.rstrip().endswith("n/a")
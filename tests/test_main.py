@@ -0,0 +1,228 @@
+import json
+import sys
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+sf = pytest.importorskip("soundfile")
+import main
+from audio_processor import AudioProcessor
+from benchmark import build_tiny_model, synthesize_speech
+from config import config
+from model_registry import registry
+from speech_recognizer import SpeechRecognizer
+
+OVERLAP = 2.0
+
+@pytest.fixture(scope="module")
+def tiny_model(tmp_path_factory):
+    return build_tiny_model(str(tmp_path_factory.mktemp("models") / "tiny-wav2vec2"))
+
+@pytest.fixture
+def audio_path(tmp_path, monkeypatch):
+    # The cache, journal and chunk profiles live under the working directory
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "speech.wav"
+    sf.write(path, np.concatenate(list(synthesize_speech(100))), config.SAMPLE_RATE)
+    return path
+
+@pytest.fixture
+def window_calls(monkeypatch):
+    """Owned range and window count of every transcribe_windows call"""
+    calls = []
+    transcribe_windows = SpeechRecognizer.transcribe_windows
+
+    def spy(self, windows, total_samples, batch_size=None, max_batch_samples=None, owned=None):
+        calls.append((owned, len(windows)))
+        return transcribe_windows(self, windows, total_samples, batch_size, max_batch_samples, owned)
+
+    monkeypatch.setattr(SpeechRecognizer, "transcribe_windows", spy)
+    return calls
+
+def run_cli(monkeypatch, *args, groq=False):
+    """Run main() and return its JSON transcript; settings it changes are restored afterwards"""
+    for name in ("GROQ_CACHE_MODE", "INFERENCE_BACKEND", "CASCADE_CONFIDENCE_THRESHOLD", "JOURNAL_ENABLED"):
+        monkeypatch.setattr(config, name, getattr(config, name))
+    monkeypatch.setenv("GROQ_CACHE_MODE", config.GROQ_CACHE_MODE)
+    monkeypatch.setenv("INFERENCE_BACKEND", config.INFERENCE_BACKEND)
+    monkeypatch.setattr(sys, "argv", ["main.py", *args, *([] if groq else ["--no-groq"]), "--format", "json"])
+    main.main()
+    with open("speech_transcription.json", "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def test_overlap_stitches_windows_in_journal_groups(monkeypatch, tiny_model, audio_path, window_calls):
+    monkeypatch.setattr(config, "JOURNAL_GROUP_CHUNKS", 2)
+    result = run_cli(monkeypatch, "--audio", str(audio_path), "--model", tiny_model, "--no-vad",
+                     "--overlap", str(OVERLAP))
+    assert [owned for owned, _ in window_calls] == [(0, 2), (2, 4)]
+
+    # What one stitched pass over every window gives
+    processor = AudioProcessor()
+    audio = processor.preprocess_audio(processor.load_audio(str(audio_path)), trim_silence=False)
+    start, end = processor.silence_bounds(audio)
+    windows = processor.chunk_audio_overlapping(audio[start:end], config.CHUNK_DURATION, OVERLAP)
+    assert len(windows) == 4
+    text, words = registry.get(tiny_model).transcribe_windows(windows, end - start)
+    assert result["text"] == text
+    assert result["words"] == main.offset_words(words, start / config.SAMPLE_RATE)
+    assert text
+
+def test_overlap_applies_to_streamed_files(monkeypatch, tiny_model, audio_path, window_calls):
+    monkeypatch.setattr(config, "MAX_AUDIO_LENGTH", 60)
+    result = run_cli(monkeypatch, "--audio", str(audio_path), "--model", tiny_model, "--no-vad",
+                     "--overlap", str(OVERLAP), "--no-cache")
+    assert len(window_calls) == 1
+
+    windows = list(AudioProcessor().stream_audio_overlapping(str(audio_path), config.CHUNK_DURATION, OVERLAP))
+    text, words = registry.get(tiny_model).transcribe_windows(windows, windows[-1][0] + len(windows[-1][1]))
+    assert window_calls[0][1] == len(windows)
+    assert result["text"] == text
+    assert result["words"] == words
+
+def test_cached_transcript_is_read_with_one_lookup(monkeypatch, tiny_model, audio_path):
+    from disk_cache import DiskCache
+    first = run_cli(monkeypatch, "--audio", str(audio_path), "--model", tiny_model, "--no-vad")
+
+    lookups = []
+    get = DiskCache.get
+
+    def spy(self, namespace, key):
+        lookups.append(namespace)
+        return get(self, namespace, key)
+
+    monkeypatch.setattr(DiskCache, "get", spy)
+    assert run_cli(monkeypatch, "--audio", str(audio_path), "--model", tiny_model, "--no-vad") == first
+    assert lookups == ["raw"]
+    assert first["words"]
+
+@pytest.mark.parametrize("flags", [[], ["--no-vad"]])
+def test_journal_does_not_change_the_transcript(monkeypatch, tiny_model, audio_path, flags):
+    # VAD segments differ in length, so a chunk's text depends on the batch it is padded in
+    monkeypatch.setattr(config, "BATCH_SIZE", 4)
+    monkeypatch.setattr("chunk_planner.ChunkPlan.should_chunk", lambda self, num_samples: True)
+    args = ["--audio", str(audio_path), "--model", tiny_model, "--no-cache", *flags]
+    journaled = run_cli(monkeypatch, *args)
+    assert journaled == run_cli(monkeypatch, *args, "--no-resume")
+    assert journaled["text"]
+
+def test_progress_callback_follows_each_batch_and_can_stop_the_run(monkeypatch, tiny_model, audio_path):
+    monkeypatch.setattr(config, "BATCH_SIZE", 4)
+    updates = []
+    pipeline = main.SpeechToTextPipeline(use_cache=False, model_name=tiny_model,
+                                         progress=lambda percent, message: updates.append((percent, message)))
+    text = pipeline.process_audio_file(str(audio_path), use_groq_correction=False, raise_errors=True)
+    percents = [percent for percent, _ in updates if percent is not None]
+    assert percents == sorted(percents) and percents[-1] == 80
+    # 45 VAD segments in batches of 4, plus the report before the first batch
+    assert sum(message.startswith("Transcribed") for _, message in updates if message) == 13
+
+    class Cancelled(Exception):
+        pass
+
+    def cancel_after_two_batches(percent, message):
+        if message == "Transcribed 8 of 45 chunks...":
+            raise Cancelled()
+
+    pipeline = main.SpeechToTextPipeline(use_cache=False, model_name=tiny_model, progress=cancel_after_two_batches)
+    with pytest.raises(Cancelled):
+        pipeline.process_audio_file(str(audio_path), use_groq_correction=False, raise_errors=True)
+    # The journal kept what was done before the stop
+    pipeline = main.SpeechToTextPipeline(use_cache=False, model_name=tiny_model)
+    assert pipeline.process_audio_file(str(audio_path), use_groq_correction=False) == text
+    assert pipeline.journal_report["chunks_skipped"] == 8
+
+def test_failed_chunk_is_retried_by_the_next_run(monkeypatch, tiny_model, audio_path):
+    monkeypatch.setattr(config, "BATCH_SIZE", 4)
+    args = ["--audio", str(audio_path), "--model", tiny_model]
+    # The first batch fails, and so does its first chunk when retried alone
+    decode_batch = SpeechRecognizer.decode_batch
+    calls = []
+    failures = [2]
+
+    def failing_decode_batch(self, logits, frame_lengths):
+        calls.append(len(frame_lengths))
+        if failures[0]:
+            failures[0] -= 1
+            raise RuntimeError("out of memory")
+        return decode_batch(self, logits, frame_lengths)
+
+    monkeypatch.setattr(SpeechRecognizer, "decode_batch", failing_decode_batch)
+    failed = run_cli(monkeypatch, *args)
+    assert calls[:2] == [4, 1]
+
+    # Neither the cache nor the journal kept the failed chunk as silence, so only its batch runs again
+    calls.clear()
+    retried = run_cli(monkeypatch, *args)
+    assert calls == [4]
+    assert len(retried["words"]) > len(failed["words"])
+    # Now complete, the transcript is cached
+    assert run_cli(monkeypatch, *args) == retried
+    assert calls == [4]
+
+@pytest.mark.parametrize("flags,mode", [
+    (["--no-vad", "--overlap", str(OVERLAP)], "in memory"),
+    ([], "in memory"),
+    (["--no-vad"], "chunked"),
+    ([], "streamed"),
+    (["--no-vad"], "streamed"),
+    (["--no-vad", "--overlap", str(OVERLAP), "--no-resume"], "in memory"),
+    (["--no-resume"], "in memory"),
+    (["--no-resume"], "streamed"),
+])
+def test_pipelined_run_corrects_the_same_segments_as_a_sequential_one(monkeypatch, tiny_model, audio_path,
+                                                                      flags, mode):
+    pytest.importorskip("groq")
+    from stub_chat_server import StubChatServer
+    monkeypatch.setattr(config, "JOURNAL_GROUP_CHUNKS", 2)
+    monkeypatch.setattr(config, "GROQ_SEGMENT_TOKENS", 60)
+    monkeypatch.setattr(config, "GROQ_API_KEY", "test")
+    if mode == "chunked":
+        monkeypatch.setattr("chunk_planner.ChunkPlan.should_chunk", lambda self, num_samples: True)
+    elif mode == "streamed":
+        monkeypatch.setattr(config, "MAX_AUDIO_LENGTH", 60)
+    args = ["--audio", str(audio_path), "--model", tiny_model, "--no-cache", "--groq-cache", "off", *flags]
+
+    with StubChatServer() as server:
+        monkeypatch.setattr(config, "GROQ_BASE_URL", server.base_url)
+        sequential = run_cli(monkeypatch, *args, groq=True)
+        prompts = sorted(r["messages"][-1]["content"] for r in server.requests)
+        pipelined = run_cli(monkeypatch, *args, "--pipelined", groq=True)
+        pipelined_prompts = sorted(r["messages"][-1]["content"] for r in server.requests[len(prompts):])
+
+    assert len(prompts) > 2
+    assert pipelined_prompts == prompts
+    assert pipelined == sequential
+    # The stub returns each segment in sentence case, so the text went through correction
+    assert sequential["text"] != " ".join(word["word"] for word in sequential["words"])
+
+def test_cascade_batches_escalated_chunks_by_the_large_models_plan(monkeypatch, tiny_model, audio_path,
+                                                                   tmp_path_factory):
+    from chunk_planner import ChunkPlanner, CostModel
+    large_model = build_tiny_model(str(tmp_path_factory.mktemp("models") / "large-wav2vec2"))
+    # On the large model one 30 s chunk (1500 frames) takes 1500 MB, so only one fits the default budget at a time
+    profile = {"cost": CostModel([0.0, 0.001, 0.0], [0.0, 1.0, 0.0]).to_dict(), "samples": []}
+    (audio_path.parent / config.CACHE_DIR).mkdir()
+    with open(config.CHUNK_PROFILE_PATH, "w", encoding="utf-8") as f:
+        json.dump({ChunkPlanner.profile_key(large_model, config.INFERENCE_BACKEND, "cpu"): profile}, f)
+    monkeypatch.setattr("chunk_planner.ChunkPlan.should_chunk", lambda self, num_samples: True)
+
+    decode_batch = SpeechRecognizer.decode_batch
+    calls = []
+
+    def spy(self, logits, frame_lengths):
+        calls.append(len(frame_lengths))
+        return decode_batch(self, logits, frame_lengths)
+
+    monkeypatch.setattr(SpeechRecognizer, "decode_batch", spy)
+    # Every chunk is escalated
+    run_cli(monkeypatch, "--audio", str(audio_path), "--model", tiny_model, "--no-vad", "--no-cache",
+            "--cascade", large_model, "--cascade-threshold", "1.01")
+    chunks = calls[0]
+    assert chunks > 1
+    assert calls[1:] == [1] * chunks
+
+@pytest.mark.parametrize("flags", [[], ["--no-vad", "--stream"], ["--no-vad", "--sharded"], ["--no-vad", "--cascade"]])
+def test_overlap_is_rejected_where_windows_are_not_stitched(monkeypatch, audio_path, flags):
+    with pytest.raises(SystemExit):
+        run_cli(monkeypatch, "--audio", str(audio_path), "--overlap", str(OVERLAP), *flags)
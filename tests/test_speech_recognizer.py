@@ -0,0 +1,33 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+from speech_recognizer import SpeechRecognizer
+
+def make_batches(lengths, batch_size, max_batch_samples):
+    # make_batches only looks at the lengths, so no model has to be loaded
+    recognizer = SpeechRecognizer.__new__(SpeechRecognizer)
+    return recognizer.make_batches(lengths, batch_size, max_batch_samples)
+
+def test_make_batches_covers_every_chunk_once():
+    lengths = [5, 40, 12, 40, 7, 33, 1, 20]
+    batches = make_batches(lengths, 3, 1000)
+    assert sorted(i for batch in batches for i in batch) == list(range(len(lengths)))
+    assert all(len(batch) <= 3 for batch in batches)
+
+def test_make_batches_buckets_by_length():
+    lengths = [5, 40, 12, 40, 7, 33, 1, 20]
+    batches = make_batches(lengths, 3, 1000)
+    ordered = [lengths[i] for batch in batches for i in batch]
+    assert ordered == sorted(lengths, reverse=True)
+
+def test_make_batches_respects_padded_sample_budget():
+    lengths = [100, 90, 80, 30, 30, 30, 30]
+    batches = make_batches(lengths, 8, 200)
+    for batch in batches:
+        # The first (longest) chunk sets the padded length of its batch
+        assert len(batch) == 1 or lengths[batch[0]] * len(batch) <= 200
+    assert batches == [[0, 1], [2, 3], [4, 5, 6]]
+
+def test_make_batches_keeps_oversized_chunk_alone():
+    assert make_batches([500, 10], 4, 100) == [[0], [1]]
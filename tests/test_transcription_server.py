@@ -0,0 +1,84 @@
+import asyncio
+import time
+import pytest
+from transcription_server import MicroBatcher, Overloaded, upload_suffix
+
+class StubRecognizer:
+    """Upper-cases each chunk and records the size of every batch it is given"""
+
+    def __init__(self):
+        self.batches = []
+
+    def transcribe_batch_timed(self, chunks, batch_size=None):
+        self.batches.append(len(chunks))
+        return [(chunk.upper(), []) for chunk in chunks]
+
+def run_batcher(requests, **options):
+    """Submit every request at once to a running MicroBatcher; returns its results, batcher and run time"""
+    async def run():
+        batcher = MicroBatcher(StubRecognizer(), **options)
+        batcher.start()
+        start_time = time.perf_counter()
+        try:
+            results = await asyncio.gather(*(batcher.submit(chunks) for chunks in requests))
+        finally:
+            batcher.task.cancel()
+        return results, batcher, time.perf_counter() - start_time
+
+    return asyncio.run(run())
+
+def test_upload_suffix_only_passes_supported_extensions():
+    assert upload_suffix("wav") == ".wav"
+    assert upload_suffix(".MP3") == ".mp3"
+    for ext in ["", ".", "exe", "/../../x.wav", "wav/x", ".w av", "flac" * 3]:
+        assert upload_suffix(ext) == ".audio"
+
+def test_chunks_from_concurrent_requests_share_full_batches():
+    results, batcher, _ = run_batcher([["a", "b", "c"], ["d", "e", "f", "g", "h"]],
+                                      max_batch_size=4, max_wait=5.0, latency_slo=0, max_queue=100)
+    assert results == [[("A", []), ("B", []), ("C", [])], [(c, []) for c in "DEFGH"]]
+    assert batcher.speech_recognizer.batches == [4, 4]
+    assert batcher.stats["dispatch_full"] == 2
+
+def test_partial_batch_is_flushed_after_max_wait():
+    results, batcher, seconds = run_batcher([["a", "b", "c"]], max_batch_size=8, max_wait=0.05, latency_slo=0,
+                                            max_queue=100)
+    assert results == [[("A", []), ("B", []), ("C", [])]]
+    assert batcher.speech_recognizer.batches == [3]
+    assert batcher.stats["dispatch_wait"] == 1
+    assert seconds >= 0.05
+
+def test_partial_batch_is_flushed_early_to_meet_the_slo():
+    async def run():
+        batcher = MicroBatcher(StubRecognizer(), max_batch_size=8, max_wait=5.0, latency_slo=0.2, max_queue=100)
+        # Waiting out max_wait would leave no time for inference within the SLO
+        batcher.batch_seconds = 0.15
+        batcher.start()
+        start_time = time.perf_counter()
+        try:
+            await batcher.submit(["a"])
+        finally:
+            batcher.task.cancel()
+        return batcher, time.perf_counter() - start_time
+
+    batcher, seconds = asyncio.run(run())
+    assert batcher.stats["dispatch_slo"] == 1
+    assert seconds < 1.0
+
+def test_admission_rejects_requests_that_would_miss_the_slo():
+    batcher = MicroBatcher(StubRecognizer(), max_batch_size=4, max_wait=0.01, latency_slo=2.0, max_queue=100)
+    batcher.batch_seconds = 1.0
+    batcher.admit(8)
+    with pytest.raises(Overloaded) as overloaded:
+        batcher.admit(9)
+    assert overloaded.value.retry_after == 3.0
+
+def test_queue_limit_rejects_until_there_is_room_and_requests_that_never_fit():
+    batcher = MicroBatcher(StubRecognizer(), max_batch_size=4, max_wait=0.01, latency_slo=0, max_queue=4)
+    batcher.pending.extend([(0.0, "a", None)] * 3)
+    batcher.admit(1)
+    with pytest.raises(Overloaded):
+        batcher.admit(2)
+    # Served as 413, not 503 with a Retry-After
+    with pytest.raises(ValueError, match="too large"):
+        batcher.admit(5)
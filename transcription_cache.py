@@ -0,0 +1,90 @@
+import hashlib
+import io
+import json
+import os
+from config import config
+from disk_cache import DiskCache
+
+def file_digest(audio_path, block_size=1 << 20):
+    """Hash the file contents in blocks, independent of its name or location"""
+    digest = hashlib.blake2b(digest_size=20)
+    if not isinstance(audio_path, (str, os.PathLike)):
+        # Bytes or an in-memory upload
+        source = io.BytesIO(audio_path) if isinstance(audio_path, (bytes, bytearray)) else audio_path
+        source.seek(0)
+        for block in iter(lambda: source.read(block_size), b""):
+            digest.update(block)
+        return digest.hexdigest()
+    with open(audio_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def preprocessing_params(use_vad, plan=None):
+    """Settings that change the raw transcript for the same audio; `plan` is the ChunkPlan in use, if any"""
+    params = {
+        "sample_rate": config.SAMPLE_RATE,
+        "chunk_duration": plan.chunk_duration if plan else config.CHUNK_DURATION,
+        # VAD segments are cut at pauses and never overlap
+        "overlap_duration": plan.overlap_duration if plan and not use_vad else 0.0,
+        "max_audio_length": config.MAX_AUDIO_LENGTH,
+        "resample_quality": config.RESAMPLE_QUALITY,
+        "vad": use_vad
+    }
+    if use_vad:
+        params.update({
+            "vad_frame_duration": config.VAD_FRAME_DURATION,
+            "vad_energy_margin_db": config.VAD_ENERGY_MARGIN_DB,
+            "vad_flatness_threshold": config.VAD_FLATNESS_THRESHOLD,
+            "vad_min_silence": config.VAD_MIN_SILENCE,
+            "vad_min_speech": config.VAD_MIN_SPEECH,
+            "vad_padding": config.VAD_PADDING
+        })
+    return params
+
+def transcript_key(audio_path, model_name, use_vad=config.VAD_ENABLED, plan=None):
+    """Content hash of the file combined with every setting that affects the raw transcript"""
+    settings = json.dumps({"model": model_name, "backend": config.INFERENCE_BACKEND,
+                           **preprocessing_params(use_vad, plan)}, sort_keys=True)
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(file_digest(audio_path).encode("utf-8"))
+    digest.update(settings.encode("utf-8"))
+    return digest.hexdigest()
+
+class TranscriptionCache:
+    """Raw and corrected transcripts keyed by audio content, model and preprocessing"""
+
+    def __init__(self, cache_dir=config.TRANSCRIPTION_CACHE_DIR, max_bytes=config.CACHE_MAX_BYTES):
+        self.cache = DiskCache(cache_dir, max_bytes)
+
+    def make_key(self, audio_path, model_name, use_vad=config.VAD_ENABLED, plan=None):
+        """Content hash of the file combined with every setting that affects the output"""
+        return transcript_key(audio_path, model_name, use_vad, plan)
+
+    def _corrected_key(self, key):
+        return hashlib.blake2b(f"{key}:{config.GROQ_MODEL}".encode("utf-8"), digest_size=20).hexdigest()
+
+    def get_raw(self, key):
+        entry = self.cache.get("raw", key)
+        return entry["text"] if entry else None
+
+    def set_raw(self, key, text, words=None):
+        self.cache.set("raw", key, {"text": text, "words": words or []})
+
+    def get_transcript(self, key):
+        """(text, words) of the raw transcript from a single lookup, or None
+
+        Words are empty for entries written before they were stored.
+        """
+        entry = self.cache.get("raw", key)
+        return (entry["text"], entry.get("words", [])) if entry else None
+
+    def get_corrected(self, key):
+        entry = self.cache.get("corrected", self._corrected_key(key))
+        return entry["text"] if entry else None
+
+    def set_corrected(self, key, text):
+        self.cache.set("corrected", self._corrected_key(key), {"text": text, "model": config.GROQ_MODEL})
+
+    def report(self):
+        return self.cache.report()
@@ -0,0 +1,376 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+from collections import deque
+from urllib.parse import parse_qs, urlsplit
+from batch_runner import AUDIO_EXTENSIONS
+from config import config
+from ctc_decoder import offset_words
+from instrumentation import instrumentation
+
+def upload_suffix(ext):
+    """Temp file suffix for an upload's `ext` query value; anything but a supported audio extension becomes .audio"""
+    suffix = "." + ext.strip().lstrip(".").lower()
+    return suffix if suffix in AUDIO_EXTENSIONS else ".audio"
+
+class Overloaded(Exception):
+    """Raised by admission control; the client should retry later"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class MicroBatcher:
+    """Merge chunks from concurrent requests into shared model batches
+
+    A batch is dispatched when it is full, when its oldest chunk has waited
+    `max_wait`, or earlier if waiting longer would push that chunk past the
+    latency SLO given the current estimate of one batch's inference time.
+    Only one batch runs at a time; chunks arriving meanwhile queue up and
+    form the next batch.
+    """
+
+    def __init__(self, speech_recognizer, max_batch_size=config.SERVER_MAX_BATCH_SIZE,
+                 max_wait=config.SERVER_MAX_WAIT, latency_slo=config.SERVER_LATENCY_SLO,
+                 max_queue=config.SERVER_MAX_QUEUE_CHUNKS):
+        self.speech_recognizer = speech_recognizer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.latency_slo = latency_slo
+        self.max_queue = max_queue
+        self.pending = deque()
+        self.wakeup = asyncio.Event()
+        self.batch_seconds = 0.5  # EWMA of one batch's inference time, refined as batches run
+        self.stats = {"batches": 0, "batched_chunks": 0, "dispatch_full": 0, "dispatch_wait": 0, "dispatch_slo": 0}
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    def estimated_wait(self, extra_chunks=0):
+        """Seconds until `extra_chunks` more chunks would be through the model"""
+        batches = -(-(len(self.pending) + extra_chunks) // self.max_batch_size)
+        return batches * self.batch_seconds
+
+    def admit(self, chunk_count):
+        """Reject work that cannot fit in the queue or could not meet the SLO
+
+        A request larger than the whole queue could never be admitted, so it
+        is refused outright (ValueError) rather than told to retry.
+        """
+        if chunk_count > self.max_queue:
+            raise ValueError(f"request too large ({chunk_count} chunks, the queue holds {self.max_queue})")
+        if len(self.pending) + chunk_count > self.max_queue:
+            raise Overloaded(f"queue full ({len(self.pending)} chunks waiting)", self.estimated_wait())
+        wait = self.estimated_wait(chunk_count)
+        if self.latency_slo and wait > self.latency_slo:
+            raise Overloaded(f"estimated wait {wait:.1f}s exceeds the {self.latency_slo:.1f}s SLO", wait)
+
+    async def submit(self, chunks):
+        """Queue a request's chunks; resolves to (text, words) per chunk, in order"""
+        loop = asyncio.get_running_loop()
+        futures = []
+        for chunk in chunks:
+            future = loop.create_future()
+            self.pending.append((time.perf_counter(), chunk, future))
+            futures.append(future)
+        self.wakeup.set()
+        return await asyncio.gather(*futures)
+
+    async def _next_batch(self):
+        while not self.pending:
+            self.wakeup.clear()
+            await self.wakeup.wait()
+
+        while len(self.pending) < self.max_batch_size:
+            oldest = self.pending[0][0]
+            waited = time.perf_counter() - oldest
+            remaining = self.max_wait - waited
+            if self.latency_slo:
+                # Leave the oldest chunk enough of its budget for inference
+                slack = self.latency_slo - waited - self.batch_seconds
+                if slack <= 0:
+                    self.stats["dispatch_slo"] += 1
+                    break
+                remaining = min(remaining, slack)
+            if remaining <= 0:
+                self.stats["dispatch_wait"] += 1
+                break
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        else:
+            self.stats["dispatch_full"] += 1
+
+        count = min(len(self.pending), self.max_batch_size)
+        return [self.pending.popleft() for _ in range(count)]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            chunks = [chunk for _, chunk, _ in batch]
+            start_time = time.perf_counter()
+            try:
+                # One model call for the whole batch, off the event loop
+                results = await loop.run_in_executor(
+                    None, self.speech_recognizer.transcribe_batch_timed, chunks, len(chunks))
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - start_time
+            self.batch_seconds = 0.8 * self.batch_seconds + 0.2 * elapsed
+            self.stats["batches"] += 1
+            self.stats["batched_chunks"] += len(batch)
+            for (_, _, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+class TranscriptionServer:
+    """Async HTTP front end: POST /transcribe, GET /metrics, GET /health
+
+    Audio arrives as the request body (Content-Length or chunked transfer
+    encoding) and is spooled to a temporary file while it streams in, so a
+    large upload is never held in memory as one bytes object.
+    """
+
+    def __init__(self, speech_recognizer, audio_processor, groq_processor=None, host=config.SERVER_HOST,
+                 port=config.SERVER_PORT, max_upload_bytes=config.SERVER_MAX_UPLOAD_BYTES, **batcher_options):
+        self.speech_recognizer = speech_recognizer
+        self.audio_processor = audio_processor
+        self.groq_processor = groq_processor
+        self.host = host
+        self.port = port
+        self.max_upload_bytes = max_upload_bytes
+        self.batcher_options = batcher_options
+        self.batcher = None
+        self.in_flight = 0
+        self.counters = {"ok": 0, "error": 0, "rejected": 0, "slo_violations": 0}
+        self.latencies = deque(maxlen=1000)
+        self.server = None
+
+    async def start(self):
+        self.batcher = MicroBatcher(self.speech_recognizer, **self.batcher_options)
+        self.batcher.start()
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        print(f"Transcription server listening on http://{self.host}:{self.port}")
+        return self
+
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def _read_body(self, reader, headers, output):
+        """Copy the body into `output` as it arrives; returns the byte count"""
+        total = 0
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int((await reader.readline()).split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    await reader.readline()
+                    return total
+                total += size
+                if total > self.max_upload_bytes:
+                    raise ValueError("upload too large")
+                output.write(await reader.readexactly(size))
+                await reader.readline()
+
+        remaining = int(headers.get("content-length", 0))
+        if remaining > self.max_upload_bytes:
+            raise ValueError("upload too large")
+        while remaining > 0:
+            data = await reader.read(min(remaining, 1 << 16))
+            if not data:
+                break
+            output.write(data)
+            remaining -= len(data)
+            total += len(data)
+        return total
+
+    def _prepare(self, audio_path, use_vad):
+        """Decode and split one upload into (offset_sample, chunk) pairs (runs in a worker thread)"""
+        audio_array = self.audio_processor.load_audio(audio_path)
+        audio_array = self.audio_processor.preprocess_audio(audio_array, trim_silence=False)
+        regions = self.audio_processor.detect_speech(audio_array) if use_vad else [(0, len(audio_array))]
+        return len(audio_array) / config.SAMPLE_RATE, self.audio_processor.chunk_speech(audio_array, regions)
+
+    async def _transcribe(self, reader, headers, query):
+        loop = asyncio.get_running_loop()
+        use_vad = query.get("vad", ["1" if config.VAD_ENABLED else "0"])[0] != "0"
+        correct = query.get("correct", ["0"])[0] == "1" and self.groq_processor is not None
+
+        # Cheap check before accepting the upload
+        self.batcher.admit(1)
+
+        os.makedirs(config.TEMP_AUDIO_DIR, exist_ok=True)
+        fd, audio_path = tempfile.mkstemp(dir=config.TEMP_AUDIO_DIR, suffix=upload_suffix(query.get("ext", [""])[0]))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                size = await self._read_body(reader, headers, f)
+            if size == 0:
+                raise ValueError("empty request body")
+
+            received = time.perf_counter()
+            audio_seconds, segments = await loop.run_in_executor(None, self._prepare, audio_path, use_vad)
+            self.batcher.admit(len(segments))
+            results = await self.batcher.submit([chunk for _, chunk in segments])
+        finally:
+            os.remove(audio_path)
+
+        words = []
+        texts = []
+        for (offset, _), (text, chunk_words) in zip(segments, results):
+            words.extend(offset_words(chunk_words, offset / config.SAMPLE_RATE))
+            if text:
+                texts.append(text)
+        text = " ".join(texts)
+
+        response = {"text": text, "words": words, "audio_seconds": audio_seconds, "chunks": len(segments)}
+        if correct and text:
+            response["corrected_text"] = await loop.run_in_executor(
+                None, self.groq_processor.correct_transcription, text)
+        response["processing_seconds"] = time.perf_counter() - received
+        return response
+
+    def metrics_text(self):
+        """Queue depth, batching and latency gauges in Prometheus text format"""
+        latencies = sorted(self.latencies)
+
+        def quantile(q):
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else 0.0
+
+        stats = self.batcher.stats
+        lines = [
+            f"stt_server_queue_depth_chunks {len(self.batcher.pending)}",
+            f"stt_server_requests_in_flight {self.in_flight}",
+            f"stt_server_estimated_wait_seconds {self.batcher.estimated_wait():.4f}",
+            f"stt_server_batch_seconds_ewma {self.batcher.batch_seconds:.4f}",
+            f"stt_server_batches_total {stats['batches']}",
+            f"stt_server_batched_chunks_total {stats['batched_chunks']}",
+            f"stt_server_latency_slo_seconds {self.batcher.latency_slo or 0}",
+            f'stt_server_request_latency_seconds{{quantile="0.5"}} {quantile(0.5):.4f}',
+            f'stt_server_request_latency_seconds{{quantile="0.95"}} {quantile(0.95):.4f}',
+            f'stt_server_request_latency_seconds{{quantile="0.99"}} {quantile(0.99):.4f}'
+        ]
+        for reason in ("full", "wait", "slo"):
+            lines.append(f'stt_server_batch_dispatch_total{{reason="{reason}"}} {stats["dispatch_" + reason]}')
+        for status in ("ok", "error", "rejected"):
+            lines.append(f'stt_server_requests_total{{status="{status}"}} {self.counters[status]}')
+        lines.append(f"stt_server_slo_violations_total {self.counters['slo_violations']}")
+        text = "\n".join(lines) + "\n"
+        if instrumentation.enabled:
+            text += instrumentation.prometheus_text()
+        return text
+
+    async def _respond(self, writer, status, body, content_type="application/json", extra_headers=None):
+        reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+                   500: "Internal Server Error", 503: "Service Unavailable"}
+        data = body.encode("utf-8") if isinstance(body, str) else json.dumps(body).encode("utf-8")
+        headers = [f"HTTP/1.1 {status} {reasons.get(status, '')}", f"Content-Type: {content_type}",
+                   f"Content-Length: {len(data)}", "Connection: close"]
+        headers.extend(f"{name}: {value}" for name, value in (extra_headers or {}).items())
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + data)
+        await writer.drain()
+
+    async def _handle(self, reader, writer):
+        start_time = time.perf_counter()
+        try:
+            request_line = (await reader.readline()).decode("latin-1").strip()
+            if not request_line:
+                return
+            method, target, _ = request_line.split(" ", 2)
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1")
+                if line in ("\r\n", "\n", ""):
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            url = urlsplit(target)
+            if method == "GET" and url.path == "/health":
+                await self._respond(writer, 200, {"status": "ok"})
+            elif method == "GET" and url.path == "/metrics":
+                await self._respond(writer, 200, self.metrics_text(), "text/plain; version=0.0.4")
+            elif method == "POST" and url.path == "/transcribe":
+                await self._handle_transcribe(reader, writer, headers, parse_qs(url.query), start_time)
+            else:
+                await self._respond(writer, 404, {"error": f"no route for {method} {url.path}"})
+        except Exception as e:
+            print(f"Error handling request: {str(e)}")
+        finally:
+            writer.close()
+
+    async def _handle_transcribe(self, reader, writer, headers, query, start_time):
+        self.in_flight += 1
+        try:
+            response = await self._transcribe(reader, headers, query)
+        except Overloaded as e:
+            self.counters["rejected"] += 1
+            await self._respond(writer, 503, {"error": str(e)},
+                                extra_headers={"Retry-After": max(1, int(e.retry_after + 0.5))})
+            return
+        except ValueError as e:
+            self.counters["error"] += 1
+            status = 413 if "too large" in str(e) else 400
+            await self._respond(writer, status, {"error": str(e)})
+            return
+        except Exception as e:
+            self.counters["error"] += 1
+            print(f"Error transcribing request: {str(e)}")
+            await self._respond(writer, 500, {"error": str(e)})
+            return
+        finally:
+            self.in_flight -= 1
+
+        latency = time.perf_counter() - start_time
+        self.latencies.append(latency)
+        self.counters["ok"] += 1
+        if self.batcher.latency_slo and latency > self.batcher.latency_slo:
+            self.counters["slo_violations"] += 1
+        response["latency_seconds"] = latency
+        await self._respond(writer, 200, response)
+
+def main():
+    import argparse
+    from audio_processor import AudioProcessor
+    from model_registry import registry
+
+    parser = argparse.ArgumentParser(description="HTTP transcription service with cross-request batching")
+    parser.add_argument("--host", type=str, default=config.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVER_PORT)
+    parser.add_argument("--model", type=str, default="", help="Speech model to serve")
+    parser.add_argument("--max-batch-size", type=int, default=config.SERVER_MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait", type=float, default=config.SERVER_MAX_WAIT,
+                        help="Seconds a chunk may wait for others to fill its batch")
+    parser.add_argument("--slo", type=float, default=config.SERVER_LATENCY_SLO,
+                        help="Target request latency in seconds; 0 disables SLO-based dispatch and admission")
+    parser.add_argument("--max-queue", type=int, default=config.SERVER_MAX_QUEUE_CHUNKS,
+                        help="Chunks allowed to wait before new requests are rejected")
+    parser.add_argument("--groq", action="store_true", help="Allow ?correct=1 to post-process with Groq")
+    args = parser.parse_args()
+
+    speech_recognizer = registry.get(args.model or None)
+    groq_processor = None
+    if args.groq:
+        from groq_integration import GroqPostProcessor
+        groq_processor = GroqPostProcessor()
+
+    server = TranscriptionServer(speech_recognizer, AudioProcessor(), groq_processor, host=args.host, port=args.port,
+                                 max_batch_size=args.max_batch_size, max_wait=args.max_wait,
+                                 latency_slo=args.slo, max_queue=args.max_queue)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        print("Server stopped")
+
+if __name__ == "__main__":
+    main()